@@ -0,0 +1,39 @@
+"""
+导出论文所属用户
+生成 {MinIO对象名: 上传者ID} 的 JSON 文件（向量索引中的 paper_id 即 MinIO 对象名），
+供向量搜索服务把旧集合（没有 user_id 分区键）迁移为按用户分区的集合:
+    python migrate_collection.py --owners paper_owners.json
+"""
+import os
+import sys
+import json
+import argparse
+from dotenv import load_dotenv
+
+# 添加app目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+load_dotenv()
+
+from app.database import SessionLocal
+from app.models.paper import Paper
+
+
+def main(output: str):
+    """主函数"""
+    db = SessionLocal()
+    try:
+        owners = {object_name: user_id for object_name, user_id in db.query(Paper.object_name, Paper.user_id)}
+    finally:
+        db.close()
+
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(owners, f, ensure_ascii=False)
+    print(f"✅ 导出 {len(owners)} 篇论文的所属用户到 {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='导出论文所属用户（用于向量集合按用户分区迁移）')
+    parser.add_argument('--output', default='paper_owners.json', help='输出的 JSON 文件')
+    args = parser.parse_args()
+    main(args.output)
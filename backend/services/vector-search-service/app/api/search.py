@@ -14,6 +14,7 @@ from app.schemas.search import (
     SearchResult,
     PaperQARequest,
     PaperQAResponse,
+    HybridSearchBatchRequest,
     IndexPaperRequest,
     IndexPaperResponse
 )
@@ -21,43 +22,63 @@ from app.services.milvus_service import get_milvus_service
 from app.services.openai_service import get_openai_service
 from app.services.hybrid_search_service import get_hybrid_search_service
 from app.services.bm25_service import get_bm25_service
+from app.services.bm25_changelog import get_bm25_changelog
+from app.services.reranker_service import get_reranker_service
 from app.utils.auth_client import get_current_user
 from app.utils.text_chunker import split_text_into_chunks
 from datetime import datetime
-from typing import Optional
+from typing import Literal, Optional
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/vector", tags=["vector-search"])
 
 
+async def get_scoped_user(current_user: dict = Depends(get_current_user)) -> dict:
+    """
+    按用户检索/删除的接口使用的当前用户
+
+    旧集合（没有 user_id 分区键）无法区分 chunk 所属用户，返回 503，直到用 migrate_collection.py --owners 迁移
+    """
+    milvus_service = get_milvus_service()
+    if milvus_service.collection is not None and not milvus_service.partitioned:
+        raise HTTPException(
+            status_code=503,
+            detail="向量集合尚未按用户分区，暂不支持检索和删除（请先运行 migrate_collection.py --owners 迁移集合）"
+        )
+    return current_user
+
+
 @router.post("/search", response_model=SemanticSearchResponse)
 async def semantic_search(
     request: SemanticSearchRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_scoped_user)
 ):
     """
-    语义搜索 - 在所有论文中搜索相关内容
+    语义搜索 - 在当前用户的论文中搜索相关内容
     """
     start_time = time.time()
     
     try:
-        # 1. 生成查询向量
+        # 1. 生成查询向量（使用当前集合的 embedding 模型）
+        milvus_service = get_milvus_service()
         openai_service = get_openai_service()
-        query_embeddings = await openai_service.generate_embeddings([request.query])
+        query_embeddings = await openai_service.embed_queries(
+            [request.query], milvus_service.embedding_model, milvus_service.embedding_dimensions
+        )
         
         # 2. 在Milvus中搜索
-        milvus_service = get_milvus_service()
-        
         # 构建过滤表达式（如果需要）
         filter_expr = None
         if request.uploaded_after:
             filter_expr = f'upload_time >= "{request.uploaded_after}"'
         
-        results = milvus_service.search_similar(
+        results = await milvus_service.search_similar_async(
             query_vectors=query_embeddings,
             top_k=request.top_k,
-            filter_expr=filter_expr
+            filter_expr=filter_expr,
+            user_id=current_user["id"],
+            selective=False  # 按上传时间过滤保留的向量较多，使用普通检索参数
         )
         
         # 3. 格式化结果
@@ -83,7 +104,7 @@ async def semantic_search(
 @router.post("/qa", response_model=PaperQAResponse)
 async def paper_qa(
     request: PaperQARequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_scoped_user)
 ):
     """
     论文问答 - 基于特定论文回答问题
@@ -91,18 +112,21 @@ async def paper_qa(
     start_time = time.time()
     
     try:
-        # 1. 生成问题向量
+        # 1. 生成问题向量（使用当前集合的 embedding 模型）
+        milvus_service = get_milvus_service()
         openai_service = get_openai_service()
-        question_embeddings = await openai_service.generate_embeddings([request.question])
+        question_embeddings = await openai_service.embed_queries(
+            [request.question], milvus_service.embedding_model, milvus_service.embedding_dimensions
+        )
         
         # 2. 在Milvus中搜索相关chunk（限定在指定论文内）
-        milvus_service = get_milvus_service()
         filter_expr = f'paper_id == "{request.paper_id}"'
         
-        results = milvus_service.search_similar(
+        results = await milvus_service.search_similar_async(
             query_vectors=question_embeddings,
             top_k=request.top_k,
-            filter_expr=filter_expr
+            filter_expr=filter_expr,
+            user_id=current_user["id"]
         )
         
         # 3. 提取相关内容作为上下文
@@ -196,10 +220,14 @@ async def index_paper(
         if not chunks:
             raise HTTPException(status_code=400, detail="无法切分文本")
         
-        # 2. 生成向量嵌入
+        # 2. 生成向量嵌入（使用当前集合的 embedding 模型）
+        milvus_service = get_milvus_service()
+        embedding_model = milvus_service.embedding_model
         openai_service = get_openai_service()
         chunk_texts = [chunk['text'] for chunk in chunks]
-        embeddings = await openai_service.generate_embeddings(chunk_texts)
+        embeddings = await openai_service.generate_embeddings(
+            chunk_texts, embedding_model, milvus_service.embedding_dimensions
+        )
         
         # 3. 准备数据
         upload_time = datetime.now().isoformat()
@@ -220,8 +248,7 @@ async def index_paper(
         sources = [chunk.get('section_type', 'other') for chunk in chunks]
         
         # 4. 插入Milvus
-        milvus_service = get_milvus_service()
-        success = milvus_service.insert_vectors(
+        success = await milvus_service.insert_vectors_async(
             paper_ids=paper_ids,
             chunk_ids=chunk_ids,
             chunk_indices=chunk_indices,
@@ -232,7 +259,9 @@ async def index_paper(
             chunk_chars=chunk_chars,
             page_ranges=page_ranges,
             upload_times=upload_times,
-            sources=sources
+            sources=sources,
+            user_ids=[current_user["id"]] * len(chunks),
+            embedding_model=embedding_model
         )
         
         if not success:
@@ -252,9 +281,8 @@ async def index_paper(
                     'hierarchy_path': page_ranges[i]  # 添加层级路径
                 })
             
-            bm25_service = get_bm25_service()
-            bm25_service.add_documents(request.paper_id, bm25_chunks)
-            bm25_service.rebuild_global_index()
+            # 经变更日志写入，所有 worker/副本按相同顺序应用（分词在线程中执行）
+            await get_bm25_changelog().publish_add(request.paper_id, bm25_chunks, current_user["id"])
             logger.info(f"✓ BM25 index synced for: {request.paper_id}")
         except Exception as e:
             logger.warning(f"BM25 index sync failed (non-critical): {e}")
@@ -277,7 +305,7 @@ async def index_paper(
 @router.delete("/delete/{paper_id}")
 async def delete_paper_vectors(
     paper_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_scoped_user)
 ):
     """
     删除论文的向量索引（同时删除 BM25 索引）
@@ -285,15 +313,14 @@ async def delete_paper_vectors(
     try:
         # 1. 删除 Milvus 向量索引
         milvus_service = get_milvus_service()
-        success = milvus_service.delete_by_paper_id([paper_id])
+        deleted = await milvus_service.delete_by_paper_id_async([paper_id], user_id=current_user["id"])
         
-        if not success:
+        if deleted is None:
             raise HTTPException(status_code=500, detail="删除向量索引失败")
         
-        # 2. 删除 BM25 索引
+        # 2. 删除 BM25 索引（Milvus 中没有该用户的 chunk 时不删除根分片中的旧数据，避免两边不一致）
         try:
-            bm25_service = get_bm25_service()
-            bm25_service.remove_documents(paper_id)
+            await get_bm25_changelog().publish_delete(paper_id, current_user["id"], legacy=deleted > 0)
             logger.info(f"✓ BM25 index removed for: {paper_id}")
         except Exception as e:
             logger.warning(f"BM25 index removal failed (non-critical): {e}")
@@ -317,11 +344,18 @@ async def get_stats(current_user: dict = Depends(get_current_user)):
     """
     try:
         milvus_service = get_milvus_service()
-        stats = milvus_service.get_collection_stats()
+        stats = await milvus_service.get_collection_stats_async()
         
         return {
             "success": True,
-            "stats": stats
+            "stats": stats,
+            "bm25": get_bm25_service().get_stats(),
+            "bm25_replication": get_bm25_changelog().get_stats(),
+            "translation_cache": get_openai_service().translation_cache.get_stats(),
+            "embedding_cache": get_openai_service().embedding_cache.get_stats(),
+            "result_cache": get_hybrid_search_service().result_cache.get_stats(),
+            "adaptive_rerank": get_hybrid_search_service().get_rerank_stats(),
+            "reranker": get_reranker_service().get_stats()
         }
         
     except Exception as e:
@@ -332,7 +366,7 @@ async def get_stats(current_user: dict = Depends(get_current_user)):
 @router.post("/qa-stream")
 async def paper_qa_stream(
     request: PaperQARequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_scoped_user)
 ):
     """
     论文问答 - 流式输出（SSE）
@@ -356,7 +390,8 @@ async def paper_qa_stream(
                 paper_id=request.paper_id,
                 use_reranker=True,
                 translate_query=True,
-                initial_k=20  # 初始检索更多，让 RRF 和 Reranker 有更多候选
+                initial_k=20,  # 初始检索更多，让 RRF 和 Reranker 有更多候选
+                user_id=current_user["id"]
             )
             
             paper_chunks = search_result.get("final_results", [])
@@ -365,6 +400,7 @@ async def paper_qa_stream(
             stats = search_result.get("stats", {})
             logger.info(f"  - Dense: {stats.get('dense_count', 0)}, Sparse: {stats.get('sparse_count', 0)}")
             logger.info(f"  - RRF Fused: {stats.get('fused_count', 0)}, Final: {stats.get('final_count', 0)}")
+            logger.info(f"  - Timings (ms): {stats.get('timings_ms', {})}")
             if search_result.get("query_translated"):
                 logger.info(f"  - Query translated: '{request.question}' -> '{search_result.get('translated_query')}'")
             
@@ -473,7 +509,9 @@ async def hybrid_search(
     paper_id: Optional[str] = None,
     use_reranker: bool = True,
     translate_query: bool = True,
-    current_user: dict = Depends(get_current_user)
+    rerank_mode: Optional[Literal["full", "adaptive"]] = None,
+    rerank_budget_ms: Optional[float] = None,
+    current_user: dict = Depends(get_scoped_user)
 ):
     """
     混合检索 API（支持跨语言检索）
@@ -492,6 +530,8 @@ async def hybrid_search(
         paper_id: 限定论文ID（可选）
         use_reranker: 是否使用 Reranker
         translate_query: 是否启用查询翻译（跨语言检索）
+        rerank_mode: 重排序模式 full / adaptive（默认 HYBRID_RERANK_MODE）
+        rerank_budget_ms: adaptive 模式下的重排序延迟预算（毫秒，默认 HYBRID_RERANK_BUDGET_MS）
     """
     start_time = time.time()
     
@@ -504,7 +544,10 @@ async def hybrid_search(
             paper_id=paper_id,
             use_reranker=use_reranker,
             translate_query=translate_query,
-            initial_k=20
+            initial_k=20,
+            user_id=current_user["id"],
+            rerank_mode=rerank_mode,
+            rerank_budget_ms=rerank_budget_ms
         )
         
         search_time = (time.time() - start_time) * 1000
@@ -522,7 +565,11 @@ async def hybrid_search(
                 "fused_count": result["stats"]["fused_count"],
                 "final_count": result["stats"]["final_count"],
                 "use_reranker": use_reranker,
-                "translate_query": translate_query
+                "translate_query": translate_query,
+                "cache_hit": result["stats"].get("cache_hit", False),
+                "rerank_decision": result["stats"].get("rerank_decision"),
+                "rerank_depth": result["stats"].get("rerank_depth", 0),
+                "timings_ms": result["stats"].get("timings_ms", {})
             }
         }
         
@@ -531,12 +578,67 @@ async def hybrid_search(
         raise HTTPException(status_code=500, detail=f"混合检索失败: {str(e)}")
 
 
+@router.post("/hybrid-search/batch")
+async def hybrid_search_batch(
+    request: HybridSearchBatchRequest,
+    current_user: dict = Depends(get_scoped_user)
+):
+    """
+    批量混合检索 API
+    
+    N 个查询共享一次 Embedding 请求、一次多向量 Milvus 检索、一次 BM25 矩阵评分和同一组 Reranker 推理批次，
+    适用于 Agent 多问题检索、评测脚本等场景。每个查询的结果与 /hybrid-search 相同
+    """
+    start_time = time.time()
+    
+    try:
+        hybrid_service = get_hybrid_search_service()
+        
+        batch = await hybrid_service.search_batch(
+            queries=request.queries,
+            top_k=request.top_k,
+            paper_id=request.paper_id,
+            use_reranker=request.use_reranker,
+            translate_query=request.translate_query,
+            initial_k=20,
+            user_id=current_user["id"],
+            rerank_mode=request.rerank_mode
+        )
+        
+        search_time = (time.time() - start_time) * 1000
+        
+        return {
+            "results": [
+                {
+                    "query": result["query"],
+                    "translated_query": result["translated_query"],
+                    "query_translated": result["query_translated"],
+                    "results": result["final_results"],
+                    "total": result["stats"]["final_count"],
+                    "stats": result["stats"]
+                }
+                for result in batch["results"]
+            ],
+            "total_queries": len(request.queries),
+            "search_time_ms": round(search_time, 2),
+            "stats": {
+                "use_reranker": request.use_reranker,
+                "translate_query": request.translate_query,
+                **batch["stats"]
+            }
+        }
+        
+    except Exception as e:
+        logger.error(f"Hybrid batch search failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"批量混合检索失败: {str(e)}")
+
+
 @router.post("/hybrid-qa")
 async def hybrid_qa(
     request: PaperQARequest,
     use_reranker: bool = True,
     translate_query: bool = True,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_scoped_user)
 ):
     """
     混合检索问答 API（非流式，支持跨语言检索）
@@ -555,7 +657,8 @@ async def hybrid_qa(
             top_k=request.top_k,
             paper_id=request.paper_id,
             use_reranker=use_reranker,
-            translate_query=translate_query
+            translate_query=translate_query,
+            user_id=current_user["id"]
         )
         
         final_results = search_result["final_results"]
@@ -630,15 +733,14 @@ async def recreate_collection(
         # 重新连接
         milvus_service.connect()
         
-        # 强制重建
-        success = milvus_service.create_collection(dim=1536, force_recreate=True)
+        # 强制重建（维度和 embedding 模型使用当前配置）
+        success = milvus_service.create_collection(force_recreate=True)
         
         if success:
             milvus_service.create_index()
             
             # 清空 BM25 索引
-            bm25_service = get_bm25_service()
-            bm25_service.clear_all()
+            await get_bm25_changelog().publish_clear()
             
             return {
                 "success": True,
@@ -659,6 +761,7 @@ async def health_check():
         "status": "healthy",
         "service": "vector-search-service",
         "milvus_connected": True,
+        "reranker": get_reranker_service().state,
         "features": ["dense_search", "sparse_search", "hybrid_search", "reranker", "query_translation", "structured_indexing"]
     }
 
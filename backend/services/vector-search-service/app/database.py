@@ -1,5 +1,5 @@
 """
-Milvus连接配置
+Milvus / Redis 连接配置
 """
 import os
 from dotenv import load_dotenv
@@ -11,3 +11,18 @@ MILVUS_HOST = os.getenv("MILVUS_HOST", "localhost")
 MILVUS_PORT = os.getenv("MILVUS_PORT", "19530")
 MILVUS_COLLECTION = os.getenv("MILVUS_COLLECTION", "research_papers")
 
+# 按 user_id 分区键划分的分区数（仅在创建集合时生效）
+MILVUS_NUM_PARTITIONS = int(os.getenv("MILVUS_NUM_PARTITIONS", "64"))
+
+# 新建集合的向量维度（需与 OPENAI_EMBEDDING_MODEL 一致；已有集合以其 schema 为准）
+MILVUS_EMBEDDING_DIM = int(os.getenv("MILVUS_EMBEDDING_DIM", "1536"))
+
+# 多副本检查集合别名（MILVUS_COLLECTION）是否已切换到新集合的间隔（秒）
+MILVUS_ALIAS_CHECK_SECONDS = float(os.getenv("MILVUS_ALIAS_CHECK_SECONDS", "30"))
+
+# Milvus 连接池大小（gRPC 连接数，各工作线程轮流绑定）与异步接口使用的工作线程数
+MILVUS_POOL_SIZE = int(os.getenv("MILVUS_POOL_SIZE", "4"))
+MILVUS_MAX_WORKERS = int(os.getenv("MILVUS_MAX_WORKERS", "8"))
+
+# Redis配置（BM25 变更日志、翻译缓存等共享；留空则不使用 Redis）
+REDIS_URL = os.getenv("REDIS_URL", "")
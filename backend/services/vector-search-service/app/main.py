@@ -3,12 +3,18 @@
 """
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+import asyncio
 import logging
 import os
 
 from app.api import search
 from app.services.milvus_service import get_milvus_service
 from app.services.openai_service import get_openai_service
+from app.services.bm25_service import get_bm25_service
+from app.services.bm25_changelog import get_bm25_changelog, START_OFFSET, BM25_SNAPSHOT_POLL_SECONDS
+from app.services.reranker_service import get_reranker_service, RERANKER_EAGER_LOAD
+from app.utils import tokenizer
 
 # 配置日志
 logging.basicConfig(
@@ -36,6 +42,27 @@ app.add_middleware(
 # 注册路由
 app.include_router(search.router)
 
+# 后台任务引用（防止被垃圾回收）
+_background_tasks = set()
+
+
+async def _wait_for_bm25_snapshot(bm25_service, bm25_changelog) -> str:
+    """只读进程：等待持有写锁的进程重建完成并写出快照，加载后返回开始跟随变更日志的位置"""
+    partitioned = get_milvus_service().partitioned
+    while True:
+        # 分区集合的快照中根分片仍有旧数据时，写进程的重建还没有开始
+        if await asyncio.to_thread(bm25_service.load_snapshot) and not (partitioned and bm25_service.index.num_docs):
+            offset = bm25_service.index.offset or START_OFFSET
+            try:
+                if not await bm25_changelog.has_gap(offset):
+                    break
+            except Exception as e:
+                logger.warning(f"BM25变更日志暂不可用，从快照位置开始跟随: {e}")
+                break
+        await asyncio.sleep(BM25_SNAPSHOT_POLL_SECONDS)
+    logger.info("✅ BM25索引快照加载成功（由持有写锁的进程重建）")
+    return offset
+
 
 @app.on_event("startup")
 async def startup_event():
@@ -54,10 +81,71 @@ async def startup_event():
     # 初始化Milvus服务
     try:
         milvus_service = get_milvus_service()
+        # 启动时加载集合（之后的查询不再调用 load）
+        if milvus_service.collection is not None:
+            await asyncio.to_thread(milvus_service.ensure_loaded)
         logger.info("✅ Milvus服务初始化成功")
     except Exception as e:
         logger.error(f"❌ Milvus服务初始化失败: {e}")
     
+    # 预加载jieba词典（避免首次查询的加载延迟）
+    try:
+        await asyncio.to_thread(tokenizer.warm_up)
+        logger.info("✅ jieba词典预加载完成")
+    except Exception as e:
+        logger.error(f"❌ jieba词典预加载失败: {e}")
+    
+    # 加载BM25索引快照，从快照记录的位置开始跟随变更日志
+    # 没有快照或快照之后的变更已被裁剪时，在后台从Milvus重建（不阻塞启动）：
+    # 多进程共享索引目录时只由持有写锁的进程重建，其他进程等待它写出快照后加载，再从快照记录的位置开始跟随
+    need_rebuild = False
+    try:
+        bm25_service = get_bm25_service()
+        bm25_changelog = get_bm25_changelog()
+        migrate_legacy = False
+        offset = None
+        if not bm25_service.load_snapshot():
+            logger.info("BM25索引快照不存在，后台从Milvus重建...")
+            need_rebuild = True
+        elif bm25_changelog.enabled:
+            offset = bm25_service.index.offset or START_OFFSET
+            try:
+                need_rebuild = await bm25_changelog.has_gap(offset)
+            except Exception as e:
+                # 暂时无法确认是否已裁剪：保留快照，跟随任务从快照位置在后台重试
+                logger.warning(f"BM25变更日志暂不可用，保留快照: {e}")
+            if need_rebuild:
+                logger.warning(f"无法从快照位置 {offset} 回放BM25变更日志，后台从Milvus重建...")
+                offset = None
+
+        if not need_rebuild:
+            logger.info("✅ BM25索引快照加载成功")
+            if bm25_service.index.num_docs and get_milvus_service().partitioned:
+                # 集合已迁移为分区集合：根分片中的旧数据移到所属用户的分片（保留快照，只补充用户分片）
+                logger.info("BM25根分片中有旧数据，后台从Milvus按用户重建...")
+                need_rebuild = migrate_legacy = True
+
+        if need_rebuild and bm25_changelog.enabled and not bm25_service.is_writer:
+            # 由持有写锁的进程重建，本进程等待新快照
+            logger.info("等待持有写锁的进程重建BM25索引快照...")
+            need_rebuild = False
+            await bm25_changelog.start(wait_for=lambda: _wait_for_bm25_snapshot(bm25_service, bm25_changelog))
+        else:
+            if need_rebuild and not migrate_legacy:
+                bm25_service.begin_rebuild()
+                bm25_service.clear_all()
+            # 重建时从当前流末尾开始跟随，重建期间的变更以变更日志为准；Redis 不可用时跟随任务在后台重试
+            await bm25_changelog.start(offset)
+    except Exception as e:
+        logger.error(f"❌ BM25索引加载失败: {e}")
+
+    if need_rebuild:
+        task = asyncio.create_task(asyncio.to_thread(
+            bm25_service.rebuild_from_milvus, get_milvus_service(), lambda: bm25_changelog.applied_offset
+        ))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+    
     # 初始化OpenAI服务
     try:
         openai_service = get_openai_service()
@@ -65,6 +153,11 @@ async def startup_event():
     except Exception as e:
         logger.error(f"❌ OpenAI服务初始化失败: {e}")
     
+    # 后台加载并预热Reranker模型（首次加载完成前 /health 返回 503，网关不转发流量）
+    if RERANKER_EAGER_LOAD:
+        get_reranker_service().start()
+        logger.info("Reranker模型后台加载中...")
+    
     logger.info("=" * 60)
     logger.info("✓ 向量搜索服务已启动")
     logger.info(f"✓ 端口: 8004")
@@ -82,6 +175,34 @@ async def shutdown_event():
     except Exception as e:
         logger.warning(f"Consul deregistration failed: {e}")
     
+    # 停止BM25变更日志跟随
+    try:
+        await get_bm25_changelog().stop()
+    except Exception as e:
+        logger.warning(f"BM25 changelog stop failed: {e}")
+    
+    # 关闭翻译/查询向量缓存的 Redis 连接
+    try:
+        await get_openai_service().translation_cache.close()
+        await get_openai_service().embedding_cache.close()
+    except Exception as e:
+        logger.warning(f"Cache close failed: {e}")
+    
+    # 停止Reranker微批次调度和推理线程
+    try:
+        await get_reranker_service().shutdown()
+    except Exception as e:
+        logger.warning(f"Reranker shutdown failed: {e}")
+    
+    # 写入Milvus写缓冲中剩余的数据并flush，关闭工作线程池
+    try:
+        await get_milvus_service().shutdown()
+    except Exception as e:
+        logger.warning(f"Milvus shutdown failed: {e}")
+    
+    # 关闭分词进程池
+    tokenizer.shutdown()
+    
     logger.info("向量搜索服务已关闭")
 
 
@@ -105,10 +226,17 @@ async def root():
 
 @app.get("/health")
 async def health():
-    """健康检查"""
+    """健康检查（Reranker 模型首次加载完成前返回 503）"""
+    reranker = get_reranker_service()
+    if not reranker.ready:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "starting", "service": "vector-search-service", "reranker": reranker.state}
+        )
     return {
         "status": "healthy",
-        "service": "vector-search-service"
+        "service": "vector-search-service",
+        "reranker": reranker.state
     }
 
 
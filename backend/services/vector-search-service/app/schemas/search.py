@@ -1,7 +1,7 @@
 """
 搜索相关的Pydantic模型
 """
-from typing import List, Dict, Optional
+from typing import List, Dict, Literal, Optional
 from pydantic import BaseModel, Field
 
 
@@ -58,6 +58,16 @@ class PaperQAResponse(BaseModel):
     response_time_ms: float = Field(..., description="响应耗时（毫秒）")
 
 
+class HybridSearchBatchRequest(BaseModel):
+    """批量混合检索请求"""
+    queries: List[str] = Field(..., description="查询列表", min_length=1, max_length=32)
+    top_k: int = Field(10, description="每个查询的返回数量", ge=1, le=50)
+    paper_id: Optional[str] = Field(None, description="限定论文ID（所有查询共用）")
+    use_reranker: bool = Field(True, description="是否使用 Reranker")
+    translate_query: bool = Field(True, description="是否启用查询翻译（跨语言检索）")
+    rerank_mode: Optional[Literal["full", "adaptive"]] = Field(None, description="重排序模式（默认 HYBRID_RERANK_MODE）")
+
+
 class StructuredChunk(BaseModel):
     """结构化内容块"""
     content: str = Field(..., description="内容")
@@ -0,0 +1,332 @@
+"""
+BM25 索引变更日志（Redis Streams）
+
+多个 uvicorn worker 或多个副本各自持有进程内的 BM25 索引。索引变更不直接写本地索引，
+而是发布到一个有序的 Redis Stream，每个进程（包括发布者自己）都从流中按序读取并应用，
+因此所有进程的索引以相同顺序经历相同的变更。
+
+- add 变更携带分词后的词频（zlib 压缩的 JSON），应用时无需分词或读取 Milvus
+- 发布者等待本进程应用到自己的变更后再返回（读己之写），超时只记录告警
+- 无法解码或应用失败的变更记录错误后跳过（计入 dead_letters），位置照常前进，不阻塞后续变更
+- 已应用的位置（stream entry id）随 BM25 manifest 持久化；重启后从快照位置继续回放，
+  位置已被流裁剪时由持有写锁的进程清空索引并从 Milvus 重建，其他进程等待新快照后从它记录的位置开始跟随
+  （等待期间发布的变更照常写入流，由新快照或之后的回放包含）
+- 未配置 REDIS_URL 或 Redis 不可用时退化为只更新本进程索引；启动时 Redis 不可用则跟随任务在后台重试，
+  跟随任务开始读取流之前发布的变更同样只更新本进程索引
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import zlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import redis.asyncio as redis
+
+from app.database import REDIS_URL
+from app.services.bm25_service import BM25Service, get_bm25_service
+
+logger = logging.getLogger(__name__)
+
+BM25_CHANGELOG_STREAM = os.getenv("BM25_CHANGELOG_STREAM", "bm25:changelog")
+# 流的最大长度（近似裁剪）；重启时快照位置早于保留范围则需要从 Milvus 重建
+BM25_CHANGELOG_MAXLEN = int(os.getenv("BM25_CHANGELOG_MAXLEN", "10000"))
+BM25_CHANGELOG_BATCH = int(os.getenv("BM25_CHANGELOG_BATCH", "100"))
+BM25_CHANGELOG_BLOCK_MS = int(os.getenv("BM25_CHANGELOG_BLOCK_MS", "1000"))
+# 发布者等待本进程应用变更的超时时间
+BM25_CHANGELOG_WAIT_SECONDS = float(os.getenv("BM25_CHANGELOG_WAIT_SECONDS", "5"))
+# 只读进程等待持有写锁的进程重建快照时的检查间隔
+BM25_SNAPSHOT_POLL_SECONDS = float(os.getenv("BM25_SNAPSHOT_POLL_SECONDS", "5"))
+
+START_OFFSET = "0-0"
+
+
+def _parse_offset(offset: Optional[str]) -> Tuple[int, int]:
+    """stream entry id "毫秒-序号" -> 可比较的元组"""
+    if not offset:
+        return 0, 0
+    ms, _, seq = offset.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def _to_str(value) -> Optional[str]:
+    if value is None:
+        return None
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+def _encode(change: Dict[str, Any]) -> bytes:
+    return zlib.compress(json.dumps(change, ensure_ascii=False).encode("utf-8"))
+
+
+def _decode(data: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+class BM25ChangeLog:
+    """BM25 变更日志：发布变更，并在后台跟随流把变更应用到本进程索引"""
+
+    def __init__(
+        self,
+        bm25_service: Optional[BM25Service] = None,
+        redis_url: str = REDIS_URL,
+        stream: str = BM25_CHANGELOG_STREAM
+    ):
+        self.bm25_service = bm25_service or get_bm25_service()
+        self.redis_url = redis_url
+        self.stream = stream
+        self.enabled = bool(redis_url)
+        self._client: Optional[redis.Redis] = None
+        self._task: Optional[asyncio.Task] = None
+        self._applied = asyncio.Condition()
+        self.following = False  # 是否已从起始位置开始读取（等待快照期间为 False）
+
+        self.applied_offset: Optional[str] = None  # 本进程已应用到的位置
+        self.head_offset: Optional[str] = None  # 最近一次观察到的流末尾位置
+        self.applied_entries = 0
+        self.dead_letters = 0  # 跳过的变更数（无法解码或应用失败）
+        self.last_applied_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    async def _get_client(self) -> redis.Redis:
+        """获取 Redis 客户端（二进制模式，变更内容为压缩数据）"""
+        if self._client is None:
+            self._client = redis.from_url(self.redis_url)
+        return self._client
+
+    # ==================== 发布 ====================
+
+    async def publish_add(self, paper_id: str, chunks: List[Dict[str, Any]], user_id=None):
+        """发布论文索引变更（在线程中分词，不阻塞事件循环）"""
+        change = await asyncio.to_thread(self.bm25_service.analyze, paper_id, chunks, user_id)
+        await self._publish(change)
+        logger.info(f"✓ BM25 change published: add {paper_id} ({len(change['docs'])} chunks)")
+
+    async def publish_delete(self, paper_id: str, user_id=None, legacy: bool = True):
+        """发布论文删除变更（legacy 为 False 时只删除该用户分片中的论文，不删除根分片中的旧数据）"""
+        await self._publish({"op": "delete", "paper_id": paper_id, "user_id": user_id, "legacy": legacy})
+        logger.info(f"✓ BM25 change published: delete {paper_id}")
+
+    async def publish_clear(self):
+        await self._publish({"op": "clear"})
+        logger.info("✓ BM25 change published: clear")
+
+    async def _publish(self, change: Dict[str, Any]):
+        if not self.enabled or self._task is None or self._task.done():
+            # 跟随任务没有运行时发布的变更不会被本进程应用，只更新本进程索引
+            if self.enabled:
+                logger.warning("BM25 changelog follower is not running, applying change locally only")
+            await asyncio.to_thread(self.bm25_service.apply_changes, [change])
+            return
+
+        try:
+            # 跟随任务尚未确定起始位置（启动时 Redis 不可用）：先定位到当前末尾，保证随后发布的变更会被读取
+            await self._position()
+            client = await self._get_client()
+            entry_id = _to_str(await client.xadd(
+                self.stream,
+                {"change": _encode(change)},
+                maxlen=BM25_CHANGELOG_MAXLEN,
+                approximate=True
+            ))
+        except Exception as e:
+            # Redis 不可用：只更新本进程（其他进程会不一致，直到重建）
+            logger.warning(f"Failed to publish BM25 change, applying locally only: {e}")
+            await asyncio.to_thread(self.bm25_service.apply_changes, [change])
+            return
+
+        # 等待快照期间本进程还没有索引，不等待应用
+        if self.following:
+            await self._wait_applied(entry_id)
+
+    async def _wait_applied(self, entry_id: str):
+        """等待本进程应用到 entry_id（保证发布者随后的搜索能看到这次变更）"""
+        target = _parse_offset(entry_id)
+        try:
+            async with self._applied:
+                await asyncio.wait_for(
+                    self._applied.wait_for(lambda: _parse_offset(self.applied_offset) >= target),
+                    timeout=BM25_CHANGELOG_WAIT_SECONDS
+                )
+        except asyncio.TimeoutError:
+            logger.warning(f"BM25 change {entry_id} not applied locally within {BM25_CHANGELOG_WAIT_SECONDS}s")
+
+    # ==================== 跟随 ====================
+
+    async def get_head(self) -> str:
+        """流中最后生成的 entry id（流不存在时为 0-0）"""
+        client = await self._get_client()
+        try:
+            info = await client.xinfo_stream(self.stream)
+        except redis.ResponseError:
+            return START_OFFSET
+        return _to_str(info.get("last-generated-id")) or START_OFFSET
+
+    async def has_gap(self, offset: Optional[str]) -> bool:
+        """offset 之后的变更是否已被裁剪（无法完整回放）"""
+        client = await self._get_client()
+        try:
+            info = await client.xinfo_stream(self.stream)
+        except redis.ResponseError:
+            # 流不存在：offset 之后没有变更，除非流被整个删除过
+            return _parse_offset(offset) > (0, 0)
+
+        # Redis 7+ 记录被裁剪的最大 id；更早的版本用首条 entry 近似判断
+        max_deleted = _to_str(info.get("max-deleted-entry-id"))
+        if max_deleted is not None:
+            return _parse_offset(max_deleted) > _parse_offset(offset)
+        first = info.get("first-entry")
+        return bool(first) and _parse_offset(_to_str(first[0])) > _parse_offset(offset) and \
+            int(info.get("length", 0)) >= BM25_CHANGELOG_MAXLEN
+
+    async def start(
+        self,
+        offset: Optional[str] = None,
+        wait_for: Optional[Callable[[], Awaitable[str]]] = None
+    ):
+        """
+        从 offset 之后开始跟随（None 表示从当前流末尾开始）
+
+        不访问 Redis：从流末尾开始时由跟随任务确定起始位置，Redis 不可用时在后台重试。
+        wait_for 不为空时跟随任务先等待它返回起始位置（只读进程等待写进程的快照）
+        """
+        if not self.enabled or self._task is not None:
+            return
+        self.applied_offset = offset
+        self.head_offset = offset
+        self._task = asyncio.create_task(self._run(wait_for))
+        if wait_for is None:
+            logger.info(f"✓ BM25 changelog follower started: stream={self.stream}, offset={offset or 'head'}")
+
+    async def _run(self, wait_for: Optional[Callable[[], Awaitable[str]]]):
+        if wait_for is not None:
+            offset = await wait_for()
+            async with self._applied:
+                self.applied_offset = offset
+                self.head_offset = offset
+            logger.info(f"✓ BM25 changelog follower started: stream={self.stream}, offset={offset}")
+        self.following = True
+        await self._follow()
+
+    async def _position(self):
+        """尚未确定起始位置时定位到当前流末尾（跟随任务和发布者都可能调用，先确定的为准）"""
+        if self.applied_offset is not None:
+            return
+        head = await self.get_head()
+        async with self._applied:
+            if self.applied_offset is not None:
+                return
+            self.applied_offset = head
+            self.head_offset = head
+            self._applied.notify_all()
+        logger.info(f"✓ BM25 changelog follower positioned at {head}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.following = False
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _follow(self):
+        while True:
+            try:
+                await self._position()
+                client = await self._get_client()
+                response = await client.xread(
+                    {self.stream: self.applied_offset},
+                    count=BM25_CHANGELOG_BATCH,
+                    block=BM25_CHANGELOG_BLOCK_MS
+                )
+                if not response:
+                    # 阻塞等待期间没有新变更，说明已追上
+                    self.head_offset = self.applied_offset
+                    continue
+
+                entries = response[0][1]
+                changes = []
+                for entry_id, fields in entries:
+                    try:
+                        changes.append((_to_str(entry_id), _decode(fields[b"change"])))
+                    except Exception as e:
+                        self.dead_letters += 1
+                        logger.error(f"Skipping malformed BM25 change {_to_str(entry_id)}: {e}")
+                last_id = _to_str(entries[-1][0])
+
+                try:
+                    await asyncio.to_thread(self.bm25_service.apply_changes, [c for _, c in changes], last_id)
+                except Exception as e:
+                    # 整批应用失败时逐条重试，跳过失败的变更，保证位置前进
+                    logger.error(f"Failed to apply BM25 changes up to {last_id}, retrying one by one: {e}")
+                    await asyncio.to_thread(self._apply_each, changes, last_id)
+
+                async with self._applied:
+                    self.applied_offset = last_id
+                    self.applied_entries += len(entries)
+                    self.last_applied_at = time.time()
+                    self._applied.notify_all()
+
+                # 读满一批时流中可能还有更多变更，更新末尾位置用于计算延迟
+                if len(entries) >= BM25_CHANGELOG_BATCH:
+                    self.head_offset = await self.get_head()
+                elif _parse_offset(last_id) > _parse_offset(self.head_offset):
+                    self.head_offset = last_id
+                self.last_error = None
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"BM25 changelog follower error: {e}")
+                await asyncio.sleep(1)
+
+    def _apply_each(self, changes: List[Tuple[str, Dict[str, Any]]], last_id: str):
+        """逐条应用变更（阻塞调用），失败的变更记录错误后跳过，最后记录位置"""
+        for entry_id, change in changes:
+            try:
+                self.bm25_service.apply_changes([change])
+            except Exception as e:
+                self.dead_letters += 1
+                logger.error(f"Skipping BM25 change {entry_id} ({change.get('op')} {change.get('paper_id')}): {e}")
+        try:
+            self.bm25_service.index.checkpoint(last_id)
+        except Exception as e:
+            # 位置未落盘：重启后从更早的位置重放（变更是幂等的）
+            logger.error(f"Failed to checkpoint BM25 changelog offset {last_id}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """复制状态：本进程已应用的位置、观察到的流末尾位置以及两者的时间差"""
+        applied, head = _parse_offset(self.applied_offset), _parse_offset(self.head_offset)
+        return {
+            "enabled": self.enabled,
+            "stream": self.stream,
+            "role": "writer" if self.bm25_service.is_writer else "follower",
+            "following": self.following,
+            "applied_offset": self.applied_offset,
+            "head_offset": self.head_offset,
+            "lag_ms": max(head[0] - applied[0], 0) if self.enabled else 0,
+            "caught_up": applied >= head,
+            "applied_entries": self.applied_entries,
+            "dead_letters": self.dead_letters,
+            "last_applied_at": self.last_applied_at,
+            "last_error": self.last_error,
+        }
+
+
+# 全局单例
+_bm25_changelog: Optional[BM25ChangeLog] = None
+
+
+def get_bm25_changelog() -> BM25ChangeLog:
+    """获取 BM25 变更日志单例"""
+    global _bm25_changelog
+    if _bm25_changelog is None:
+        _bm25_changelog = BM25ChangeLog()
+    return _bm25_changelog
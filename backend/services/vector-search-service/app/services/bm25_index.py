@@ -0,0 +1,1171 @@
+"""
+BM25 倒排索引引擎（段式存储，可持久化）
+
+索引结构：
+- 每次写入生成一个不可变的段（Segment），段内保存 CSR 形式的倒排表
+  (terms 有序词表 -> indptr -> doc_ids / tfs)
+- 删除只在段内打墓碑（tombstone），不重建索引
+- 段内墓碑比例过高或段数过多时触发压缩/合并（compaction）
+- 语料统计（文档数、总长度）增量维护，df 在查询时按存活文档计算
+- 全局查询与 paper_id 限定查询共用同一套结构（论文的 chunk 在段内连续存放）
+- 元数据按列存储：chunk_id 等 chunk 级字段每个 chunk 一份，title/file_name 每篇论文一份；
+  正文不进入索引（Milvus 中已有），由上层只为最终命中补全
+
+评分：
+- 段内预计算 BM25 词权重矩阵 W（CSR，行=词，列=文档），查询即稀疏矩阵-向量乘 q·W
+- W 按构建时的 avgdl 归一化，语料 avgdl 漂移超过 BM25_AVGDL_TOLERANCE 时按需重算；
+  重算生成新的权重对象整体替换，并发查询始终使用同一版本的权重和块上界
+- idf = ln(1 + (N - df + 0.5) / (df + 0.5))（Lucene 的 BM25 idf），与 rank_bm25.BM25Okapi 的
+  ln((N - df + 0.5) / (df + 0.5)) 不同：后者对出现在一半以上文档中的词给出负值，再用平均 idf 的 epsilon 倍兜底，
+  需要整个词表的 idf；前者恒为正、只依赖查询词自身的 df，Block-Max 的分数上界才成立。
+  因此分数与原 rank_bm25 实现不同，常见词的相对权重略高；混合检索的 RRF 只使用排名
+- Top-K 使用 argpartition，不对全量分数排序
+- 批量查询（search_batch）把多个查询组成查询矩阵 Q（行=查询），每个段只做一次稀疏矩阵乘 Q·W
+- 全局查询使用 Block-Max 剪枝：文档按编号分块，预计算每个词在每块内的最大权重；
+  先评分上界最高的块得到第 K 名分数，其余块只在上界超过该分数时才评分（结果与穷举一致）
+
+持久化：
+- 每个段是一个目录，所有数组以 .npy 保存，启动时以 mmap 方式打开（毫秒级冷启动）
+- manifest.json 记录当前段列表、各段已删除的论文和已应用到的变更日志位置（offset），
+  写入后通过 os.replace 原子切换
+- 不再被 manifest 引用的段目录在切换后清理
+"""
+import json
+import logging
+import math
+import os
+import shutil
+import threading
+from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple, Iterable
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+logger = logging.getLogger(__name__)
+
+# BM25 参数（与 rank_bm25.BM25Okapi 默认值一致）
+BM25_K1 = float(os.getenv("BM25_K1", "1.5"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+# 压缩策略
+BM25_MAX_SEGMENTS = int(os.getenv("BM25_MAX_SEGMENTS", "16"))  # 段数超过该值时合并小段
+BM25_MERGE_FACTOR = int(os.getenv("BM25_MERGE_FACTOR", "8"))  # 每次合并的段数
+BM25_MAX_DELETED_RATIO = float(os.getenv("BM25_MAX_DELETED_RATIO", "0.3"))  # 段内墓碑比例阈值
+
+# 语料 avgdl 相对段权重矩阵所用 avgdl 的漂移超过该比例时重算权重
+BM25_AVGDL_TOLERANCE = float(os.getenv("BM25_AVGDL_TOLERANCE", "0.05"))
+
+# Block-Max 剪枝（仅用于全局查询；语料较小时穷举评分更快）
+BM25_BLOCK_MAX_PRUNING = os.getenv("BM25_BLOCK_MAX_PRUNING", "true").lower() == "true"
+BM25_BLOCK_SIZE = int(os.getenv("BM25_BLOCK_SIZE", "128"))  # 每块文档数（段记录构建块上界时的值，配置变化后按需重建）
+# 索引（分片）达到该 chunk 数后全局查询启用剪枝：benchmark_bm25.py 的合成语料上，约 10 万 chunk 起剪枝的 p50 不高于穷举，
+# 更小的分片穷举一次矩阵乘更快（剪枝需要额外计算块上界并分两轮评分）
+BM25_PRUNING_MIN_DOCS = int(os.getenv("BM25_PRUNING_MIN_DOCS", "100000"))
+BM25_PRUNING_FIRST_BATCH = int(os.getenv("BM25_PRUNING_FIRST_BATCH", "64"))  # 第一轮评分的块数（用于确定阈值）
+BM25_PRUNING_DENSE_RATIO = float(os.getenv("BM25_PRUNING_DENSE_RATIO", "0.25"))  # 段内待评分块超过该比例时整段评分
+
+MANIFEST_FILE = "manifest.json"
+SEGMENT_META_FILE = "segment.json"
+FORMAT_VERSION = 4
+
+# chunk 级字符串列（正文不进入索引，命中后从 Milvus 补全）
+STRING_FIELDS = ("chunk_id",)
+# 论文级字符串列（同一论文的 chunk 共享，每篇论文只存一份）
+PAPER_FIELDS = ("title", "file_name")
+
+
+class _StringColumn:
+    """
+    变长字符串列：UTF-8 字节堆 + 偏移数组
+
+    可直接 mmap，读取时按需解码单个值，不会在启动时反序列化整列
+    """
+
+    def __init__(self, offsets: np.ndarray, data: np.ndarray):
+        self.offsets = offsets
+        self.data = data
+
+    @classmethod
+    def from_strings(cls, values: Iterable[str]) -> "_StringColumn":
+        encoded = [(v or "").encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(v) for v in encoded], out=offsets[1:])
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(offsets, data)
+
+    @classmethod
+    def concat(cls, columns: List["_StringColumn"], takes: List[np.ndarray]) -> "_StringColumn":
+        """按下标从多个列中取值并拼接（向量化，不解码字符串）"""
+        lengths = [np.diff(col.offsets)[take] for col, take in zip(columns, takes)]
+        all_lengths = np.concatenate(lengths) if lengths else np.zeros(0, dtype=np.int64)
+        offsets = np.zeros(len(all_lengths) + 1, dtype=np.int64)
+        np.cumsum(all_lengths, out=offsets[1:])
+
+        parts = []
+        for col, take, length in zip(columns, takes, lengths):
+            if not len(take):
+                continue
+            starts = col.offsets[:-1][take]
+            # 每个字节在源列中的位置 = 所在字符串起点 + 字符串内偏移
+            local_offsets = np.zeros(len(length), dtype=np.int64)
+            np.cumsum(length[:-1], out=local_offsets[1:])
+            positions = np.repeat(starts - local_offsets, length) + np.arange(int(length.sum()))
+            parts.append(np.asarray(col.data)[positions])
+
+        data = np.concatenate(parts) if parts else np.zeros(0, dtype=np.uint8)
+        return cls(offsets, data.astype(np.uint8, copy=False))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def save(self, path: str, name: str):
+        np.save(os.path.join(path, f"{name}.offsets.npy"), self.offsets)
+        np.save(os.path.join(path, f"{name}.data.npy"), self.data)
+
+    @classmethod
+    def load(cls, path: str, name: str) -> "_StringColumn":
+        return cls(
+            _load_array(os.path.join(path, f"{name}.offsets.npy")),
+            _load_array(os.path.join(path, f"{name}.data.npy")),
+        )
+
+
+def _load_array(file_path: str) -> np.ndarray:
+    """mmap 方式加载数组（空数组无法 mmap，直接读入）"""
+    try:
+        return np.load(file_path, mmap_mode="r")
+    except ValueError:
+        return np.load(file_path)
+
+
+def _bisect(column: _StringColumn, value: str) -> int:
+    """在有序字符串列中二分查找，返回下标（不存在返回 -1）"""
+    lo, hi = 0, len(column)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if column[mid] < value:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo if lo < len(column) and column[lo] == value else -1
+
+
+class _Weights:
+    """
+    段的评分数据：weights、共享其内存的权重矩阵、计算参数 (k1, b, avgdl)，以及可选的块上界和构建时的块大小
+
+    构建后不再修改。重算时生成新对象，以一次赋值替换 _Segment.scoring；查询开始时取一次引用，
+    之后只用该对象，不会把新的块上界与旧的权重配对（avgdl 下降后旧权重可能超过新上界，剪枝会漏掉命中）
+    """
+    __slots__ = ("weights", "params", "matrix", "block_max", "block_starts", "block_size")
+
+    def __init__(
+        self,
+        weights: np.ndarray,
+        params: Tuple[float, float, float],
+        matrix: csr_matrix,
+        block_max: Optional[csr_matrix] = None,
+        block_starts: Optional[np.ndarray] = None,
+        block_size: Optional[int] = None,
+    ):
+        self.weights = weights
+        self.params = params
+        self.matrix = matrix
+        self.block_max = block_max
+        self.block_starts = block_starts
+        self.block_size = block_size
+
+    @property
+    def num_blocks(self) -> int:
+        return self.block_max.shape[1]
+
+
+class _Segment:
+    """
+    不可变段：一批论文 chunk 的倒排表 + chunk 元数据
+
+    - terms 为有序词表，第 i 个词的 posting 为 doc_ids/tfs[indptr[i]:indptr[i+1]]，doc 升序
+    - 同一论文的 chunk 在段内连续，paper_ids/paper_start 记录各论文的起始位置，
+      paper_columns 与 paper_ids 对齐保存论文级字段
+    - live 为存活标记（仅在内存中），删除只修改该标记并记录 deleted_papers
+    - scoring（_Weights）中的 weights 与 doc_ids 对齐，是 BM25 的 tf 饱和项 tf·(k1+1)/(tf+k1·(1-b+b·dl/avgdl))，
+      与 indptr/doc_ids 共同构成词-文档权重矩阵
+    - scoring.block_max 为词-块最大权重矩阵（CSR，行=词，列=块），用于 Block-Max 剪枝的分数上界；
+      block_starts 与 block_max.data 对齐，记录每个 (词, 块) 在 posting 中的起始位置（末尾为 nnz）。
+      两者与倒排表规模相当，只在需要剪枝时构建（ensure_block_max）
+    """
+
+    def __init__(
+        self,
+        name: str,
+        terms: _StringColumn,
+        indptr: np.ndarray,
+        doc_ids: np.ndarray,
+        tfs: np.ndarray,
+        doc_len: np.ndarray,
+        paper_ids: _StringColumn,
+        paper_start: np.ndarray,
+        chunk_index: np.ndarray,
+        columns: Dict[str, _StringColumn],
+        paper_columns: Dict[str, _StringColumn],
+        weights: Optional[np.ndarray] = None,
+        weight_params: Optional[Tuple[float, float, float]] = None,
+        block_max: Optional[csr_matrix] = None,
+        block_starts: Optional[np.ndarray] = None,
+        block_size: Optional[int] = None,
+    ):
+        self.name = name
+        self.terms = terms
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_len = doc_len
+        self.paper_ids = paper_ids
+        self.paper_start = paper_start
+        self.chunk_index = chunk_index
+        self.columns = columns
+        self.paper_columns = paper_columns
+
+        self.scoring: Optional[_Weights] = None
+        if weights is not None:
+            self.scoring = self._make_weights(weights, weight_params, block_max, block_starts, block_size)
+
+        self.live = np.ones(len(doc_len), dtype=bool)
+        self.num_deleted = 0
+        self.deleted_papers: List[str] = []
+        self.total_len = int(np.sum(doc_len, dtype=np.int64))
+
+        self.papers: Dict[str, Tuple[int, int]] = {
+            paper_ids[i]: (int(paper_start[i]), int(paper_start[i + 1]))
+            for i in range(len(paper_ids))
+        }
+
+    @classmethod
+    def build(
+        cls,
+        name: str,
+        docs: List[Dict[str, Any]],
+        term_freqs: List[Dict[str, int]],
+        doc_len: List[int],
+    ) -> "_Segment":
+        """由 chunk 元数据和词频构建段（docs 需按论文连续排列）"""
+        vocab = sorted(set().union(*term_freqs)) if term_freqs else []
+        term_row = {term: row for row, term in enumerate(vocab)}
+
+        entry_terms, entry_docs, entry_tfs = [], [], []
+        for doc, tfs in enumerate(term_freqs):
+            for term, tf in tfs.items():
+                entry_terms.append(term_row[term])
+                entry_docs.append(doc)
+                entry_tfs.append(tf)
+
+        paper_ids, paper_start = [], []
+        for doc, meta in enumerate(docs):
+            if not paper_ids or paper_ids[-1] != meta["paper_id"]:
+                paper_ids.append(meta["paper_id"])
+                paper_start.append(doc)
+        paper_start.append(len(docs))
+
+        return cls._from_entries(
+            name,
+            vocab,
+            np.asarray(entry_terms, dtype=np.int64),
+            np.asarray(entry_docs, dtype=np.int32),
+            np.asarray(entry_tfs, dtype=np.int32),
+            np.asarray(doc_len, dtype=np.int32),
+            _StringColumn.from_strings(paper_ids),
+            np.asarray(paper_start, dtype=np.int64),
+            np.asarray([meta.get("chunk_index", 0) for meta in docs], dtype=np.int32),
+            {field: _StringColumn.from_strings(meta.get(field, "") for meta in docs) for field in STRING_FIELDS},
+            {
+                field: _StringColumn.from_strings(docs[start].get(field, "") for start in paper_start[:-1])
+                for field in PAPER_FIELDS
+            },
+        )
+
+    @classmethod
+    def _from_entries(
+        cls,
+        name: str,
+        vocab: List[str],
+        entry_terms: np.ndarray,
+        entry_docs: np.ndarray,
+        entry_tfs: np.ndarray,
+        doc_len: np.ndarray,
+        paper_ids: _StringColumn,
+        paper_start: np.ndarray,
+        chunk_index: np.ndarray,
+        columns: Dict[str, _StringColumn],
+        paper_columns: Dict[str, _StringColumn],
+    ) -> "_Segment":
+        order = np.lexsort((entry_docs, entry_terms))
+        # indptr 与 doc_ids 使用相同的整数类型，scipy 构建 CSR 时无需拷贝
+        index_dtype = np.int32 if len(entry_docs) < np.iinfo(np.int32).max else np.int64
+        indptr = np.zeros(len(vocab) + 1, dtype=index_dtype)
+        np.cumsum(np.bincount(entry_terms, minlength=len(vocab)), out=indptr[1:])
+
+        return cls(
+            name,
+            _StringColumn.from_strings(vocab),
+            indptr,
+            entry_docs[order].astype(index_dtype, copy=False),
+            # 词频超过 uint16 上限时截断（BM25 的 tf 饱和项对此不敏感）
+            np.minimum(entry_tfs[order], np.iinfo(np.uint16).max).astype(np.uint16),
+            doc_len,
+            paper_ids,
+            paper_start,
+            chunk_index,
+            columns,
+            paper_columns,
+        )
+
+    @classmethod
+    def merge(cls, name: str, segments: List["_Segment"]) -> "_Segment":
+        """合并多个段并丢弃墓碑文档（向量化重写倒排表）"""
+        vocab = sorted(set().union(*(set(seg.terms[i] for i in range(len(seg.terms))) for seg in segments)))
+        term_row = {term: row for row, term in enumerate(vocab)}
+
+        entry_terms, entry_docs, entry_tfs = [], [], []
+        doc_len, chunk_index, takes, paper_takes = [], [], [], []
+        paper_ids, paper_start = [], []
+        doc_offset = 0
+
+        for seg in segments:
+            keep = np.flatnonzero(seg.live)
+            new_doc = np.full(seg.num_docs, -1, dtype=np.int64)
+            new_doc[keep] = np.arange(len(keep)) + doc_offset
+
+            local_to_global = np.asarray([term_row[seg.terms[i]] for i in range(len(seg.terms))], dtype=np.int64)
+            rows = np.repeat(np.arange(len(seg.terms)), np.diff(seg.indptr))
+            docs = new_doc[seg.doc_ids]
+            alive = docs >= 0
+
+            entry_terms.append(local_to_global[rows[alive]])
+            entry_docs.append(docs[alive])
+            entry_tfs.append(np.asarray(seg.tfs)[alive])
+            doc_len.append(np.asarray(seg.doc_len)[keep])
+            chunk_index.append(np.asarray(seg.chunk_index)[keep])
+            takes.append(keep)
+
+            live_papers = []
+            for i in range(len(seg.paper_ids)):
+                start = int(seg.paper_start[i])
+                if start < seg.num_docs and seg.live[start]:
+                    paper_ids.append(seg.paper_ids[i])
+                    paper_start.append(int(new_doc[start]))
+                    live_papers.append(i)
+            paper_takes.append(np.asarray(live_papers, dtype=np.int64))
+
+            doc_offset += len(keep)
+
+        paper_start.append(doc_offset)
+
+        return cls._from_entries(
+            name,
+            vocab,
+            np.concatenate(entry_terms) if entry_terms else np.zeros(0, dtype=np.int64),
+            np.concatenate(entry_docs).astype(np.int32) if entry_docs else np.zeros(0, dtype=np.int32),
+            np.concatenate(entry_tfs) if entry_tfs else np.zeros(0, dtype=np.uint16),
+            np.concatenate(doc_len) if doc_len else np.zeros(0, dtype=np.int32),
+            _StringColumn.from_strings(paper_ids),
+            np.asarray(paper_start, dtype=np.int64),
+            np.concatenate(chunk_index) if chunk_index else np.zeros(0, dtype=np.int32),
+            {
+                field: _StringColumn.concat([seg.columns[field] for seg in segments], takes)
+                for field in STRING_FIELDS
+            },
+            {
+                field: _StringColumn.concat([seg.paper_columns[field] for seg in segments], paper_takes)
+                for field in PAPER_FIELDS
+            },
+        )
+
+    def save(self, path: str):
+        """写入段目录（先写临时目录再改名，保证段目录要么完整要么不存在）"""
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        self.terms.save(tmp_path, "terms")
+        self.paper_ids.save(tmp_path, "paper_ids")
+        for field, column in self.columns.items():
+            column.save(tmp_path, field)
+        for field, column in self.paper_columns.items():
+            column.save(tmp_path, f"paper.{field}")
+        for field in ("indptr", "doc_ids", "tfs", "doc_len", "paper_start", "chunk_index"):
+            np.save(os.path.join(tmp_path, f"{field}.npy"), getattr(self, field))
+        scoring = self.scoring
+        np.save(os.path.join(tmp_path, "weights.npy"), scoring.weights)
+        if scoring.block_max is not None:
+            for field in ("data", "indices", "indptr"):
+                np.save(os.path.join(tmp_path, f"block_max.{field}.npy"), getattr(scoring.block_max, field))
+            np.save(os.path.join(tmp_path, "block_max.starts.npy"), scoring.block_starts)
+        with open(os.path.join(tmp_path, SEGMENT_META_FILE), "w", encoding="utf-8") as f:
+            json.dump({
+                "weight_params": scoring.params,
+                "block_max": scoring.block_max is not None,
+                "block_size": scoring.block_size,
+            }, f)
+
+        # 同名目录只可能是旧格式快照的残留（不被 manifest 引用）
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, name: str, path: str) -> "_Segment":
+        """以 mmap 方式打开段目录"""
+        with open(os.path.join(path, SEGMENT_META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        terms = _StringColumn.load(path, "terms")
+        doc_len = _load_array(os.path.join(path, "doc_len.npy"))
+        # 块上界按段记录的块大小解释（与当前 BM25_BLOCK_SIZE 不同时，首次剪枝查询按新配置重建）；
+        # 未记录块大小的旧快照无法确定块边界，丢弃块上界
+        block_max = block_starts = None
+        block_size = meta.get("block_size")
+        if meta["block_max"] and block_size:
+            block_max = csr_matrix(
+                tuple(_load_array(os.path.join(path, f"block_max.{field}.npy")) for field in ("data", "indices", "indptr")),
+                shape=(len(terms), (len(doc_len) + block_size - 1) // block_size),
+                copy=False
+            )
+            block_starts = _load_array(os.path.join(path, "block_max.starts.npy"))
+
+        return cls(
+            name,
+            terms,
+            _load_array(os.path.join(path, "indptr.npy")),
+            _load_array(os.path.join(path, "doc_ids.npy")),
+            _load_array(os.path.join(path, "tfs.npy")),
+            doc_len,
+            _StringColumn.load(path, "paper_ids"),
+            _load_array(os.path.join(path, "paper_start.npy")),
+            _load_array(os.path.join(path, "chunk_index.npy")),
+            {field: _StringColumn.load(path, field) for field in STRING_FIELDS},
+            {field: _StringColumn.load(path, f"paper.{field}") for field in PAPER_FIELDS},
+            _load_array(os.path.join(path, "weights.npy")),
+            tuple(meta["weight_params"]),
+            block_max,
+            block_starts,
+            block_size if block_max is not None else None,
+        )
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.doc_len)
+
+    @property
+    def num_live(self) -> int:
+        return self.num_docs - self.num_deleted
+
+    def row(self, term: str) -> int:
+        """词在段词表中的行号（不存在返回 -1）"""
+        return _bisect(self.terms, term)
+
+    def live_df(self, row: int) -> int:
+        """词在段内的存活文档频率"""
+        start, end = self.indptr[row], self.indptr[row + 1]
+        if not self.num_deleted:
+            return int(end - start)
+        return int(self.live[self.doc_ids[start:end]].sum())
+
+    def _make_weights(
+        self,
+        weights: np.ndarray,
+        params: Tuple[float, float, float],
+        block_max: Optional[csr_matrix] = None,
+        block_starts: Optional[np.ndarray] = None,
+        block_size: Optional[int] = None
+    ) -> _Weights:
+        matrix = csr_matrix((weights, self.doc_ids, self.indptr), shape=(len(self.terms), self.num_docs), copy=False)
+        return _Weights(weights, tuple(params), matrix, block_max, block_starts, block_size)
+
+    def ensure_weights(self, k1: float, b: float, avgdl: float) -> _Weights:
+        """
+        返回可用的评分数据：未计算、参数变化或 avgdl 漂移超过阈值时重算
+
+        重算是对 nnz 的一次向量化计算，小段代价很低；大段的 avgdl 随语料增长变化缓慢。
+        新的权重、矩阵和块上界全部构建好后一次替换，调用方在整个查询中使用返回的对象
+        """
+        scoring = self.scoring
+        if scoring is not None:
+            params = scoring.params
+            if (
+                params[0] == k1
+                and params[1] == b
+                and params[2] > 0
+                and abs(avgdl - params[2]) <= BM25_AVGDL_TOLERANCE * params[2]
+            ):
+                return scoring
+
+        avgdl = avgdl or 1.0
+        tfs = np.asarray(self.tfs, dtype=np.float32)
+        norm = k1 * (1 - b + b * np.asarray(self.doc_len, dtype=np.float32)[self.doc_ids] / avgdl)
+        weights = (tfs * (k1 + 1) / (tfs + norm)).astype(np.float32, copy=False)
+
+        block_max = block_starts = block_size = None
+        if scoring is not None and scoring.block_max is not None:
+            block_size = BM25_BLOCK_SIZE
+            block_max, block_starts = self._build_block_max(weights, block_size)
+        scoring = self._make_weights(weights, (k1, b, avgdl), block_max, block_starts, block_size)
+        self.scoring = scoring
+        return scoring
+
+    def ensure_block_max(self, scoring: _Weights) -> _Weights:
+        """
+        返回带 Block-Max 块上界的评分数据（scoring 为 ensure_weights 的结果）
+
+        没有块上界或块大小与 BM25_BLOCK_SIZE 不同时，由 scoring 的权重按当前块大小构建；
+        期间权重已被其他查询重算时不替换 self.scoring（不覆盖新版本）
+        """
+        if scoring.block_max is not None and scoring.block_size == BM25_BLOCK_SIZE:
+            return scoring
+        block_size = BM25_BLOCK_SIZE
+        block_max, block_starts = self._build_block_max(scoring.weights, block_size)
+        pruned = _Weights(scoring.weights, scoring.params, scoring.matrix, block_max, block_starts, block_size)
+        if self.scoring is scoring:
+            self.scoring = pruned
+        return pruned
+
+    def _build_block_max(self, weights: np.ndarray, block_size: int) -> Tuple[csr_matrix, np.ndarray]:
+        """
+        计算每个词在每个 block_size 文档块内的最大权重，返回 (block_max, block_starts)
+
+        posting 按 (词, 文档) 有序，同一 (词, 块) 的条目连续，用 maximum.reduceat 分组求最大值
+        """
+        num_terms = len(self.terms)
+        rows = np.repeat(np.arange(num_terms, dtype=np.int64), np.diff(self.indptr))
+        num_blocks = (self.num_docs + block_size - 1) // block_size
+        blocks = np.asarray(self.doc_ids) // block_size
+        keys = rows * max(num_blocks, 1) + blocks
+
+        if len(keys):
+            starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+            maxes = np.maximum.reduceat(weights, starts)
+            group_rows, group_blocks = rows[starts], blocks[starts]
+        else:
+            starts = np.zeros(0, dtype=np.int64)
+            maxes = np.zeros(0, dtype=np.float32)
+            group_rows = group_blocks = np.zeros(0, dtype=np.int64)
+
+        # 与倒排表使用相同的整数类型（条目数不超过 nnz）
+        index_dtype = self.indptr.dtype
+        indptr = np.zeros(num_terms + 1, dtype=index_dtype)
+        np.cumsum(np.bincount(group_rows, minlength=num_terms), out=indptr[1:])
+        block_max = csr_matrix(
+            (maxes.astype(np.float32, copy=False), group_blocks.astype(index_dtype), indptr),
+            shape=(num_terms, num_blocks),
+            copy=False
+        )
+        return block_max, np.append(starts, len(keys)).astype(index_dtype)
+
+    def doc_meta(self, doc: int) -> Dict[str, Any]:
+        """chunk 元数据（不含正文）"""
+        paper = int(np.searchsorted(self.paper_start, doc, side="right")) - 1
+        meta = {field: column[doc] for field, column in self.columns.items()}
+        meta.update((field, column[paper]) for field, column in self.paper_columns.items())
+        meta["paper_id"] = self.paper_ids[paper]
+        meta["chunk_index"] = int(self.chunk_index[doc])
+        return meta
+
+    def delete_paper(self, paper_id: str) -> Tuple[int, int]:
+        """对论文的所有 chunk 打墓碑，返回 (删除文档数, 删除的总长度)"""
+        span = self.papers.pop(paper_id, None)
+        if span is None:
+            return 0, 0
+
+        start, end = span
+        removed = int(self.live[start:end].sum())
+        removed_len = int(np.asarray(self.doc_len[start:end])[self.live[start:end]].sum())
+        self.live[start:end] = False
+        self.num_deleted += removed
+        self.total_len -= removed_len
+        self.deleted_papers.append(paper_id)
+        return removed, removed_len
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """返回分数最高且大于 0 的 k 个下标（降序），argpartition 为 O(n)"""
+    if len(scores) > k:
+        candidates = np.argpartition(scores, -k)[-k:]
+    else:
+        candidates = np.arange(len(scores))
+    candidates = candidates[scores[candidates] > 0]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class BM25Index:
+    """
+    增量倒排索引（BM25 Okapi 评分）
+
+    线程安全：写操作持锁并替换段列表（copy-on-write），查询读取段列表快照
+    path 不为空时，每次写操作后把新段落盘并原子切换 manifest
+    read_only=True 时只从 path 加载快照，之后的写操作只保存在内存中（快照由其他进程维护）
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        k1: float = BM25_K1,
+        b: float = BM25_B,
+        read_only: bool = False
+    ):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.read_only = read_only
+        # 已应用到的变更日志位置（随 manifest 持久化）
+        self.offset: Optional[str] = None
+        self._lock = threading.RLock()
+        self._segments: List[_Segment] = []
+        self._paper_segment: Dict[str, _Segment] = {}  # paper_id -> 所在段
+        self._next_segment = 0
+        self.generation = 0
+        self.num_docs = 0  # 存活文档数
+        self.total_len = 0  # 存活文档总长度
+        self._pruning_stats = {"queries": 0, "blocks_scored": 0, "blocks_total": 0}
+
+    @property
+    def avgdl(self) -> float:
+        return self.total_len / self.num_docs if self.num_docs else 0.0
+
+    def __contains__(self, paper_id: str) -> bool:
+        return paper_id in self._paper_segment
+
+    def papers(self) -> List[str]:
+        return list(self._paper_segment)
+
+    # ==================== 持久化 ====================
+
+    def load(self) -> bool:
+        """
+        从磁盘快照加载索引（mmap，不读入倒排数据）
+
+        Returns:
+            是否加载到了快照
+        """
+        if not self.path:
+            return False
+
+        manifest_path = os.path.join(self.path, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return False
+
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        if manifest.get("format") != FORMAT_VERSION:
+            logger.warning(f"BM25 snapshot format mismatch ({manifest.get('format')}), ignoring snapshot")
+            return False
+
+        with self._lock:
+            segments = []
+            for entry in manifest["segments"]:
+                segment = _Segment.load(entry["name"], os.path.join(self.path, entry["name"]))
+                for paper_id in entry.get("deleted_papers", []):
+                    segment.delete_paper(paper_id)
+                segments.append(segment)
+
+            self._install_segments_locked(segments)
+            self._next_segment = manifest["next_segment"]
+            self.generation = manifest["generation"]
+            self.offset = manifest.get("offset")
+
+        logger.info(
+            f"✓ BM25 snapshot loaded: generation={self.generation}, "
+            f"{len(segments)} segments, {self.num_docs} chunks, offset={self.offset}"
+        )
+        return True
+
+    def _install_segments_locked(self, segments: List[_Segment]):
+        self._segments = segments
+        self._paper_segment = {paper_id: seg for seg in segments for paper_id in seg.papers}
+        self.num_docs = sum(seg.num_live for seg in segments)
+        self.total_len = sum(seg.total_len for seg in segments)
+
+    def _new_segment_name_locked(self) -> str:
+        name = f"seg-{self._next_segment:08d}"
+        self._next_segment += 1
+        return name
+
+    def _persist_segment_locked(self, segment: _Segment, avgdl: float) -> _Segment:
+        """计算权重矩阵，把新段写盘并以 mmap 方式重新打开（释放构建时的内存）"""
+        scoring = segment.ensure_weights(self.k1, self.b, avgdl)
+        if BM25_BLOCK_MAX_PRUNING and self.num_docs + segment.num_docs >= BM25_PRUNING_MIN_DOCS:
+            segment.ensure_block_max(scoring)
+        if not self.path or self.read_only:
+            return segment
+        seg_path = os.path.join(self.path, segment.name)
+        segment.save(seg_path)
+        return _Segment.load(segment.name, seg_path)
+
+    def _commit_locked(self):
+        """原子切换 manifest，并清理不再引用的段目录"""
+        if not self.path or self.read_only:
+            return
+
+        self.generation += 1
+        manifest = {
+            "format": FORMAT_VERSION,
+            "generation": self.generation,
+            "next_segment": self._next_segment,
+            "offset": self.offset,
+            "segments": [
+                {"name": seg.name, "deleted_papers": seg.deleted_papers}
+                for seg in self._segments
+            ],
+        }
+
+        tmp_path = os.path.join(self.path, f"{MANIFEST_FILE}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.path, MANIFEST_FILE))
+
+        live_names = {seg.name for seg in self._segments}
+        for entry in os.listdir(self.path):
+            if entry.startswith("seg-") and entry not in live_names:
+                shutil.rmtree(os.path.join(self.path, entry), ignore_errors=True)
+
+    # ==================== 写操作 ====================
+
+    def add(self, paper_id: str, docs: List[Dict[str, Any]], term_freqs: List[Dict[str, int]], doc_len: List[int]):
+        """添加一篇论文（已存在则先删除，保证重复索引幂等）"""
+        self.add_many([(paper_id, docs, term_freqs, doc_len)])
+
+    def add_many(
+        self,
+        papers: List[Tuple[str, List[Dict[str, Any]], List[Dict[str, int]], List[int]]],
+        skip_existing: bool = False
+    ):
+        """
+        批量添加论文，所有论文写入同一个新段
+
+        skip_existing=True 时跳过索引中已存在的论文（重建时不覆盖实时写入）
+        """
+        with self._lock:
+            all_docs, all_tfs, all_len = [], [], []
+            for paper_id, docs, term_freqs, doc_len in papers:
+                if skip_existing and paper_id in self._paper_segment:
+                    continue
+                self._delete_locked(paper_id)
+                all_docs.extend(docs)
+                all_tfs.extend(term_freqs)
+                all_len.extend(doc_len)
+
+            if all_docs:
+                segment = _Segment.build(self._new_segment_name_locked(), all_docs, all_tfs, all_len)
+                avgdl = (self.total_len + segment.total_len) / (self.num_docs + segment.num_docs)
+                segment = self._persist_segment_locked(segment, avgdl)
+                self._segments = self._segments + [segment]
+                for paper_id in segment.papers:
+                    self._paper_segment[paper_id] = segment
+                self.num_docs += segment.num_docs
+                self.total_len += segment.total_len
+
+            self._maybe_merge_locked()
+            self._commit_locked()
+
+    def checkpoint(self, offset: Optional[str]):
+        """记录已应用到的变更日志位置并写入 manifest"""
+        with self._lock:
+            self.offset = offset
+            self._commit_locked()
+
+    def delete(self, paper_id: str) -> int:
+        """删除一篇论文，返回删除的 chunk 数"""
+        with self._lock:
+            removed = self._delete_locked(paper_id)
+            if removed:
+                self._maybe_merge_locked()
+                self._commit_locked()
+            return removed
+
+    def clear(self):
+        with self._lock:
+            self._install_segments_locked([])
+            self._commit_locked()
+
+    def compact(self):
+        """强制压缩：清除所有墓碑并合并为一个段"""
+        with self._lock:
+            if self._segments:
+                self._merge_locked(list(self._segments))
+                self._commit_locked()
+
+    def _delete_locked(self, paper_id: str) -> int:
+        segment = self._paper_segment.pop(paper_id, None)
+        if segment is None:
+            return 0
+
+        removed, removed_len = segment.delete_paper(paper_id)
+        self.num_docs -= removed
+        self.total_len -= removed_len
+
+        if segment.num_live == 0:
+            self._segments = [s for s in self._segments if s is not segment]
+        return removed
+
+    def _maybe_merge_locked(self):
+        # 1. 墓碑过多的段单独重写
+        for segment in self._segments:
+            if segment.num_docs and segment.num_deleted / segment.num_docs > BM25_MAX_DELETED_RATIO:
+                self._merge_locked([segment])
+
+        # 2. 段数过多时合并最小的若干段（分层合并，避免每次写入都重写大段）
+        if len(self._segments) > BM25_MAX_SEGMENTS:
+            smallest = sorted(self._segments, key=lambda s: s.num_live)[:BM25_MERGE_FACTOR]
+            self._merge_locked(smallest)
+
+    def _merge_locked(self, segments: List[_Segment]):
+        merged = _Segment.merge(self._new_segment_name_locked(), segments)
+        merged = self._persist_segment_locked(merged, self.avgdl) if merged.num_docs else None
+
+        remaining = [s for s in self._segments if all(s is not m for m in segments)]
+        self._segments = remaining + ([merged] if merged else [])
+
+        if merged:
+            for paper_id in merged.papers:
+                self._paper_segment[paper_id] = merged
+
+        logger.info(
+            f"✓ BM25 merged {len(segments)} segments into {merged.num_docs if merged else 0} docs "
+            f"({len(self._segments)} segments total)"
+        )
+
+    # ==================== 查询 ====================
+
+    def _snapshot(self, paper_id: Optional[str] = None):
+        """
+        查询用的一致快照：(段列表, 存活文档数, avgdl, 评分区间列表)
+
+        段列表、语料统计和 paper_id -> 段 / 区间的映射在锁内一起读取；写操作在锁内原地修改映射，
+        锁外分别读取会拿到新映射中的段（不在段列表快照中）或已删除的区间。
+        paper_id 给出但不在索引中时区间列表为 None
+        """
+        with self._lock:
+            segments, num_docs, avgdl = self._segments, self.num_docs, self.avgdl
+            if paper_id is None:
+                return segments, num_docs, avgdl, [(segment, (0, segment.num_docs)) for segment in segments]
+            segment = self._paper_segment.get(paper_id)
+            span = segment.papers.get(paper_id) if segment is not None else None
+            return segments, num_docs, avgdl, [(segment, span)] if span is not None else None
+
+    def search(
+        self,
+        query_tokens: List[str],
+        top_k: int = 10,
+        paper_id: Optional[str] = None,
+        pruning: Optional[bool] = None,
+        corpus: Optional[Tuple[int, Dict[str, int]]] = None
+    ) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        BM25 评分并返回 Top-K (score, chunk 元数据)
+
+        每个段的分数为 q·W：q 为查询词的 idf·qtf，W 为预计算的权重矩阵（只取查询词所在行）
+        paper_id 限定时只在该论文的 doc 区间内评分，但使用全局语料统计
+        pruning 为 None 时，全局查询在语料达到 BM25_PRUNING_MIN_DOCS 后启用 Block-Max 剪枝
+        corpus 为 (文档数, 查询词 -> df) 时用它计算 idf（多个索引合并结果时使用合并后的统计量，分数才可比较）
+        """
+        segments, num_docs, avgdl, spans = self._snapshot(paper_id)
+        if not num_docs or not query_tokens or top_k <= 0 or spans is None:
+            return []
+
+        query_tf = Counter(query_tokens)
+        terms = list(query_tf)
+
+        # 每个段中查询词的行号（-1 表示不存在），同时用于 df 统计和评分
+        rows = {id(seg): [seg.row(term) for term in terms] for seg in segments}
+        idf_docs = corpus[0] if corpus else num_docs
+        dfs = self._term_dfs(segments, rows, terms, corpus)
+        idf = np.zeros(len(terms), dtype=np.float32)
+        for t in range(len(terms)):
+            idf[t] = math.log(1.0 + (idf_docs - dfs[t] + 0.5) / (dfs[t] + 0.5)) * query_tf[terms[t]]
+
+        # 每个段参与评分的查询词：(段, 评分数据, 区间, 查询词下标, 段内行号)
+        plans = []
+        for segment, (start, end) in spans:
+            seg_rows = rows[id(segment)]
+            present = [t for t in range(len(terms)) if seg_rows[t] >= 0]
+            if present:
+                scoring = segment.ensure_weights(self.k1, self.b, avgdl)
+                plans.append((segment, scoring, start, end, present, [seg_rows[t] for t in present]))
+
+        if pruning is None:
+            pruning = BM25_BLOCK_MAX_PRUNING and num_docs >= BM25_PRUNING_MIN_DOCS
+        if paper_id is None and pruning:
+            candidates = self._search_block_max(plans, idf, top_k)
+        else:
+            candidates = self._search_exhaustive(plans, idf, top_k)
+
+        candidates.sort(key=lambda c: c[0], reverse=True)
+        results = []
+        for score, plan_no, doc in candidates[:top_k]:
+            segment = plans[plan_no][0]
+            results.append((score, segment.doc_meta(doc)))
+        return results
+
+    def search_batch(
+        self,
+        queries: List[List[str]],
+        top_k: int = 10,
+        paper_id: Optional[str] = None,
+        pruning: Optional[bool] = None,
+        corpus: Optional[Tuple[int, Dict[str, int]]] = None
+    ) -> List[List[Tuple[float, Dict[str, Any]]]]:
+        """
+        多个查询一次评分，返回每个查询的 Top-K (score, chunk 元数据)，分数与逐个 search 一致（同分文档的取舍可能不同）
+        corpus 的含义与 search 相同
+
+        查询词的并集只查一次词表和 df；每个段计算 Q·W（稀疏 × 稀疏），只产生含查询词的文档的分数。
+        全局查询启用 Block-Max 剪枝时逐个查询评分（剪枝依赖单个查询的阈值）
+        """
+        segments, num_docs, avgdl, spans = self._snapshot(paper_id)
+        if not num_docs or top_k <= 0 or spans is None:
+            return [[] for _ in queries]
+
+        if pruning is None:
+            pruning = BM25_BLOCK_MAX_PRUNING and num_docs >= BM25_PRUNING_MIN_DOCS
+        if paper_id is None and pruning:
+            return [self.search(tokens, top_k, pruning=True, corpus=corpus) for tokens in queries]
+
+        query_tfs = [Counter(tokens) for tokens in queries]
+        terms = list(dict.fromkeys(term for query_tf in query_tfs for term in query_tf))
+        if not terms:
+            return [[] for _ in queries]
+        column = {term: t for t, term in enumerate(terms)}
+
+        rows = {id(seg): np.array([seg.row(term) for term in terms], dtype=np.int64) for seg in segments}
+        idf_docs = corpus[0] if corpus else num_docs
+        dfs = self._term_dfs(segments, rows, terms, corpus)
+        idf = np.zeros(len(terms), dtype=np.float32)
+        for t in range(len(terms)):
+            idf[t] = math.log(1.0 + (idf_docs - dfs[t] + 0.5) / (dfs[t] + 0.5))
+
+        # 查询矩阵 Q[i, t] = idf_t · qtf
+        entries = [(i, column[term], tf) for i, query_tf in enumerate(query_tfs) for term, tf in query_tf.items()]
+        query_rows, query_cols, query_tf_values = (np.array(values) for values in zip(*entries))
+        query_matrix = csr_matrix(
+            (idf[query_cols] * query_tf_values.astype(np.float32), (query_rows, query_cols)),
+            shape=(len(queries), len(terms))
+        )
+
+        candidates: List[List[Tuple[float, int, int]]] = [[] for _ in queries]
+        for plan_no, (segment, (start, end)) in enumerate(spans):
+            seg_rows = rows[id(segment)]
+            present = np.flatnonzero(seg_rows >= 0)
+            if not len(present):
+                continue
+            scoring = segment.ensure_weights(self.k1, self.b, avgdl)
+            sub = scoring.matrix[seg_rows[present]]
+            if start or end != segment.num_docs:
+                sub = sub[:, start:end]
+            scores = (query_matrix[:, present] @ sub).tocsr()
+            scores.sort_indices()
+            if segment.num_deleted:
+                scores.data[~segment.live[scores.indices + start]] = 0.0
+
+            for i in range(len(queries)):
+                lo, hi = scores.indptr[i], scores.indptr[i + 1]
+                values, docs = scores.data[lo:hi], scores.indices[lo:hi]
+                candidates[i].extend(
+                    (float(values[j]), plan_no, int(docs[j]) + start) for j in _top_k(values, top_k)
+                )
+
+        results = []
+        for query_candidates in candidates:
+            query_candidates.sort(key=lambda c: c[0], reverse=True)
+            results.append([
+                (score, spans[plan_no][0].doc_meta(doc)) for score, plan_no, doc in query_candidates[:top_k]
+            ])
+        return results
+
+    def term_stats(self, terms: List[str]) -> Tuple[int, Dict[str, int]]:
+        """存活文档数和各词的 df（多个索引合并检索时相加后作为 search 的 corpus）"""
+        segments, num_docs, _, _ = self._snapshot()
+        rows = {id(seg): [seg.row(term) for term in terms] for seg in segments}
+        return num_docs, dict(zip(terms, self._term_dfs(segments, rows, terms)))
+
+    @staticmethod
+    def _term_dfs(segments: List[_Segment], rows: dict, terms: List[str], corpus=None) -> List[int]:
+        """各查询词的 df：corpus 给出时取其中的值，否则为各段存活文档 df 之和"""
+        if corpus:
+            return [corpus[1].get(term, 0) for term in terms]
+        return [
+            sum(seg.live_df(int(rows[id(seg)][t])) for seg in segments if rows[id(seg)][t] >= 0)
+            for t in range(len(terms))
+        ]
+
+    @staticmethod
+    def _search_exhaustive(plans: list, idf: np.ndarray, top_k: int) -> List[Tuple[float, int, int]]:
+        """对区间内所有文档评分：scores = q·W"""
+        candidates = []
+        for plan_no, (segment, scoring, start, end, present, seg_rows) in enumerate(plans):
+            for score, doc in BM25Index._score_segment(segment, scoring, start, end, present, seg_rows, idf, top_k):
+                candidates.append((score, plan_no, doc))
+        return candidates
+
+    @staticmethod
+    def _score_segment(
+        segment: _Segment,
+        scoring: _Weights,
+        start: int,
+        end: int,
+        present: List[int],
+        seg_rows: List[int],
+        idf: np.ndarray,
+        top_k: int,
+        blocks: Optional[np.ndarray] = None
+    ) -> List[Tuple[float, int]]:
+        """段内 [start, end) 文档区间的 Top-K (score, doc)；指定 blocks 时只保留这些块（要求整段区间）"""
+        sub = scoring.matrix[seg_rows]
+        if start or end != segment.num_docs:
+            sub = sub[:, start:end]
+        scores = sub.T @ idf[present]
+
+        if segment.num_deleted:
+            scores[~segment.live[start:end]] = 0.0
+        if blocks is not None:
+            keep = np.zeros(scoring.num_blocks, dtype=bool)
+            keep[blocks] = True
+            scores[~np.repeat(keep, scoring.block_size)[:segment.num_docs]] = 0.0
+
+        return [(float(scores[doc]), int(doc) + start) for doc in _top_k(scores, top_k)]
+
+    def _search_block_max(self, plans: list, idf: np.ndarray, top_k: int) -> List[Tuple[float, int, int]]:
+        """
+        Block-Max 剪枝的精确 Top-K
+
+        1. 块上界 UB(block) = Σ idf_t · max_w(t, block)，即对 block_max 矩阵做一次 q·BM
+        2. 第一轮对 UB 最高的 BM25_PRUNING_FIRST_BATCH 个块精确评分，第 K 名分数作为阈值 θ
+        3. 第二轮只评分 UB > θ 的块（其余块不可能进入 Top-K），按 block_starts 直接定位块内 posting
+        """
+        bounds, owners, blocks = [], [], []
+        plans = list(plans)
+        for plan_no, (segment, scoring, start, end, present, seg_rows) in enumerate(plans):
+            # 块上界与评分使用同一份权重
+            scoring = segment.ensure_block_max(scoring)
+            plans[plan_no] = (segment, scoring, start, end, present, seg_rows)
+            upper = scoring.block_max[seg_rows].T @ idf[present]
+            nonzero = np.flatnonzero(upper > 0)
+            bounds.append(upper[nonzero])
+            blocks.append(nonzero)
+            owners.append(np.full(len(nonzero), plan_no, dtype=np.int64))
+
+        if not bounds:
+            return []
+        bounds = np.concatenate(bounds)
+        owners = np.concatenate(owners)
+        blocks = np.concatenate(blocks)
+        if not len(bounds):
+            return []
+
+        candidates: List[Tuple[float, int, int]] = []
+
+        def score(picked: np.ndarray):
+            for plan_no in np.unique(owners[picked]):
+                plan_no = int(plan_no)
+                segment, scoring, _, _, present, seg_rows = plans[plan_no]
+                plan_blocks = np.sort(blocks[picked[owners[picked] == plan_no]])
+                if len(plan_blocks) > scoring.num_blocks * BM25_PRUNING_DENSE_RATIO:
+                    # 剩余块过多时切片不划算，整段做一次矩阵乘后只保留这些块
+                    hits = self._score_segment(
+                        segment, scoring, 0, segment.num_docs, present, seg_rows, idf, top_k, blocks=plan_blocks
+                    )
+                else:
+                    hits = self._score_blocks(segment, scoring, present, seg_rows, plan_blocks, idf, top_k)
+                candidates.extend((s, plan_no, doc) for s, doc in hits)
+            candidates.sort(key=lambda c: c[0], reverse=True)
+            del candidates[top_k:]
+
+        # 第一轮：上界最高的若干块，得到第 K 名分数作为阈值
+        first = min(BM25_PRUNING_FIRST_BATCH, len(bounds))
+        picked = np.argpartition(-bounds, first - 1)[:first]
+        score(picked)
+        scored = len(picked)
+
+        # 第二轮：上界超过阈值的其余块一次性评分
+        if len(candidates) >= top_k:
+            remaining = bounds > candidates[-1][0]
+            remaining[picked] = False
+            picked = np.flatnonzero(remaining)
+        else:
+            remaining = np.ones(len(bounds), dtype=bool)
+            remaining[picked] = False
+            picked = np.flatnonzero(remaining)
+        if len(picked):
+            score(picked)
+            scored += len(picked)
+
+        self._pruning_stats["queries"] += 1
+        self._pruning_stats["blocks_scored"] += scored
+        self._pruning_stats["blocks_total"] += len(bounds)
+        return candidates
+
+    @staticmethod
+    def _score_blocks(
+        segment: _Segment,
+        scoring: _Weights,
+        present: List[int],
+        seg_rows: List[int],
+        blocks: np.ndarray,
+        idf: np.ndarray,
+        top_k: int
+    ) -> List[Tuple[float, int]]:
+        """对段内若干块（升序）精确评分，返回这些块内的 Top-K (score, doc)"""
+        size = scoring.block_size
+        block_max, starts = scoring.block_max, scoring.block_starts
+        # 块 -> 在本批中的序号（不在本批为 -1）
+        slot_of = np.full(scoring.num_blocks, -1, dtype=np.int64)
+        slot_of[blocks] = np.arange(len(blocks))
+
+        positions, values = [], []
+        for t, row in zip(present, seg_rows):
+            g0, g1 = block_max.indptr[row], block_max.indptr[row + 1]
+            slots = slot_of[block_max.indices[g0:g1]]
+            groups = np.flatnonzero(slots >= 0) + g0
+            if not len(groups):
+                continue
+            lo, hi = starts[groups], starts[groups + 1]
+            lengths = hi - lo
+            # 拼接各 (词, 块) 的 posting 区间 [lo, hi)
+            index = np.repeat(lo - np.cumsum(lengths) + lengths, lengths) + np.arange(int(lengths.sum()))
+            # 文档在本批中的局部位置：块序号 * size + 块内偏移
+            positions.append(np.repeat(slots[groups - g0], lengths) * size + segment.doc_ids[index] % size)
+            values.append(scoring.weights[index] * idf[t])
+
+        if not positions:
+            return []
+        scores = np.bincount(
+            np.concatenate(positions),
+            weights=np.concatenate(values),
+            minlength=len(blocks) * size
+        )
+
+        doc_ids = (blocks[:, None] * size + np.arange(size)).ravel()
+        if segment.num_deleted:
+            in_range = doc_ids < segment.num_docs
+            dead = np.zeros(len(doc_ids), dtype=bool)
+            dead[in_range] = ~segment.live[doc_ids[in_range]]
+            scores[dead] = 0.0
+
+        return [(float(scores[i]), int(doc_ids[i])) for i in _top_k(scores, top_k)]
+
+    def get_stats(self) -> Dict[str, Any]:
+        segments = self._segments
+        return {
+            "papers": len(self._paper_segment),
+            "chunks": self.num_docs,
+            "segments": len(segments),
+            "deleted_chunks": sum(s.num_deleted for s in segments),
+            "avgdl": round(self.avgdl, 2),
+            "generation": self.generation,
+            "persistent": bool(self.path) and not self.read_only,
+            "offset": self.offset,
+            "block_max_pruning": dict(self._pruning_stats),
+        }
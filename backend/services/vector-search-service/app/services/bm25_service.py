@@ -1,195 +1,606 @@
 """
 BM25 稀疏检索服务
 用于混合检索中的关键词匹配
+
+索引引擎见 bm25_index.py（段式倒排索引，持久化到 BM25_INDEX_DIR）
+启动时优先加载磁盘快照；没有快照时从 Milvus 流式读取 chunk 重建
+索引不保存 chunk 正文，搜索结果的 content 按 chunk_id 从 Milvus 补全
+
+多 worker/多副本部署时，索引变更经 bm25_changelog.py 的变更日志按序应用到每个进程（apply_changes）；
+同一索引目录只有持有 writer.lock 的进程写快照，其他进程加载快照后只在内存中应用变更；
+需要从 Milvus 重建时也只由持有写锁的进程重建，重建期间目录中存在 rebuilding 标记，其他进程不加载未完成的快照
+
+索引按用户分片：每个用户的论文在 BM25_INDEX_DIR/users/<user_id> 下有独立的 BM25Index，
+按用户的查询只对该用户的分片评分；没有 user_id 的旧数据保存在根目录的分片中，不属于任何用户，按用户的查询不检索它。
+Milvus 集合迁移为分区集合后，从 Milvus 重建时把根分片中的论文移到所属用户的分片。
+根分片同时记录变更日志位置（最后写入，重放时各分片的变更是幂等的）
+
+每次变更都会更新论文/用户/全局的索引版本（index_version），上层的检索结果缓存以版本作为 key 的一部分，
+变更经变更日志应用到每个进程，因此各进程的缓存都不会返回变更前的结果
 """
+import fcntl
+import itertools
+import json
 import logging
-import re
-import jieba
-from typing import List, Dict, Any, Optional
-from rank_bm25 import BM25Okapi
-from collections import defaultdict
+import os
+import threading
+from collections import Counter, defaultdict
+from heapq import nlargest
+from typing import Callable, List, Dict, Any, Optional, Tuple
+
+from app.services.bm25_index import BM25Index
+from app.services.milvus_service import get_milvus_service
+from app.utils import tokenizer
 
 logger = logging.getLogger(__name__)
 
+# 索引持久化目录（为空则只保存在内存中）
+BM25_INDEX_DIR = os.getenv("BM25_INDEX_DIR", "./data/bm25_index")
+# 从 Milvus 重建时每个段包含的论文数
+BM25_REBUILD_BATCH_PAPERS = int(os.getenv("BM25_REBUILD_BATCH_PAPERS", "500"))
+
+WRITER_LOCK_FILE = "writer.lock"
+REBUILD_MARKER_FILE = "rebuilding"
+USER_SHARDS_DIR = "users"
+
 
 class BM25Service:
     """BM25 稀疏检索服务"""
-    
-    def __init__(self):
-        self.corpus: Dict[str, List[str]] = {}  # paper_id -> tokenized chunks
-        self.chunk_map: Dict[str, List[Dict]] = {}  # paper_id -> chunk metadata
-        self.bm25_index: Dict[str, BM25Okapi] = {}  # paper_id -> BM25 index
-        self.global_corpus: List[str] = []  # 全局语料（tokenized）
-        self.global_chunk_map: List[Dict] = []  # 全局 chunk 元数据
-        self.global_bm25: Optional[BM25Okapi] = None
-        
+
+    def __init__(self, index_dir: Optional[str] = BM25_INDEX_DIR, content_store=None):
+        self._writer_lock_file = None
+        self.is_writer = True
+        if index_dir:
+            os.makedirs(index_dir, exist_ok=True)
+            self.is_writer = self._acquire_writer_lock(index_dir)
+        self.index_dir = index_dir or None
+        # 根分片：没有 user_id 的旧数据，manifest 中记录变更日志位置
+        self.index = BM25Index(path=self.index_dir, read_only=not self.is_writer)
+        # 用户分片：user_id -> BM25Index
+        self.shards: Dict[str, BM25Index] = {}
+        self._shards_lock = threading.Lock()
+        # 正文来源，需提供 get_chunks(chunk_ids, output_fields)；默认使用 Milvus 服务
+        self.content_store = content_store
+        self._rebuild_lock = threading.Lock()
+        self._rebuilding = False
+        self._touched_during_rebuild: set = set()
+        # 索引版本："global" / "user:<id>" / "paper:<id>" -> 最近一次变更的序号
+        self._versions: Dict[str, int] = {}
+        self._version_clock = itertools.count(1)
+
+    def _acquire_writer_lock(self, index_dir: str) -> bool:
+        """尝试获取索引目录的写锁（进程退出时自动释放）"""
+        lock_file = open(os.path.join(index_dir, WRITER_LOCK_FILE), "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            logger.info("BM25 index directory is owned by another process, snapshots are read-only here")
+            return False
+        self._writer_lock_file = lock_file
+        return True
+
+    # ==================== 分片 ====================
+
+    def _shard_path(self, key: str) -> Optional[str]:
+        return os.path.join(self.index_dir, USER_SHARDS_DIR, key) if self.index_dir else None
+
+    def _get_shard(self, user_id, create: bool = False) -> Optional[BM25Index]:
+        """获取用户分片（user_id 为 None 时返回根分片）"""
+        if user_id is None:
+            return self.index
+        key = str(user_id)
+        shard = self.shards.get(key)
+        if shard is None and create:
+            with self._shards_lock:
+                shard = self.shards.get(key)
+                if shard is None:
+                    path = self._shard_path(key)
+                    if path and self.is_writer:
+                        os.makedirs(path, exist_ok=True)
+                    shard = BM25Index(path=path, read_only=not self.is_writer)
+                    self.shards[key] = shard
+        return shard
+
+    def _all_shards(self) -> List[BM25Index]:
+        return [self.index, *self.shards.values()]
+
+    def _find_shard(self, paper_id: str, user_id=None, include_root: bool = True) -> Optional[BM25Index]:
+        """查找论文所在分片：指定用户时只查该用户分片和根分片（include_root 为 False 时不查根分片）"""
+        if user_id is not None:
+            candidates = [self._get_shard(user_id), *([self.index] if include_root else [])]
+        else:
+            candidates = self._all_shards()
+        for shard in candidates:
+            if shard is not None and paper_id in shard:
+                return shard
+        return None
+
+    def _search_shards(self, user_id=None) -> List[BM25Index]:
+        """查询涉及的分片：指定用户时只有该用户的分片（根分片中的旧数据无法确定所属用户，不参与）"""
+        shards = self._all_shards() if user_id is None else [self._get_shard(user_id)]
+        return [shard for shard in shards if shard is not None and shard.num_docs]
+
+    def _scoped_shard(self, paper_id: str, user_id=None) -> Optional[BM25Index]:
+        """论文内检索所用的分片：指定用户时只查该用户的分片"""
+        return self._find_shard(paper_id, user_id, include_root=user_id is None)
+
+    @staticmethod
+    def _corpus_stats(shards: List[BM25Index], tokens: List[str]) -> Optional[Tuple[int, Dict[str, int]]]:
+        """多个分片合并检索时的语料统计量（文档数之和、各词 df 之和）；单个分片时不需要"""
+        if len(shards) < 2:
+            return None
+        terms = list(dict.fromkeys(tokens))
+        num_docs, dfs = 0, Counter()
+        for shard in shards:
+            shard_docs, shard_dfs = shard.term_stats(terms)
+            num_docs += shard_docs
+            dfs.update(shard_dfs)
+        return num_docs, dict(dfs)
+
+    # ==================== 索引版本 ====================
+
+    def _bump_version(self, paper_id: Optional[str] = None, user_id=None, scope_global: bool = False):
+        """记录一次变更：论文版本 + 所在范围的版本（根分片的变更记为全局变更）"""
+        version = next(self._version_clock)
+        if paper_id is not None:
+            self._versions[f"paper:{paper_id}"] = version
+        if scope_global or user_id is None:
+            self._versions["global"] = version
+        else:
+            self._versions[f"user:{user_id}"] = version
+
+    def index_version(self, paper_id: Optional[str] = None, user_id=None) -> str:
+        """
+        查询范围的索引版本，范围内的数据有任何变更时版本都会改变
+
+        限定论文时为全局 + 论文版本；论文不在 BM25 索引中时检索会退化为用户范围，需同时包含用户版本
+        """
+        parts = [self._versions.get("global", 0)]
+        if paper_id is not None:
+            parts.append(self._versions.get(f"paper:{paper_id}", 0))
+        if paper_id is None or self._scoped_shard(paper_id, user_id) is None:
+            parts.append(self._versions.get(f"user:{user_id}", 0))
+        return ".".join(map(str, parts))
+
+    def paper_version(self, paper_id: str) -> str:
+        """单篇论文的索引版本：论文重新索引/删除或全局变更（清空、重建）时改变，用于按论文缓存的数据"""
+        return f"{self._versions.get('global', 0)}.{self._versions.get(f'paper:{paper_id}', 0)}"
+
     def tokenize(self, text: str) -> List[str]:
         """
         分词（支持中英文）
         """
-        # 清理文本
-        text = text.lower()
-        text = re.sub(r'[^\w\s\u4e00-\u9fff]', ' ', text)
-        
-        # 使用 jieba 分词（支持中文）
-        tokens = list(jieba.cut(text))
-        
-        # 过滤停用词和短词
-        tokens = [t.strip() for t in tokens if len(t.strip()) > 1]
-        
-        return tokens
-    
+        return tokenizer.tokenize(text)
+
+    def _analyze(
+        self,
+        paper_id: str,
+        chunks: List[Dict[str, Any]],
+        token_lists: Optional[List[List[str]]] = None
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, int]], List[int]]:
+        """分词并整理为索引输入：(chunk 元数据, 词频, 文档长度)；token_lists 为已批量分好的词"""
+        if token_lists is None:
+            token_lists = tokenizer.tokenize_batch([chunk.get('content', '') for chunk in chunks])
+
+        docs = []
+        term_freqs = []
+        doc_len = []
+
+        for chunk, tokens in zip(chunks, token_lists):
+            if tokens:
+                term_freqs.append(dict(Counter(tokens)))
+                doc_len.append(len(tokens))
+                docs.append({
+                    'paper_id': paper_id,
+                    'chunk_id': chunk.get('chunk_id', ''),
+                    'chunk_index': chunk.get('chunk_index', 0),
+                    'title': chunk.get('title', ''),
+                    'file_name': chunk.get('file_name', ''),
+                })
+
+        return docs, term_freqs, doc_len
+
+    def analyze(self, paper_id: str, chunks: List[Dict[str, Any]], user_id=None) -> Dict[str, Any]:
+        """把论文分词为变更日志中的 add 变更（已分词，应用时无需再次分词）"""
+        docs, term_freqs, doc_len = self._analyze(paper_id, chunks)
+        return {
+            "op": "add",
+            "paper_id": paper_id,
+            "user_id": user_id,
+            "docs": docs,
+            "term_freqs": term_freqs,
+            "doc_len": doc_len,
+        }
+
+    def apply_changes(self, changes: List[Dict[str, Any]], offset: Optional[str] = None):
+        """
+        按顺序应用变更（add / delete / clear），连续的 add 合并为一个段写入
+
+        offset 为这批变更中最后一条在变更日志中的位置，各分片写入后随根分片 manifest 持久化
+        """
+        # 分片 -> 待写入的论文（连续的 add 按分片合并）
+        pending: Dict[int, Tuple[BM25Index, list]] = {}
+        # 写入后才更新版本，避免并发查询以新版本缓存旧数据
+        pending_versions: List[Tuple[str, Any]] = []
+
+        def flush():
+            for shard, papers in pending.values():
+                shard.add_many(papers)
+            pending.clear()
+            for paper_id, user_id in pending_versions:
+                self._bump_version(paper_id, user_id)
+            pending_versions.clear()
+
+        for change in changes:
+            try:
+                op = change["op"]
+                paper_id = change.get("paper_id")
+                user_id = change.get("user_id")
+                if self._rebuilding and paper_id:
+                    self._touched_during_rebuild.add(paper_id)
+
+                if op == "add":
+                    # 同一批内重复的论文需要先写入前一次，保证后写覆盖先写
+                    if any(p[0] == paper_id for _, papers in pending.values() for p in papers):
+                        flush()
+                    shard = self._get_shard(user_id, create=True)
+                    # 旧数据重新索引到用户分片时，移除根分片中的旧版本
+                    if shard is not self.index and paper_id in self.index:
+                        flush()
+                        self.index.delete(paper_id)
+                        self._bump_version(paper_id)
+                    pending.setdefault(id(shard), (shard, []))[1].append(
+                        (paper_id, change["docs"], change["term_freqs"], change["doc_len"])
+                    )
+                    pending_versions.append((paper_id, user_id))
+                elif op == "delete":
+                    flush()
+                    # legacy 为 False：Milvus 中没有该用户的 chunk，不删除根分片中的旧数据（可能属于其他用户）
+                    shard = self._find_shard(paper_id, user_id, include_root=change.get("legacy", True))
+                    if shard is not None:
+                        shard.delete(paper_id)
+                    self._bump_version(paper_id, user_id)
+                elif op == "clear":
+                    flush()
+                    for shard in self._all_shards():
+                        shard.clear()
+                    self._bump_version(scope_global=True)
+                else:
+                    logger.warning(f"Unknown BM25 change op: {op}")
+            except Exception as e:
+                logger.error(f"Failed to apply BM25 change {change.get('op')} {change.get('paper_id')}: {e}")
+
+        flush()
+        if offset is not None:
+            self.index.checkpoint(offset)
+
     def add_documents(
-        self, 
-        paper_id: str, 
-        chunks: List[Dict[str, Any]]
+        self,
+        paper_id: str,
+        chunks: List[Dict[str, Any]],
+        user_id=None
     ):
         """
-        添加文档到 BM25 索引
-        
+        添加文档到 BM25 索引（增量，无需重建全局索引）
+
         Args:
             paper_id: 论文ID
             chunks: chunk 列表，每个包含 content, chunk_id 等
+            user_id: 论文所属用户（为空时写入根分片）
         """
         try:
-            tokenized_chunks = []
-            chunk_metadata = []
-            
-            for chunk in chunks:
-                content = chunk.get('content', '')
-                tokens = self.tokenize(content)
-                
-                if tokens:
-                    tokenized_chunks.append(tokens)
-                    chunk_metadata.append({
-                        'paper_id': paper_id,
-                        'chunk_id': chunk.get('chunk_id', ''),
-                        'chunk_index': chunk.get('chunk_index', 0),
-                        'content': content,
-                        'title': chunk.get('title', ''),
-                        'file_name': chunk.get('file_name', ''),
-                    })
-            
-            if tokenized_chunks:
-                # 构建论文级别的 BM25 索引
-                self.corpus[paper_id] = tokenized_chunks
-                self.chunk_map[paper_id] = chunk_metadata
-                self.bm25_index[paper_id] = BM25Okapi(tokenized_chunks)
-                
-                # 添加到全局索引
-                self.global_corpus.extend(tokenized_chunks)
-                self.global_chunk_map.extend(chunk_metadata)
-                
-                logger.info(f"✓ BM25 indexed {len(tokenized_chunks)} chunks for paper: {paper_id}")
-                
+            change = self.analyze(paper_id, chunks, user_id)
+            self.apply_changes([change])
+            if change["docs"]:
+                logger.info(f"✓ BM25 indexed {len(change['docs'])} chunks for paper: {paper_id}")
+
         except Exception as e:
             logger.error(f"Failed to add documents to BM25: {e}")
-    
-    def rebuild_global_index(self):
-        """重建全局 BM25 索引"""
-        if self.global_corpus:
-            self.global_bm25 = BM25Okapi(self.global_corpus)
-            logger.info(f"✓ Global BM25 index rebuilt with {len(self.global_corpus)} chunks")
-    
+
     def clear_all(self):
         """
         清空所有 BM25 索引
         """
-        self.corpus = {}
-        self.chunk_map = {}
-        self.bm25_index = {}
-        self.global_corpus = []
-        self.global_chunk_map = []
-        self.global_bm25 = None
+        self.apply_changes([{"op": "clear"}])
         logger.info("✓ BM25 all indexes cleared")
-    
-    def remove_documents(self, paper_id: str):
+
+    def remove_documents(self, paper_id: str, user_id=None):
         """
-        从 BM25 索引中删除文档
+        从 BM25 索引中删除文档（打墓碑，按需压缩）
         """
         try:
-            if paper_id in self.corpus:
-                # 从全局索引中移除
-                chunks_to_remove = set()
-                for i, meta in enumerate(self.global_chunk_map):
-                    if meta['paper_id'] == paper_id:
-                        chunks_to_remove.add(i)
-                
-                # 反向删除（避免索引问题）
-                for i in sorted(chunks_to_remove, reverse=True):
-                    self.global_corpus.pop(i)
-                    self.global_chunk_map.pop(i)
-                
-                # 删除论文级别索引
-                del self.corpus[paper_id]
-                del self.chunk_map[paper_id]
-                del self.bm25_index[paper_id]
-                
-                # 重建全局索引
-                self.rebuild_global_index()
-                
-                logger.info(f"✓ BM25 removed documents for paper: {paper_id}")
-                
+            if self._rebuilding:
+                self._touched_during_rebuild.add(paper_id)
+            shard = self._scoped_shard(paper_id, user_id)
+            removed = shard.delete(paper_id) if shard is not None else 0
+            self._bump_version(paper_id, user_id)
+            if removed:
+                logger.info(f"✓ BM25 removed {removed} chunks for paper: {paper_id}")
+
         except Exception as e:
             logger.error(f"Failed to remove documents from BM25: {e}")
-    
+
     def search(
-        self, 
-        query: str, 
+        self,
+        query: str,
         top_k: int = 10,
-        paper_id: Optional[str] = None
+        paper_id: Optional[str] = None,
+        user_id=None,
+        hydrate: bool = True
     ) -> List[Dict[str, Any]]:
         """
         BM25 搜索
-        
+
         Args:
             query: 查询文本
             top_k: 返回数量
             paper_id: 限定在特定论文内搜索（可选）
-            
+            user_id: 只搜索该用户的分片（为空时搜索全部分片）
+            hydrate: 是否补全正文（为 False 时结果没有 content 字段，由调用方在融合后补全）
+
         Returns:
             搜索结果列表
         """
         try:
-            tokens = self.tokenize(query)
-            
+            tokens = list(tokenizer.tokenize_query(query))
+
             if not tokens:
                 logger.warning("Empty query after tokenization")
                 return []
-            
-            if paper_id and paper_id in self.bm25_index:
-                # 论文级别搜索
-                bm25 = self.bm25_index[paper_id]
-                chunk_map = self.chunk_map[paper_id]
+
+            # 论文不在索引中时退化为用户范围内的搜索（与原行为一致）
+            shard = self._scoped_shard(paper_id, user_id) if paper_id else None
+            if shard is not None:
+                hits = shard.search(tokens, top_k=top_k, paper_id=paper_id)
             else:
-                # 全局搜索
-                if not self.global_bm25:
-                    self.rebuild_global_index()
-                if not self.global_bm25:
-                    return []
-                bm25 = self.global_bm25
-                chunk_map = self.global_chunk_map
-            
-            # 计算 BM25 分数
-            scores = bm25.get_scores(tokens)
-            
-            # 获取 Top-K
-            top_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:top_k]
-            
+                # 各分片用合并后的文档数和 df 计算 idf，分数可以直接比较
+                shards = self._search_shards(user_id)
+                corpus = self._corpus_stats(shards, tokens)
+                hits = nlargest(
+                    top_k,
+                    (hit for s in shards for hit in s.search(tokens, top_k=top_k, corpus=corpus)),
+                    key=lambda hit: hit[0]
+                )
+
+            # 索引为每个命中新建元数据字典，直接补充分数即可，无需拷贝
             results = []
-            for idx in top_indices:
-                if scores[idx] > 0:  # 只返回有分数的结果
-                    result = chunk_map[idx].copy()
-                    result['bm25_score'] = float(scores[idx])
-                    results.append(result)
-            
+            for score, meta in hits:
+                meta['bm25_score'] = score
+                results.append(meta)
+            if hydrate:
+                self._hydrate(results)
+
             logger.info(f"BM25 search returned {len(results)} results")
             return results
-            
+
         except Exception as e:
             logger.error(f"BM25 search failed: {e}")
             return []
 
+    def search_batch(
+        self,
+        queries: List[str],
+        top_k: int = 10,
+        paper_id: Optional[str] = None,
+        user_id=None,
+        hydrate: bool = True
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        批量 BM25 搜索：每个分片对所有查询做一次矩阵评分，所有命中的正文一次补全（hydrate 为 False 时不补全）
+
+        Returns:
+            与 queries 顺序一致的搜索结果列表
+        """
+        try:
+            token_lists = [list(tokenizer.tokenize_query(query)) for query in queries]
+
+            shard = self._scoped_shard(paper_id, user_id) if paper_id else None
+            if shard is not None:
+                hits = shard.search_batch(token_lists, top_k=top_k, paper_id=paper_id)
+            else:
+                shards = self._search_shards(user_id)
+                corpus = self._corpus_stats(shards, [token for tokens in token_lists for token in tokens])
+                shard_hits = [s.search_batch(token_lists, top_k=top_k, corpus=corpus) for s in shards]
+                hits = [
+                    nlargest(top_k, (hit for per_shard in shard_hits for hit in per_shard[i]), key=lambda hit: hit[0])
+                    for i in range(len(queries))
+                ]
+
+            results = []
+            for query_hits in hits:
+                query_results = []
+                for score, meta in query_hits:
+                    meta['bm25_score'] = score
+                    query_results.append(meta)
+                results.append(query_results)
+            if hydrate:
+                self._hydrate([result for query_results in results for result in query_results])
+
+            logger.info(f"BM25 batch search returned {sum(map(len, results))} results for {len(queries)} queries")
+            return results
+
+        except Exception as e:
+            logger.error(f"BM25 batch search failed: {e}")
+            return [[] for _ in queries]
+
+    def _hydrate(self, results: List[Dict[str, Any]]):
+        """为命中的 chunk 补全正文（一次批量查询，重复的 chunk 只读取一次）"""
+        if not results:
+            return
+        try:
+            if self.content_store is None:
+                self.content_store = get_milvus_service()
+            chunk_ids = list(dict.fromkeys(r['chunk_id'] for r in results))
+            chunks = self.content_store.get_chunks(chunk_ids, ["content"])
+        except Exception as e:
+            logger.warning(f"Failed to fetch BM25 hit contents: {e}")
+            chunks = {}
+
+        for result in results:
+            result['content'] = chunks.get(result['chunk_id'], {}).get('content', '')
+
+    def _rebuild_marker(self) -> Optional[str]:
+        return os.path.join(self.index_dir, REBUILD_MARKER_FILE) if self.index_dir else None
+
+    def begin_rebuild(self):
+        """标记快照正在重建（持有写锁时），重建完成前其他进程不加载快照"""
+        marker = self._rebuild_marker()
+        if marker and self.is_writer:
+            with open(marker, "w"):
+                pass
+
+    def load_snapshot(self) -> bool:
+        """
+        加载磁盘快照，返回是否成功
+
+        先加载根分片（变更日志位置），再加载用户分片：用户分片不会比记录的位置更旧，
+        从该位置重放的变更对它们是幂等的。
+        快照正在重建（或上次重建中断）时返回 False；持有写锁的进程仍加载各分片，以便清空后重建
+        """
+        marker = self._rebuild_marker()
+        rebuilding = bool(marker) and os.path.exists(marker)
+        if rebuilding and not self.is_writer:
+            logger.debug("BM25 snapshot is being rebuilt by the writer process")
+            return False
+        try:
+            if not self.index.load():
+                return False
+            users_dir = os.path.join(self.index_dir, USER_SHARDS_DIR)
+            if os.path.isdir(users_dir):
+                for key in sorted(os.listdir(users_dir)):
+                    self._get_shard(key, create=True).load()
+            if self.shards:
+                logger.info(f"✓ BM25 user shards loaded: {len(self.shards)}")
+            if rebuilding:
+                logger.warning("Previous BM25 rebuild did not finish, discarding the snapshot")
+                return False
+            return True
+        except Exception as e:
+            logger.error(f"Failed to load BM25 snapshot: {e}")
+            return False
+
+    def rebuild_from_milvus(self, milvus_service, get_offset: Optional[Callable[[], Optional[str]]] = None) -> int:
+        """
+        从 Milvus 流式读取所有 chunk 重建索引（阻塞调用，应在线程中执行）
+
+        先只读取 paper_id，再按 BM25_REBUILD_BATCH_PAPERS 篇一组读取正文、分词并写入索引，
+        峰值内存为一组论文的正文（同一论文的 chunk 在主键顺序中不一定相邻）。
+        重建期间新增/删除的论文以实时写入为准，不会被重建结果覆盖。
+        集合有 user_id 分区键时，根分片中的旧数据移到所属用户的分片，不在集合中的旧数据删除。
+        完成后记录 get_offset() 返回的变更日志位置（重建期间的变更已应用到该位置），再移除重建标记
+
+        Returns:
+            重建的论文数
+        """
+        if not self._rebuild_lock.acquire(blocking=False):
+            logger.info("BM25 rebuild already in progress")
+            return 0
+
+        self._rebuilding = True
+        self._touched_during_rebuild = set()
+        try:
+            self.begin_rebuild()
+            output_fields = ["paper_id", "chunk_id", "chunk_index", "title", "file_name", "content"]
+            partitioned = getattr(milvus_service, "partitioned", False)
+            if partitioned:
+                output_fields.append("user_id")
+
+            paper_ids = list(dict.fromkeys(
+                row["paper_id"]
+                for batch in milvus_service.iterate_chunks(output_fields=["paper_id"])
+                for row in batch
+            ))
+
+            rebuilt = 0
+            for start in range(0, len(paper_ids), BM25_REBUILD_BATCH_PAPERS):
+                group = paper_ids[start:start + BM25_REBUILD_BATCH_PAPERS]
+                papers: Dict[Tuple[Optional[str], str], List[Dict[str, Any]]] = defaultdict(list)
+                for batch in milvus_service.iterate_chunks(
+                    output_fields=output_fields,
+                    filter_expr=f"paper_id in {json.dumps(group)}"
+                ):
+                    for row in batch:
+                        user_id = row.get("user_id")
+                        papers[(None if user_id is None else str(user_id), row["paper_id"])].append(row)
+
+                pending = []
+                for (user_id, paper_id), chunks in papers.items():
+                    # 有所属用户的论文只看用户分片：根分片中的旧版本在写入用户分片后删除
+                    if paper_id in self._touched_during_rebuild or self._scoped_shard(paper_id, user_id):
+                        continue
+                    chunks.sort(key=lambda c: c.get("chunk_index", 0))
+                    pending.append((user_id, paper_id, chunks))
+                rebuilt += self._add_rebuilt(pending)
+
+            if partitioned:
+                # 分区集合中的 chunk 都有所属用户，根分片中剩下的论文已不在集合中或已在用户分片中
+                stale = list(self.index.papers())
+                for paper_id in stale:
+                    self.index.delete(paper_id)
+                if stale:
+                    self._bump_version(scope_global=True)
+                    logger.info(f"✓ BM25 removed {len(stale)} legacy papers that are no longer in Milvus")
+
+            logger.info(
+                f"✓ BM25 index rebuilt from Milvus: {rebuilt} papers, "
+                f"{sum(shard.num_docs for shard in self._all_shards())} chunks, {len(self.shards)} user shards"
+            )
+            # 根分片的 manifest 同时表示快照存在（只有用户分片有数据时也要写入）
+            self.index.checkpoint((get_offset() if get_offset else None) or self.index.offset)
+            marker = self._rebuild_marker()
+            if marker and self.is_writer and os.path.exists(marker):
+                os.remove(marker)
+            return rebuilt
+
+        except Exception as e:
+            logger.error(f"Failed to rebuild BM25 index from Milvus: {e}")
+            return 0
+        finally:
+            self._rebuilding = False
+            self._rebuild_lock.release()
+
+    def _add_rebuilt(self, pending: List[Tuple[Optional[str], str, List[Dict[str, Any]]]]) -> int:
+        """整批论文一次性分词（进程池并行）后按分片各写入一个段"""
+        if not pending:
+            return 0
+        token_lists = tokenizer.tokenize_batch(
+            [chunk.get('content', '') for _, _, chunks in pending for chunk in chunks]
+        )
+
+        analyzed: Dict[Optional[str], list] = defaultdict(list)
+        offset = 0
+        for user_id, paper_id, chunks in pending:
+            tokens = token_lists[offset:offset + len(chunks)]
+            offset += len(chunks)
+            # 写入前再次过滤：分词期间可能有实时写入
+            if paper_id not in self._touched_during_rebuild:
+                analyzed[user_id].append((paper_id, *self._analyze(paper_id, chunks, tokens)))
+
+        for user_id, papers in analyzed.items():
+            self._get_shard(user_id, create=True).add_many(papers, skip_existing=True)
+            if user_id is not None:
+                # 旧数据已写入所属用户的分片
+                for paper_id, *_ in papers:
+                    self.index.delete(paper_id)
+        self._bump_version(scope_global=True)
+        return sum(len(papers) for papers in analyzed.values())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """索引统计信息"""
+        stats = self.index.get_stats()
+        shard_stats = [shard.get_stats() for shard in self.shards.values()]
+        stats["user_shards"] = {
+            "count": len(shard_stats),
+            "papers": sum(s["papers"] for s in shard_stats),
+            "chunks": sum(s["chunks"] for s in shard_stats),
+            "segments": sum(s["segments"] for s in shard_stats),
+        }
+        stats["rebuilding"] = self._rebuilding
+        stats["writer"] = self.is_writer
+        stats["tokenizer"] = tokenizer.get_stats()
+        return stats
+
 
 # 全局单例
 _bm25_service: Optional[BM25Service] = None
@@ -201,4 +612,3 @@ def get_bm25_service() -> BM25Service:
     if _bm25_service is None:
         _bm25_service = BM25Service()
     return _bm25_service
-
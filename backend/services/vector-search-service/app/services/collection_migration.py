@@ -0,0 +1,537 @@
+"""
+集合在线迁移（蓝绿切换）
+
+更换 embedding 模型、向量维度或集合 schema 时不再需要清空重建：在后台新建一个物理集合，
+从当前集合按主键顺序流式读取 chunk 写入新集合，embedding 模型和维度不变时直接复制向量；
+同一 text-embedding-3 模型降维时截断已有向量并重新归一化（与 API 的 dimensions 参数结果相同）；
+否则用 chunk 正文重新生成 embedding（多个批次并发请求，受每分钟请求数限制）。
+Milvus 中保存了 chunk 的完整正文，不需要从 MinIO 重新提取。
+
+每完成一组批次把进度（已复制到的源集合主键）写入检查点文件，中断后从检查点继续；
+复制完成后追平迁移期间的写入和删除，加载新集合并把别名 MILVUS_COLLECTION 原子地切换过去。
+各副本在 MILVUS_ALIAS_CHECK_SECONDS 内发现切换并改用新集合（检索不中断），
+等待这段时间后再追平一次切换前后仍写入旧集合的数据。旧集合保留，回滚时把别名切回即可。
+切换后新集合同时接收已切换副本的写入，只在新集合中的论文不视为已删除：最后一次追平只复制旧集合中主键大于检查点的论文、
+只删除切换时存在且之后从旧集合删除的论文，切换后在新集合中变更过的论文以新集合为准。
+
+增量识别依赖 auto_id 主键随写入时间递增：迁移开始后写入的 chunk 主键大于检查点。
+论文重新索引是先删除再写入，因此增量按论文处理：主键大于检查点的论文、两个集合中 chunk 数不同的论文
+（复制期间被删除或重新索引）在新集合中先整篇删除，再从源集合整篇复制
+
+旧集合（没有 user_id 分区键）总是迁移为分区集合：chunk 的 user_id 取自 --owners 文件（论文 -> 上传者ID，
+由 paper-storage-service 的 export_paper_owners.py 导出），文件中没有所属用户的论文不复制（记录警告）
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from pymilvus import Collection, utility
+
+from app.database import MILVUS_ALIAS_CHECK_SECONDS
+from app.services.milvus_service import MilvusService, embedding_spec, requested_dimensions
+from app.services.openai_service import OpenAIService, supports_dimensions, truncate_embeddings
+
+logger = logging.getLogger(__name__)
+
+# 复制的字段（按新集合的字段顺序，user_id 仅分区集合有）
+COPY_FIELDS = [
+    "paper_id", "chunk_id", "chunk_index", "embedding", "title", "file_name",
+    "content", "chunk_chars", "page_range", "upload_time", "source"
+]
+
+# 迁移阶段
+PHASE_COPY = "copy"          # 复制源集合中检查点之后的 chunk
+PHASE_COPIED = "copied"      # 复制完成，尚未切换别名
+PHASE_SWITCHED = "switched"  # 已切换别名，等待各副本切换后最后追平
+PHASE_DONE = "done"
+
+# 按 paper_id 删除/复制时每个表达式包含的论文数
+_PAPERS_PER_EXPR = 100
+
+
+@dataclass
+class MigrationCheckpoint:
+    """迁移进度（JSON 文件，每完成一组批次原子地覆盖写入）"""
+    source: str
+    target: str
+    embedding_model: str
+    dim: int
+    partitioned: bool
+    reembed: bool
+    source_partitioned: bool = True  # 源集合有 user_id 字段；否则按 owners_file 填写 user_id
+    owners_file: Optional[str] = None
+    truncate: bool = False  # 截断已有向量降维（同一 text-embedding-3 模型）
+    dimensions: Optional[int] = None  # 重新生成 embedding 时请求的 dimensions 参数
+    phase: str = PHASE_COPY
+    last_pk: int = -1  # 已复制到的源集合主键（不含增量追平）
+    copied: int = 0
+    reembedded: int = 0
+    caught_up_papers: int = 0
+    # 切换别名时新集合的论文 -> chunk 数（切换后的追平据此区分旧集合的删除和新集合自身的写入，完成后清空）
+    switch_papers: Dict[str, int] = field(default_factory=dict)
+    started_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    updated_at: str = ""
+
+    @classmethod
+    def load(cls, path: str) -> Optional["MigrationCheckpoint"]:
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return cls(**json.load(f))
+
+    def save(self, path: str):
+        self.updated_at = datetime.now().isoformat()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+
+class RateLimiter:
+    """令牌桶：每分钟最多 rpm 次请求（0 表示不限制），允许不超过 1 秒的突发"""
+
+    def __init__(self, rpm: int):
+        self.rate = rpm / 60.0
+        self.capacity = max(self.rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CollectionMigration:
+    """
+    把当前集合迁移到新集合并切换别名
+
+    用法：
+        migration = CollectionMigration(milvus_service, openai_service, "data/migration.json",
+                                        embedding_model="text-embedding-3-large")
+        await migration.run()
+    """
+
+    def __init__(
+        self,
+        milvus_service: MilvusService,
+        openai_service: OpenAIService,
+        checkpoint_path: str,
+        target: Optional[str] = None,
+        embedding_model: Optional[str] = None,
+        dim: Optional[int] = None,
+        batch_size: int = 256,
+        concurrency: int = 4,
+        rpm: int = 0,
+        switch_grace_seconds: Optional[float] = None,
+        owners_file: Optional[str] = None
+    ):
+        self.milvus = milvus_service
+        self.openai = openai_service
+        self.checkpoint_path = checkpoint_path
+        self.target_name = target
+        self.embedding_model = embedding_model
+        self.dim = dim
+        self.batch_size = batch_size
+        self.concurrency = max(concurrency, 1)
+        self.limiter = RateLimiter(rpm)
+        # 切换别名后等待各副本发现切换的时间
+        self.switch_grace_seconds = (
+            MILVUS_ALIAS_CHECK_SECONDS + 10 if switch_grace_seconds is None else switch_grace_seconds
+        )
+        self.owners_file = os.path.abspath(owners_file) if owners_file else None
+        # 论文 -> 所属用户（源集合是旧集合时）
+        self.owners: Dict[str, int] = {}
+        self._unowned: Set[str] = set()
+        self.checkpoint: Optional[MigrationCheckpoint] = None
+        self._resumed = False
+
+    # ==================== 流程 ====================
+
+    async def run(self, switch: bool = True) -> MigrationCheckpoint:
+        """
+        执行（或从检查点继续）迁移
+
+        Args:
+            switch: 复制完成后是否切换别名（False 时停在 copied 阶段，之后再次运行完成切换）
+        """
+        checkpoint = self.checkpoint = await self._prepare()
+        if not checkpoint.source_partitioned:
+            self.owners = load_owners(checkpoint.owners_file)
+        source = Collection(checkpoint.source)
+        target = Collection(checkpoint.target)
+
+        if checkpoint.phase == PHASE_COPY:
+            await self._copy(source, target)
+            await self._catch_up(source, target)
+            checkpoint.phase = PHASE_COPIED
+            checkpoint.save(self.checkpoint_path)
+            logger.info(
+                f"✓ Copied {checkpoint.copied} chunks to '{checkpoint.target}' "
+                f"({checkpoint.reembedded} re-embedded)"
+            )
+
+        if not switch:
+            return checkpoint
+
+        if checkpoint.phase == PHASE_COPIED:
+            # 切换前再追平一次，缩小切换后需要追平的量；此后新集合开始接收已切换副本的写入
+            await self._catch_up(source, target)
+            checkpoint.switch_papers = dict(await asyncio.to_thread(self._paper_counts, target))
+            start = time.perf_counter()
+            await asyncio.to_thread(target.load)
+            logger.info(f"✓ Collection '{checkpoint.target}' loaded in {time.perf_counter() - start:.1f}s")
+            # 旧部署中源集合在切换时被改名，之后从改名后的集合追平
+            checkpoint.source = await asyncio.to_thread(self.milvus.switch_alias, checkpoint.target)
+            source = Collection(checkpoint.source)
+            checkpoint.phase = PHASE_SWITCHED
+            checkpoint.save(self.checkpoint_path)
+
+        if checkpoint.phase == PHASE_SWITCHED:
+            logger.info(f"Waiting {self.switch_grace_seconds:.0f}s for replicas to switch collections...")
+            await asyncio.sleep(self.switch_grace_seconds)
+            await self._catch_up_after_switch(source, target)
+            checkpoint.phase = PHASE_DONE
+            checkpoint.switch_papers = {}
+            checkpoint.save(self.checkpoint_path)
+            logger.info(
+                f"✓ Migration done: '{self.milvus.collection_name}' -> '{checkpoint.target}', "
+                f"previous collection '{checkpoint.source}' kept for rollback"
+            )
+        return checkpoint
+
+    async def _prepare(self) -> MigrationCheckpoint:
+        """读取检查点，或为新的迁移创建目标集合和检查点"""
+        checkpoint = MigrationCheckpoint.load(self.checkpoint_path)
+        if checkpoint is not None and checkpoint.phase != PHASE_DONE:
+            for name, value in (
+                ("target", self.target_name), ("embedding_model", self.embedding_model), ("dim", self.dim),
+                ("owners_file", self.owners_file)
+            ):
+                if value is not None and value != getattr(checkpoint, name):
+                    raise ValueError(
+                        f"Checkpoint {self.checkpoint_path} is for {name}={getattr(checkpoint, name)}, "
+                        f"got {value} (finish it or remove the checkpoint first)"
+                    )
+            if not await asyncio.to_thread(utility.has_collection, checkpoint.target):
+                raise RuntimeError(f"Target collection '{checkpoint.target}' of the checkpoint no longer exists")
+            self._resumed = checkpoint.phase == PHASE_COPY and checkpoint.last_pk >= 0
+            logger.info(
+                f"Resuming migration '{checkpoint.source}' -> '{checkpoint.target}' "
+                f"(phase={checkpoint.phase}, copied={checkpoint.copied}, last_pk={checkpoint.last_pk})"
+            )
+            return checkpoint
+
+        source = self.milvus.physical_name
+        source_model, source_dim = self.milvus.embedding_model, self.milvus.dim
+        model = self.embedding_model or source_model
+        dim = self.dim
+        if dim is not None:
+            # 指定维度时 text-embedding-3 系列通过 dimensions 参数生成低维向量
+            dimensions = dim if supports_dimensions(model) else None
+        elif model == source_model:
+            dim, dimensions = source_dim, self.milvus.embedding_dimensions
+        else:
+            dim, dimensions = await self._probe_dim(model), None
+        truncate = model == source_model and supports_dimensions(model) and dim < source_dim
+        target = self.target_name or f"{self.milvus.collection_name}_{datetime.now():%Y%m%d%H%M%S}"
+        if target in (source, self.milvus.collection_name):
+            raise ValueError(f"Target collection name '{target}' is already in use")
+        if await asyncio.to_thread(utility.has_collection, target):
+            raise ValueError(f"Target collection '{target}' already exists")
+        if not self.milvus.partitioned:
+            # 旧集合迁移为分区集合，需要每篇论文的所属用户
+            if self.owners_file is None:
+                raise ValueError(
+                    f"Collection '{source}' has no user_id field, pass the paper owners file (--owners) "
+                    f"to migrate it to a per-user partitioned collection"
+                )
+            load_owners(self.owners_file)
+
+        checkpoint = MigrationCheckpoint(
+            source=source,
+            target=target,
+            embedding_model=model,
+            dim=dim,
+            partitioned=True,
+            reembed=not truncate and (model, dim) != (source_model, source_dim),
+            truncate=truncate,
+            dimensions=dimensions,
+            source_partitioned=self.milvus.partitioned,
+            owners_file=None if self.milvus.partitioned else self.owners_file
+        )
+        await asyncio.to_thread(
+            self.milvus.create_physical, target, dim, model, checkpoint.partitioned, True, dimensions
+        )
+        checkpoint.save(self.checkpoint_path)
+        action = "re-embedding" if checkpoint.reembed else "truncating vectors" if truncate else "copying vectors"
+        logger.info(
+            f"Migrating '{source}' ({source_model}, dim={source_dim}) -> '{target}' ({model}, dim={dim}), {action}"
+        )
+        return checkpoint
+
+    async def _probe_dim(self, model: str) -> int:
+        await self.limiter.acquire()
+        embeddings = await self.openai.generate_embeddings(["dimension probe"], model)
+        return len(embeddings[0])
+
+    # ==================== 复制 ====================
+
+    def _output_fields(self) -> List[str]:
+        fields = ["id"] + COPY_FIELDS
+        if self.checkpoint.source_partitioned:
+            fields.append("user_id")
+        if self.checkpoint.reembed:
+            fields.remove("embedding")
+        return fields
+
+    async def _copy(self, source: Collection, target: Collection):
+        """按主键顺序复制检查点之后的 chunk，每 concurrency 个批次并发处理一次并写检查点"""
+        checkpoint = self.checkpoint
+        iterator = await asyncio.to_thread(
+            source.query_iterator,
+            batch_size=self.batch_size,
+            expr=f"id > {checkpoint.last_pk}",
+            output_fields=self._output_fields()
+        )
+        start = time.perf_counter()
+        copied_before = checkpoint.copied
+        try:
+            while True:
+                window = []
+                while len(window) < self.concurrency:
+                    batch = await asyncio.to_thread(iterator.next)
+                    if not batch:
+                        break
+                    window.append(batch)
+                if not window:
+                    break
+
+                if self._resumed:
+                    # 上次中断时这组批次可能已部分写入新集合
+                    await self._delete_chunks(target, [row["chunk_id"] for batch in window for row in batch])
+                    self._resumed = False
+
+                rows = await self._write(target, window)
+                checkpoint.last_pk = max(row["id"] for batch in window for row in batch)
+                checkpoint.copied += rows
+                checkpoint.save(self.checkpoint_path)
+
+                elapsed = time.perf_counter() - start
+                logger.info(
+                    f"Copied {checkpoint.copied} chunks (last_pk={checkpoint.last_pk}, "
+                    f"{(checkpoint.copied - copied_before) / elapsed if elapsed else 0:.0f} chunks/s)"
+                )
+        finally:
+            iterator.close()
+
+    async def _write(self, target: Collection, batches: List[List[Dict[str, Any]]]) -> int:
+        """并发生成各批次的 embedding（需要时）后写入新集合，返回写入的行数"""
+        if self.checkpoint.reembed:
+            embeddings = await asyncio.gather(*(self._embed(batch) for batch in batches))
+            for batch, vectors in zip(batches, embeddings):
+                for row, vector in zip(batch, vectors):
+                    row["embedding"] = vector
+            self.checkpoint.reembedded += sum(len(batch) for batch in batches)
+
+        rows = [row for batch in batches for row in batch]
+        if not self.checkpoint.source_partitioned:
+            rows = self._assign_owners(rows)
+        if not rows:
+            return 0
+        if self.checkpoint.truncate:
+            vectors = truncate_embeddings([row["embedding"] for row in rows], self.checkpoint.dim)
+            for row, vector in zip(rows, vectors):
+                row["embedding"] = vector.tolist()
+        fields = COPY_FIELDS + (["user_id"] if self.checkpoint.partitioned else [])
+        columns = [[row[name] for row in rows] for name in fields]
+        await asyncio.to_thread(target.insert, columns)
+        return len(rows)
+
+    def _assign_owners(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """按 owners 填写旧集合 chunk 的 user_id，丢弃没有所属用户的论文的 chunk"""
+        owned = []
+        for row in rows:
+            user_id = self.owners.get(row["paper_id"])
+            if user_id is None:
+                if row["paper_id"] not in self._unowned:
+                    self._unowned.add(row["paper_id"])
+                    logger.warning(f"Paper '{row['paper_id']}' has no owner in {self.checkpoint.owners_file}, skipped")
+                continue
+            row["user_id"] = user_id
+            owned.append(row)
+        return owned
+
+    async def _embed(self, batch: List[Dict[str, Any]]) -> List[List[float]]:
+        await self.limiter.acquire()
+        embeddings = await self.openai.generate_embeddings(
+            [row["content"] for row in batch], self.checkpoint.embedding_model, self.checkpoint.dimensions
+        )
+        if embeddings and len(embeddings[0]) != self.checkpoint.dim:
+            raise ValueError(
+                f"{self.checkpoint.embedding_model} returned {len(embeddings[0])}-dim embeddings, "
+                f"target collection expects {self.checkpoint.dim}"
+            )
+        return embeddings
+
+    # ==================== 增量追平 ====================
+
+    async def _catch_up(self, source: Collection, target: Collection):
+        """
+        切换前追平复制开始后源集合的变更（新集合只由迁移写入）：主键大于检查点的论文（新索引/重新索引）
+        和两个集合中 chunk 数不同的论文（已删除，或复制期间重新索引），在新集合中整篇删除后从源集合整篇复制
+        """
+        checkpoint = self.checkpoint
+        new_papers, last_pk = await asyncio.to_thread(self._new_papers, source)
+        source_counts = await asyncio.to_thread(self._source_counts, source)
+        target_counts = await asyncio.to_thread(self._paper_counts, target)
+        changed = {paper for paper, count in target_counts.items() if source_counts.get(paper) != count}
+        changed |= new_papers
+
+        await self._delete_papers(target, changed & target_counts.keys())
+        copied = await self._copy_papers(source, target, changed & source_counts.keys())
+
+        checkpoint.last_pk = last_pk
+        checkpoint.caught_up_papers += len(changed)
+        checkpoint.save(self.checkpoint_path)
+        if changed:
+            deleted = len(target_counts.keys() - source_counts.keys())
+            logger.info(
+                f"✓ Caught up {len(changed) - deleted} changed and {deleted} deleted papers ({copied} chunks copied)"
+            )
+
+    async def _catch_up_after_switch(self, source: Collection, target: Collection):
+        """
+        切换后追平仍写入旧集合的变更（新集合此时也接收已切换副本的写入）：
+        - 旧集合中主键大于检查点的论文（未切换的副本新索引/重新索引）在新集合中整篇替换
+        - 切换时存在、之后从旧集合删除的论文在新集合中删除
+        只处理新集合中 chunk 数与切换时相同的论文；切换后在新集合中索引/删除过的论文以新集合为准
+        """
+        checkpoint = self.checkpoint
+        snapshot = checkpoint.switch_papers
+        new_papers, last_pk = await asyncio.to_thread(self._new_papers, source)
+        source_counts = await asyncio.to_thread(self._source_counts, source)
+        target_counts = await asyncio.to_thread(self._paper_counts, target)
+
+        def untouched(paper: str) -> bool:
+            return target_counts.get(paper) == snapshot.get(paper)
+
+        deleted = {paper for paper in snapshot if paper not in source_counts and untouched(paper)}
+        replaced = {paper for paper in new_papers if untouched(paper)}
+        conflicts = new_papers - replaced
+        if conflicts:
+            logger.warning(
+                f"{len(conflicts)} papers were written to both collections after the switch, "
+                f"keeping the '{checkpoint.target}' version: {sorted(conflicts)[:10]}"
+            )
+
+        await self._delete_papers(target, (deleted | replaced) & target_counts.keys())
+        copied = await self._copy_papers(source, target, replaced & source_counts.keys())
+
+        checkpoint.last_pk = last_pk
+        checkpoint.caught_up_papers += len(deleted | replaced)
+        checkpoint.save(self.checkpoint_path)
+        if deleted or replaced:
+            logger.info(
+                f"✓ Caught up {len(replaced)} changed and {len(deleted)} deleted papers after the switch "
+                f"({copied} chunks copied)"
+            )
+
+    def _new_papers(self, source: Collection):
+        """源集合中主键大于检查点的论文和其中的最大主键"""
+        new_papers: Set[str] = set()
+        last_pk = self.checkpoint.last_pk
+        for batch in self._scan(source, f"id > {self.checkpoint.last_pk}", ["id", "paper_id"]):
+            for row in batch:
+                new_papers.add(row["paper_id"])
+                last_pk = max(last_pk, row["id"])
+        return self._owned(new_papers), last_pk
+
+    async def _delete_papers(self, target: Collection, papers: Set[str]):
+        papers = sorted(papers)
+        for i in range(0, len(papers), _PAPERS_PER_EXPR):
+            expr = f"paper_id in {json.dumps(papers[i:i + _PAPERS_PER_EXPR])}"
+            await asyncio.to_thread(target.delete, expr)
+
+    async def _copy_papers(self, source: Collection, target: Collection, papers: Set[str]) -> int:
+        """从源集合整篇复制论文，返回复制的 chunk 数"""
+        papers = sorted(papers)
+        copied = 0
+        for i in range(0, len(papers), _PAPERS_PER_EXPR):
+            expr = f"paper_id in {json.dumps(papers[i:i + _PAPERS_PER_EXPR])}"
+            batches = await asyncio.to_thread(self._scan, source, expr, self._output_fields())
+            for start in range(0, len(batches), self.concurrency):
+                copied += await self._write(target, batches[start:start + self.concurrency])
+        return copied
+
+    def _scan(self, collection: Collection, expr: str, output_fields: List[str]) -> List[List[Dict[str, Any]]]:
+        iterator = collection.query_iterator(batch_size=self.batch_size, expr=expr, output_fields=output_fields)
+        batches = []
+        try:
+            while True:
+                batch = iterator.next()
+                if not batch:
+                    break
+                batches.append(batch)
+        finally:
+            iterator.close()
+        return batches
+
+    def _paper_counts(self, collection: Collection) -> Counter:
+        """论文 -> chunk 数"""
+        return Counter(row["paper_id"] for batch in self._scan(collection, "id >= 0", ["paper_id"]) for row in batch)
+
+    def _source_counts(self, source: Collection) -> Counter:
+        """源集合中会复制到新集合的论文 -> chunk 数（旧集合中没有所属用户的论文不计入，避免每次追平都重新复制）"""
+        counts = self._paper_counts(source)
+        if self.checkpoint.source_partitioned:
+            return counts
+        return Counter({paper: count for paper, count in counts.items() if paper in self.owners})
+
+    def _owned(self, papers: Set[str]) -> Set[str]:
+        if self.checkpoint.source_partitioned:
+            return papers
+        return {paper for paper in papers if paper in self.owners}
+
+    async def _delete_chunks(self, target: Collection, chunk_ids: List[str]):
+        for i in range(0, len(chunk_ids), 500):
+            expr = f"chunk_id in {json.dumps(chunk_ids[i:i + 500])}"
+            await asyncio.to_thread(target.delete, expr)
+
+
+def load_owners(path: str) -> Dict[str, int]:
+    """读取论文所属用户文件（{paper_id: user_id}）"""
+    with open(path, encoding="utf-8") as f:
+        owners = json.load(f)
+    if not isinstance(owners, dict):
+        raise ValueError(f"Owners file {path} must be a JSON object of paper_id -> user_id")
+    return {str(paper): int(user_id) for paper, user_id in owners.items()}
+
+
+def describe_collection(name: str) -> Dict[str, Any]:
+    """集合的 embedding 模型、维度和行数（用于迁移前后核对）"""
+    collection = Collection(name)
+    model, dim = embedding_spec(collection.schema)
+    return {
+        "collection": name,
+        "embedding_model": model,
+        "dim": dim,
+        "dimensions": requested_dimensions(collection.schema),
+        "num_entities": collection.num_entities
+    }
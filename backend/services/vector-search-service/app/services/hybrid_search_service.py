@@ -2,20 +2,74 @@
 混合检索服务
 实现 Dense (Embedding) + Sparse (BM25) 检索融合
 使用 RRF (Reciprocal Rank Fusion) 算法
+
+Dense 与 Sparse 检索并发执行：阻塞的 Milvus 查询和 BM25 评分放到工作线程中，Reranker 推理经微批次队列
+在专用推理线程中执行，均不占用事件循环；stats["timings_ms"] 记录各阶段的耗时
+
+跨语言检索默认为推测模式：需要翻译的查询不等待翻译，先用原查询做 Dense 检索（Embedding 模型支持多语言），
+翻译在 HYBRID_TRANSLATION_BUDGET_MS 内返回时再用译文做 Dense + Sparse 检索，所有结果一起 RRF 融合；
+超时则不使用译文（翻译在后台完成，结果丢弃）
+
+检索结果缓存在进程内 LRU 中（HYBRID_RESULT_CACHE_SIZE / HYBRID_RESULT_CACHE_TTL），key 包含查询参数和
+BM25Service.index_version 给出的索引版本：论文的索引/删除、集合重建都会更新版本，已缓存的旧结果不再被命中。
+缓存只保存 final_results 和统计信息，命中时 dense/sparse/fused 结果为空列表
+
+批量检索（search_batch）让 N 个查询共享一次 Embedding 请求、一次多向量 Milvus 检索、
+一次 BM25 矩阵评分和同一组 Reranker 推理批次
+
+自适应重排序（rerank_mode="adaptive"）：各路检索的前几条完全一致时跳过 Cross-Encoder；否则只重排序
+RRF 分数接近第 top_k 名的头部候选，并按最近的单对推理耗时把重排序深度限制在延迟预算内。
+未重排序的候选按 RRF 顺序接在重排序结果之后，决策计数见 get_rerank_stats
+
+Dense 检索只返回 id 和分数（ID_OUTPUT_FIELDS），BM25 检索不补全正文；融合后只为参与重排序和可能返回的候选
+用一次 get_chunks 批量读取缺少的字段（正文、层级路径等），每个 chunk 的正文只读取一次
 """
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional
+import os
+import time
+from typing import List, Dict, Any, Optional, Tuple
 from collections import defaultdict
 
-from app.services.milvus_service import get_milvus_service
+from app.services.milvus_service import ID_OUTPUT_FIELDS, SEARCH_OUTPUT_FIELDS, get_milvus_service
 from app.services.bm25_service import get_bm25_service
 from app.services.reranker_service import get_reranker_service
 from app.services.openai_service import get_openai_service
+from app.utils.two_tier_cache import TwoTierCache, hash_key
 
 logger = logging.getLogger(__name__)
 
 # RRF 常数 k（通常设为 60）
 RRF_K = 60
+# 推测式跨语言检索：不等待翻译，先用原查询检索
+HYBRID_SPECULATIVE_TRANSLATION = os.getenv("HYBRID_SPECULATIVE_TRANSLATION", "true").lower() == "true"
+# 推测模式下等待翻译的最长时间（毫秒），超时则只用原查询的结果
+HYBRID_TRANSLATION_BUDGET_MS = int(os.getenv("HYBRID_TRANSLATION_BUDGET_MS", "1500"))
+# 检索结果缓存：进程内 LRU 条数（0 表示不缓存）与有效期（秒）
+HYBRID_RESULT_CACHE_SIZE = int(os.getenv("HYBRID_RESULT_CACHE_SIZE", "512"))
+HYBRID_RESULT_CACHE_TTL = int(os.getenv("HYBRID_RESULT_CACHE_TTL", "600"))
+# 重排序模式：full（重排序全部融合候选）/ adaptive（按两路一致性和 RRF 分差决定重排序深度）
+HYBRID_RERANK_MODE = os.getenv("HYBRID_RERANK_MODE", "full")
+# adaptive：各路检索的前 N 条（顺序相同）完全一致时跳过重排序
+HYBRID_RERANK_AGREEMENT_DEPTH = int(os.getenv("HYBRID_RERANK_AGREEMENT_DEPTH", "3"))
+# adaptive：RRF 分数低于第 top_k 名 (1 - margin) 倍的候选不参与重排序
+HYBRID_RERANK_MARGIN = float(os.getenv("HYBRID_RERANK_MARGIN", "0.1"))
+# adaptive：单次检索的重排序延迟预算（毫秒，0 表示不限制）
+HYBRID_RERANK_BUDGET_MS = float(os.getenv("HYBRID_RERANK_BUDGET_MS", "0"))
+
+RERANK_MODES = ("full", "adaptive")
+# 重排序决策
+RERANK_FULL = "full"
+RERANK_TRUNCATED = "truncated"
+RERANK_SKIPPED_AGREEMENT = "skipped_agreement"
+RERANK_SKIPPED_BUDGET = "skipped_budget"
+
+# 补全字段时 chunk 不存在（已删除）或读取失败的默认值（其余字段为 ""）
+_HYDRATE_DEFAULTS = {"chunk_index": 0, "chunk_chars": 0}
+
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 2)
 
 
 class HybridSearchService:
@@ -26,6 +80,20 @@ class HybridSearchService:
         self.bm25_service = None
         self.reranker_service = None
         self.openai_service = None
+        # 超出预算后仍在后台完成的翻译任务（防止被垃圾回收）
+        self._background_tasks = set()
+        # 索引版本只在进程内有意义，结果缓存不经过 Redis
+        self.result_cache = TwoTierCache(
+            namespace="hybrid:v1",
+            max_size=HYBRID_RESULT_CACHE_SIZE,
+            ttl=HYBRID_RESULT_CACHE_TTL,
+            redis_url=""
+        )
+        # 自适应重排序的决策计数（每个查询一次）与跳过的 (query, document) 对数
+        self.rerank_decisions: Dict[str, int] = dict.fromkeys(
+            (RERANK_FULL, RERANK_TRUNCATED, RERANK_SKIPPED_AGREEMENT, RERANK_SKIPPED_BUDGET), 0
+        )
+        self.rerank_pairs = {"reranked": 0, "skipped": 0}
     
     def _get_services(self):
         """延迟获取服务实例"""
@@ -83,6 +151,233 @@ class HybridSearchService:
         
         return results
     
+    @staticmethod
+    def _ensure_chunk_ids(result_lists: List[List[Dict[str, Any]]]):
+        """为结果添加 chunk_id（如果没有），RRF 以 chunk_id 标识文档"""
+        for result_list in result_lists:
+            for doc in result_list:
+                if 'chunk_id' not in doc or not doc['chunk_id']:
+                    doc['chunk_id'] = f"{doc.get('paper_id', '')}#{doc.get('chunk_index', 0)}"
+    
+    async def _dense_search_batch(
+        self,
+        queries: List[str],
+        initial_k: int,
+        paper_id: Optional[str],
+        user_id: Optional[int],
+        timings: Dict[str, float],
+        label: str = ""
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Dense 检索：用当前集合的 embedding 模型一次生成所有查询向量，在 Milvus 工作线程中做一次多向量查询
+        （label 为耗时统计的前缀）
+        """
+        start = time.perf_counter()
+        query_embeddings = await self.openai_service.embed_queries(
+            queries, self.milvus_service.embedding_model, self.milvus_service.embedding_dimensions
+        )
+        timings[f"{label}embedding"] = _elapsed_ms(start)
+        
+        filter_expr = f'paper_id == "{paper_id}"' if paper_id else None
+        
+        start = time.perf_counter()
+        dense_results_raw = await self.milvus_service.search_similar_async(
+            query_vectors=query_embeddings,
+            top_k=initial_k,
+            filter_expr=filter_expr,
+            user_id=user_id,
+            output_fields=ID_OUTPUT_FIELDS
+        )
+        timings[f"{label}dense_search"] = _elapsed_ms(start)
+        return dense_results_raw or [[] for _ in queries]
+    
+    async def _dense_search(
+        self,
+        query: str,
+        initial_k: int,
+        paper_id: Optional[str],
+        user_id: Optional[int],
+        timings: Dict[str, float],
+        label: str = ""
+    ) -> List[Dict[str, Any]]:
+        """Dense 检索（单个查询）"""
+        dense_results = await self._dense_search_batch([query], initial_k, paper_id, user_id, timings, label)
+        return dense_results[0]
+    
+    async def _sparse_search(
+        self,
+        query: str,
+        initial_k: int,
+        paper_id: Optional[str],
+        user_id: Optional[int],
+        timings: Dict[str, float]
+    ) -> List[Dict[str, Any]]:
+        """Sparse 检索：在工作线程中执行 BM25 评分（不补全正文）"""
+        start = time.perf_counter()
+        sparse_results = await asyncio.to_thread(
+            self.bm25_service.search,
+            query=query,
+            top_k=initial_k,
+            paper_id=paper_id,
+            user_id=user_id,
+            hydrate=False
+        )
+        timings["sparse_search"] = _elapsed_ms(start)
+        return sparse_results
+    
+    async def _sparse_search_batch(
+        self,
+        queries: List[str],
+        initial_k: int,
+        paper_id: Optional[str],
+        user_id: Optional[int],
+        timings: Dict[str, float]
+    ) -> List[List[Dict[str, Any]]]:
+        """批量 Sparse 检索：在工作线程中对所有查询做一次 BM25 矩阵评分（不补全正文）"""
+        start = time.perf_counter()
+        sparse_results = await asyncio.to_thread(
+            self.bm25_service.search_batch,
+            queries=queries,
+            top_k=initial_k,
+            paper_id=paper_id,
+            user_id=user_id,
+            hydrate=False
+        )
+        timings["sparse_search"] = _elapsed_ms(start)
+        return sparse_results
+    
+    async def _hydrate(self, docs: List[Dict[str, Any]], timings: Dict[str, float], failed_stages: List[str]):
+        """
+        为融合后保留下来的候选补全缺少的字段（Dense 结果只有 id 和分数，BM25 结果没有正文）：
+        Dense 命中按主键读取（chunk_id 不保证唯一），只有 BM25 命中的按 chunk_id 读取；
+        找不到的 chunk（已删除）或读取失败时字段取默认值（"" / 0）
+        """
+        pending = [doc for doc in docs if any(field not in doc for field in SEARCH_OUTPUT_FIELDS)]
+        if not pending:
+            return
+        fields = [field for field in SEARCH_OUTPUT_FIELDS if any(field not in doc for doc in pending)]
+        by_id = [doc for doc in pending if doc.get("id") is not None]
+        by_chunk_id = [doc for doc in pending if doc.get("id") is None]
+        start = time.perf_counter()
+        try:
+            rows_by_id, rows_by_chunk_id = await asyncio.gather(
+                self.milvus_service.get_chunks_async([doc["id"] for doc in by_id], fields, key_field="id"),
+                self.milvus_service.get_chunks_async([doc["chunk_id"] for doc in by_chunk_id], fields)
+            )
+        except Exception as e:
+            logger.error(f"Chunk hydration failed: {e}")
+            failed_stages.append("Chunk hydration")
+            rows_by_id, rows_by_chunk_id = {}, {}
+        for doc in pending:
+            if doc.get("id") is not None:
+                chunk = rows_by_id.get(doc["id"], {})
+            else:
+                chunk = rows_by_chunk_id.get(doc["chunk_id"], {})
+            for field in fields:
+                if field not in doc:
+                    value = chunk.get(field)
+                    doc[field] = value if value is not None else _HYDRATE_DEFAULTS.get(field, "")
+        timings["hydrate"] = _elapsed_ms(start)
+    
+    @staticmethod
+    def _outcome(name: str, outcome, stats: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """gather(return_exceptions=True) 的单路结果：失败时记录日志和 stats["failed_stages"]，返回空列表"""
+        if isinstance(outcome, BaseException):
+            logger.error(f"{name} failed: {outcome}")
+            stats["failed_stages"].append(name)
+            return []
+        return outcome
+    
+    async def _retrieve(
+        self,
+        query: str,
+        initial_k: int,
+        paper_id: Optional[str],
+        user_id: Optional[int],
+        stats: Dict[str, Any]
+    ):
+        """Dense 与 Sparse 并发检索，单路失败时用另一路的结果继续"""
+        timings = stats["timings_ms"]
+        start = time.perf_counter()
+        dense_outcome, sparse_outcome = await asyncio.gather(
+            self._dense_search(query, initial_k, paper_id, user_id, timings),
+            self._sparse_search(query, initial_k, paper_id, user_id, timings),
+            return_exceptions=True
+        )
+        timings["retrieval"] = _elapsed_ms(start)
+        return (
+            self._outcome("Dense search", dense_outcome, stats),
+            self._outcome("Sparse search", sparse_outcome, stats)
+        )
+    
+    async def _speculative_retrieve(
+        self,
+        query: str,
+        initial_k: int,
+        paper_id: Optional[str],
+        user_id: Optional[int],
+        results: Dict[str, Any],
+        budget_ms: int
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        推测式跨语言检索：原查询的 Dense 检索与翻译同时开始
+        
+        翻译在预算内返回时，用译文做 Dense + Sparse 检索（与原查询 Dense 检索并发）；
+        否则 Sparse 检索使用原查询。返回待 RRF 融合的结果列表
+        """
+        timings = results["stats"]["timings_ms"]
+        start = time.perf_counter()
+        translation = asyncio.ensure_future(
+            self.openai_service.translate_query(query, target_language='en')
+        )
+        original_dense = asyncio.ensure_future(
+            self._dense_search(query, initial_k, paper_id, user_id, timings, label="original_")
+        )
+        
+        translated, was_translated = query, False
+        try:
+            translated, was_translated = await asyncio.wait_for(
+                asyncio.shield(translation), timeout=budget_ms / 1000
+            )
+        except asyncio.TimeoutError:
+            results["stats"]["translation_timed_out"] = True
+            logger.warning(f"Query translation exceeded {budget_ms}ms budget, continuing with original query")
+            self._background_tasks.add(translation)
+            translation.add_done_callback(self._background_tasks.discard)
+        except Exception as e:
+            logger.error(f"Query translation failed: {e}")
+            results["stats"]["failed_stages"].append("Query translation")
+        timings["translate"] = _elapsed_ms(start)
+        
+        if was_translated:
+            results["translated_query"] = translated
+            results["query_translated"] = True
+            logger.info(f"Query translated: '{query}' -> '{translated}'")
+            (dense_results, sparse_results), original_outcome = await asyncio.gather(
+                self._retrieve(translated, initial_k, paper_id, user_id, results["stats"]),
+                original_dense,
+                return_exceptions=True
+            )
+            original_results = self._outcome("Original-query dense search", original_outcome, results["stats"])
+            results["dense_original_results"] = original_results
+            results["stats"]["dense_original_count"] = len(original_results)
+            result_lists = [dense_results, original_results, sparse_results]
+        else:
+            # 没有译文：原查询的 Dense 结果即为 Dense 结果，Sparse 也使用原查询
+            dense_outcome, sparse_outcome = await asyncio.gather(
+                original_dense,
+                self._sparse_search(query, initial_k, paper_id, user_id, timings),
+                return_exceptions=True
+            )
+            dense_results = self._outcome("Dense search", dense_outcome, results["stats"])
+            sparse_results = self._outcome("Sparse search", sparse_outcome, results["stats"])
+            result_lists = [dense_results, sparse_results]
+        timings["retrieval"] = _elapsed_ms(start)
+        
+        results["dense_results"] = dense_results
+        results["sparse_results"] = sparse_results
+        return result_lists
+    
     async def search(
         self,
         query: str,
@@ -92,17 +387,23 @@ class HybridSearchService:
         dense_weight: float = 0.5,
         sparse_weight: float = 0.5,
         initial_k: int = 20,
-        translate_query: bool = True
+        translate_query: bool = True,
+        user_id: Optional[int] = None,
+        speculative: bool = HYBRID_SPECULATIVE_TRANSLATION,
+        translation_budget_ms: Optional[int] = None,
+        use_cache: bool = True,
+        rerank_mode: Optional[str] = None,
+        rerank_budget_ms: Optional[float] = None
     ) -> Dict[str, Any]:
         """
         混合检索
         
         流程:
-        1. Query Translation (可选) → 翻译中文查询为英文
+        1. Query Translation (可选) → 翻译中文查询为英文（推测模式下与原查询 Dense 检索并发）
         2. Dense Search (Embedding + Milvus) → Top-initial_k
-        3. Sparse Search (BM25) → Top-initial_k (使用翻译后查询)
-        4. RRF Fusion → 融合结果
-        5. Reranker (可选) → 重排序
+        3. Sparse Search (BM25) → Top-initial_k (使用翻译后查询，与 2 并发执行)
+        4. RRF Fusion → 融合结果，只为参与重排序和可能返回的候选批量补全正文
+        5. Reranker (可选) → 重排序（adaptive 模式下可能只重排序头部或跳过）
         6. 返回 Top-top_k
         
         Args:
@@ -114,12 +415,99 @@ class HybridSearchService:
             sparse_weight: 稀疏检索权重
             initial_k: 初始检索数量
             translate_query: 是否启用查询翻译（跨语言检索）
+            user_id: 只检索该用户的论文（Milvus 分区 + BM25 用户分片）
+            speculative: 推测式跨语言检索（不等待翻译，先用原查询检索）
+            translation_budget_ms: 推测模式下等待翻译的最长时间（默认 HYBRID_TRANSLATION_BUDGET_MS）
+            use_cache: 是否使用检索结果缓存
+            rerank_mode: 重排序模式 full / adaptive（默认 HYBRID_RERANK_MODE）
+            rerank_budget_ms: adaptive 模式下的重排序延迟预算（默认 HYBRID_RERANK_BUDGET_MS，0 表示不限制）
             
         Returns:
-            检索结果和统计信息
+            检索结果和统计信息（stats["cache_hit"] 表示是否命中结果缓存，
+            stats["rerank_decision"] / stats["rerank_depth"] 为重排序决策和参与重排序的候选数）
         """
         self._get_services()
+        if translation_budget_ms is None:
+            translation_budget_ms = HYBRID_TRANSLATION_BUDGET_MS
+        rerank_mode = rerank_mode or HYBRID_RERANK_MODE
+        if rerank_mode not in RERANK_MODES:
+            raise ValueError(f"Unknown rerank mode: {rerank_mode} (expected one of {', '.join(RERANK_MODES)})")
+        if rerank_budget_ms is None:
+            rerank_budget_ms = HYBRID_RERANK_BUDGET_MS
+        
+        async def run():
+            return await self._search(
+                query, top_k, paper_id, use_reranker, initial_k,
+                translate_query, user_id, speculative, translation_budget_ms,
+                rerank_mode, rerank_budget_ms
+            )
         
+        if not use_cache or HYBRID_RESULT_CACHE_SIZE <= 0:
+            return await run()
+        
+        start = time.perf_counter()
+        # 版本在检索开始前读取：检索期间发生的变更会更新版本，本次结果不会被之后的查询命中
+        key = hash_key(
+            query, str(paper_id), str(user_id), str(top_k), str(use_reranker), str(initial_k),
+            str(translate_query), str(speculative), str(translation_budget_ms),
+            rerank_mode, str(rerank_budget_ms),
+            # 集合迁移切换后（物理集合变化）不命中切换前的结果
+            str(self.milvus_service.physical_name),
+            self.bm25_service.index_version(paper_id, user_id)
+        )
+        fresh = None
+        
+        async def load():
+            nonlocal fresh
+            fresh = await run()
+            return self._compact(fresh)
+        
+        cached = await self.result_cache.get_or_load(key, load, should_store=self._cacheable)
+        if fresh is not None:
+            return fresh
+        
+        # 命中缓存（或合并到相同的进行中查询）：返回副本，调用方修改结果不影响缓存
+        hit = self._compact(cached)
+        hit["stats"]["cache_hit"] = True
+        hit["stats"]["timings_ms"] = {"total": _elapsed_ms(start)}
+        return hit
+    
+    @staticmethod
+    def _compact(results: Dict[str, Any]) -> Dict[str, Any]:
+        """缓存中保存的结果：只保留 final_results 和统计信息（文档和统计均为副本）"""
+        compact = {
+            **results,
+            "dense_results": [],
+            "sparse_results": [],
+            "fused_results": [],
+            "final_results": [doc.copy() for doc in results["final_results"]],
+            "stats": {**results["stats"], "timings_ms": dict(results["stats"]["timings_ms"])}
+        }
+        if "dense_original_results" in compact:
+            compact["dense_original_results"] = []
+        return compact
+    
+    @staticmethod
+    def _cacheable(results: Dict[str, Any]) -> bool:
+        """检索阶段失败或翻译超时的降级结果不缓存"""
+        stats = results["stats"]
+        return not stats["failed_stages"] and not stats["translation_timed_out"]
+    
+    async def _search(
+        self,
+        query: str,
+        top_k: int,
+        paper_id: Optional[str],
+        use_reranker: bool,
+        initial_k: int,
+        translate_query: bool,
+        user_id: Optional[int],
+        speculative: bool,
+        translation_budget_ms: int,
+        rerank_mode: str = "full",
+        rerank_budget_ms: float = 0
+    ) -> Dict[str, Any]:
+        """执行一次完整的混合检索（不经过结果缓存）"""
         results = {
             "query": query,
             "translated_query": None,
@@ -132,20 +520,38 @@ class HybridSearchService:
                 "dense_count": 0,
                 "sparse_count": 0,
                 "fused_count": 0,
-                "final_count": 0
+                "final_count": 0,
+                "speculative": False,
+                "translation_timed_out": False,
+                "cache_hit": False,
+                "rerank_decision": None,
+                "rerank_depth": 0,
+                "failed_stages": [],
+                "timings_ms": {}
             }
         }
+        timings = results["stats"]["timings_ms"]
+        total_start = time.perf_counter()
         
         try:
             # 0. Query Translation (跨语言检索)
-            search_query = query  # 统一的搜索查询
-            
+            need_translation = False
             if translate_query:
                 source_lang = self.openai_service.detect_language(query)
                 logger.info(f"Detected query language: {source_lang}")
-                
-                if source_lang in ['zh', 'mixed']:
-                    # 翻译中文查询为英文，统一用于 Dense 和 Sparse 检索
+                # 中文查询翻译为英文，统一用于 Dense 和 Sparse 检索
+                need_translation = source_lang in ['zh', 'mixed']
+            
+            if need_translation and speculative:
+                results["stats"]["speculative"] = True
+                # 0-2. 推测模式：原查询检索与翻译并发，译文在预算内返回时追加译文检索
+                result_lists = await self._speculative_retrieve(
+                    query, initial_k, paper_id, user_id, results, translation_budget_ms
+                )
+            else:
+                search_query = query  # 统一的搜索查询
+                if need_translation:
+                    start = time.perf_counter()
                     translated, was_translated = await self.openai_service.translate_query(
                         query, target_language='en'
                     )
@@ -154,66 +560,62 @@ class HybridSearchService:
                         results["translated_query"] = translated
                         results["query_translated"] = True
                         logger.info(f"Query translated: '{query}' -> '{translated}'")
+                    timings["translate"] = _elapsed_ms(start)
+                
+                # 1-2. Dense Search 与 Sparse Search 并发执行（均使用翻译后的查询）
+                logger.info(f"Performing dense and sparse search with query: '{search_query}'")
+                dense_results, sparse_results = await self._retrieve(
+                    search_query, initial_k, paper_id, user_id, results["stats"]
+                )
+                results["dense_results"] = dense_results
+                results["sparse_results"] = sparse_results
+                result_lists = [dense_results, sparse_results]
             
-            # 1. Dense Search (Embedding) - 使用翻译后的查询
-            logger.info(f"Performing dense search with query: '{search_query}'")
-            query_embeddings = await self.openai_service.generate_embeddings([search_query])
-            
-            filter_expr = f'paper_id == "{paper_id}"' if paper_id else None
-            
-            dense_results_raw = self.milvus_service.search_similar(
-                query_vectors=query_embeddings,
-                top_k=initial_k,
-                filter_expr=filter_expr
-            )
-            
-            dense_results = dense_results_raw[0] if dense_results_raw else []
-            results["dense_results"] = dense_results
-            results["stats"]["dense_count"] = len(dense_results)
-            logger.info(f"Dense search returned {len(dense_results)} results")
-            
-            # 2. Sparse Search (BM25) - 同样使用翻译后的查询
-            logger.info(f"Performing sparse search with query: '{search_query}'")
-            sparse_results = self.bm25_service.search(
-                query=search_query,
-                top_k=initial_k,
-                paper_id=paper_id
-            )
-            results["sparse_results"] = sparse_results
-            results["stats"]["sparse_count"] = len(sparse_results)
-            logger.info(f"Sparse search returned {len(sparse_results)} results")
+            results["stats"]["dense_count"] = len(results["dense_results"])
+            results["stats"]["sparse_count"] = len(results["sparse_results"])
+            logger.info(f"Dense search returned {results['stats']['dense_count']} results")
+            logger.info(f"Sparse search returned {results['stats']['sparse_count']} results")
             
             # 3. RRF Fusion
             logger.info("Fusing results with RRF...")
+            start = time.perf_counter()
             
-            # 为 dense results 添加 chunk_id（如果没有）
-            for doc in dense_results:
-                if 'chunk_id' not in doc or not doc['chunk_id']:
-                    doc['chunk_id'] = f"{doc.get('paper_id', '')}#{doc.get('chunk_index', 0)}"
-            
-            for doc in sparse_results:
-                if 'chunk_id' not in doc or not doc['chunk_id']:
-                    doc['chunk_id'] = f"{doc.get('paper_id', '')}#{doc.get('chunk_index', 0)}"
+            self._ensure_chunk_ids(result_lists)
             
             fused_results = self.reciprocal_rank_fusion(
-                result_lists=[dense_results, sparse_results],
+                result_lists=result_lists,
                 id_field="chunk_id"
             )
+            timings["fusion"] = _elapsed_ms(start)
             results["fused_results"] = fused_results
             results["stats"]["fused_count"] = len(fused_results)
             logger.info(f"RRF fusion produced {len(fused_results)} results")
             
             # 4. Reranker (可选)
             if use_reranker and fused_results:
-                logger.info("Reranking results...")
-                final_results = self.reranker_service.rerank(
+                depth, decision = self._plan_rerank(
+                    result_lists, fused_results, top_k, rerank_mode, rerank_budget_ms
+                )
+                results["stats"]["rerank_decision"] = decision
+                results["stats"]["rerank_depth"] = depth
+                logger.info(f"Reranking top {depth} of {len(fused_results)} results ({decision})")
+                # 只为参与重排序和可能返回的候选补全正文
+                await self._hydrate(fused_results[:max(depth, top_k)], timings, results["stats"]["failed_stages"])
+                start = time.perf_counter()
+                final_results = await self.reranker_service.rerank_async(
                     query=query,
-                    documents=fused_results,
+                    documents=fused_results[:depth],
                     top_k=top_k,
                     content_field="content"
-                )
+                ) if depth else []
+                final_results += fused_results[depth:depth + top_k - len(final_results)]
+                timings["rerank"] = _elapsed_ms(start)
+                if depth and self.reranker_service.model is None:
+                    # 模型尚未就绪，结果为 Fallback 排序（不缓存）
+                    results["stats"]["failed_stages"].append("Reranker")
             else:
                 final_results = fused_results[:top_k]
+                await self._hydrate(final_results, timings, results["stats"]["failed_stages"])
             
             results["final_results"] = final_results
             results["stats"]["final_count"] = len(final_results)
@@ -221,31 +623,262 @@ class HybridSearchService:
             
         except Exception as e:
             logger.error(f"Hybrid search failed: {e}")
+            results["stats"]["failed_stages"].append("Hybrid search")
             import traceback
             logger.error(traceback.format_exc())
-            
+        
+        timings["total"] = _elapsed_ms(total_start)
+        logger.info(f"Hybrid search timings (ms): {timings}")
         return results
     
-    def sync_bm25_index(self, paper_id: str, chunks: List[Dict[str, Any]]):
+    async def search_batch(
+        self,
+        queries: List[str],
+        top_k: int = 10,
+        paper_id: Optional[str] = None,
+        use_reranker: bool = True,
+        initial_k: int = 20,
+        translate_query: bool = True,
+        user_id: Optional[int] = None,
+        rerank_mode: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        批量混合检索
+        
+        流程与 search 相同，但各阶段对所有查询只执行一次：
+        1. Query Translation (可选) → 需要翻译的查询并发翻译（不使用推测模式）
+        2. Dense Search → 一次 Embedding 请求 + 一次多向量 Milvus 检索
+        3. Sparse Search → 每个 BM25 分片一次矩阵评分（与 2 并发执行）
+        4. RRF Fusion → 每个查询分别融合，所有查询保留下来的候选一次批量补全正文
+        5. Reranker (可选) → 所有 (query, doc) 对共享 Cross-Encoder 推理批次（adaptive 模式下按查询决定深度）
+        
+        结果不经过结果缓存；重排序延迟预算只用于单查询检索
+        
+        Args:
+            queries: 查询列表
+            top_k: 每个查询的最终返回数量
+            paper_id: 限定论文ID（可选，所有查询共用）
+            use_reranker: 是否使用 Reranker
+            initial_k: 初始检索数量
+            translate_query: 是否启用查询翻译（跨语言检索）
+            user_id: 只检索该用户的论文
+            rerank_mode: 重排序模式 full / adaptive（默认 HYBRID_RERANK_MODE）
+            
+        Returns:
+            {"results": 每个查询的结果（query / translated_query / query_translated / final_results / stats），
+             "stats": 各阶段耗时和吞吐量}
+        """
+        self._get_services()
+        rerank_mode = rerank_mode or HYBRID_RERANK_MODE
+        if rerank_mode not in RERANK_MODES:
+            raise ValueError(f"Unknown rerank mode: {rerank_mode} (expected one of {', '.join(RERANK_MODES)})")
+        
+        results = [
+            {
+                "query": query,
+                "translated_query": None,
+                "query_translated": False,
+                "final_results": [],
+                "stats": {
+                    "dense_count": 0, "sparse_count": 0, "fused_count": 0, "final_count": 0,
+                    "rerank_decision": None, "rerank_depth": 0
+                }
+            }
+            for query in queries
+        ]
+        stats = {"query_count": len(queries), "failed_stages": [], "timings_ms": {}}
+        timings = stats["timings_ms"]
+        total_start = time.perf_counter()
+        
+        try:
+            # 0. Query Translation (跨语言检索)
+            search_queries = list(queries)
+            if translate_query:
+                pending = [
+                    i for i, query in enumerate(queries)
+                    if self.openai_service.detect_language(query) in ['zh', 'mixed']
+                ]
+                if pending:
+                    start = time.perf_counter()
+                    outcomes = await asyncio.gather(
+                        *[self.openai_service.translate_query(queries[i], target_language='en') for i in pending],
+                        return_exceptions=True
+                    )
+                    for i, outcome in zip(pending, outcomes):
+                        if isinstance(outcome, BaseException):
+                            logger.error(f"Query translation failed: {outcome}")
+                            stats["failed_stages"].append("Query translation")
+                            continue
+                        translated, was_translated = outcome
+                        if was_translated:
+                            search_queries[i] = translated
+                            results[i]["translated_query"] = translated
+                            results[i]["query_translated"] = True
+                    timings["translate"] = _elapsed_ms(start)
+            
+            # 1-2. Dense Search 与 Sparse Search 并发执行
+            start = time.perf_counter()
+            dense_outcome, sparse_outcome = await asyncio.gather(
+                self._dense_search_batch(search_queries, initial_k, paper_id, user_id, timings),
+                self._sparse_search_batch(search_queries, initial_k, paper_id, user_id, timings),
+                return_exceptions=True
+            )
+            timings["retrieval"] = _elapsed_ms(start)
+            dense_lists = self._outcome("Dense search", dense_outcome, stats) or [[] for _ in queries]
+            sparse_lists = self._outcome("Sparse search", sparse_outcome, stats) or [[] for _ in queries]
+            
+            # 3. RRF Fusion（每个查询分别融合）
+            start = time.perf_counter()
+            fused_lists, depths = [], []
+            for result, dense_results, sparse_results in zip(results, dense_lists, sparse_lists):
+                self._ensure_chunk_ids([dense_results, sparse_results])
+                fused_results = self.reciprocal_rank_fusion([dense_results, sparse_results], id_field="chunk_id")
+                fused_lists.append(fused_results)
+                if use_reranker and fused_results:
+                    depth, decision = self._plan_rerank(
+                        [dense_results, sparse_results], fused_results, top_k, rerank_mode, 0
+                    )
+                    result["stats"]["rerank_decision"] = decision
+                    result["stats"]["rerank_depth"] = depth
+                else:
+                    depth = 0
+                depths.append(depth)
+                result["stats"]["dense_count"] = len(dense_results)
+                result["stats"]["sparse_count"] = len(sparse_results)
+                result["stats"]["fused_count"] = len(fused_results)
+            timings["fusion"] = _elapsed_ms(start)
+            
+            # 只为参与重排序和可能返回的候选补全正文（所有查询一次批量读取）
+            await self._hydrate(
+                [doc for fused, depth in zip(fused_lists, depths) for doc in fused[:max(depth, top_k)]],
+                timings,
+                stats["failed_stages"]
+            )
+            
+            # 4. Reranker（所有查询的文档对一起推理）
+            if use_reranker and any(depths):
+                start = time.perf_counter()
+                final_lists = await self.reranker_service.rerank_batch_async(
+                    queries=queries,
+                    document_lists=[fused[:depth] for fused, depth in zip(fused_lists, depths)],
+                    top_k=top_k,
+                    content_field="content"
+                )
+                final_lists = [
+                    final_results + fused[depth:depth + top_k - len(final_results)]
+                    for final_results, fused, depth in zip(final_lists, fused_lists, depths)
+                ]
+                timings["rerank"] = _elapsed_ms(start)
+                if self.reranker_service.model is None:
+                    stats["failed_stages"].append("Reranker")
+            else:
+                final_lists = [fused_results[:top_k] for fused_results in fused_lists]
+            
+            for result, final_results in zip(results, final_lists):
+                result["final_results"] = final_results
+                result["stats"]["final_count"] = len(final_results)
+            
+        except Exception as e:
+            logger.error(f"Hybrid batch search failed: {e}")
+            import traceback
+            logger.error(traceback.format_exc())
+            stats["failed_stages"].append("Hybrid batch search")
+        
+        timings["total"] = _elapsed_ms(total_start)
+        # 吞吐量：整批耗时均摊到每个查询
+        stats["per_query_ms"] = round(timings["total"] / len(queries), 2) if queries else 0.0
+        stats["queries_per_second"] = round(len(queries) / (timings["total"] / 1000), 2) if timings["total"] else 0.0
+        logger.info(f"Hybrid batch search of {len(queries)} queries, timings (ms): {timings}")
+        return {"results": results, "stats": stats}
+    
+    def _plan_rerank(
+        self,
+        result_lists: List[List[Dict[str, Any]]],
+        fused_results: List[Dict[str, Any]],
+        top_k: int,
+        rerank_mode: str,
+        budget_ms: float
+    ) -> Tuple[int, str]:
+        """
+        决定参与重排序的候选数（fused_results 的前 depth 个），并记录决策计数
+        
+        adaptive 模式:
+        - 各路检索（至少两路有结果）的前 HYBRID_RERANK_AGREEMENT_DEPTH 条完全一致 → 跳过
+        - RRF 分数低于第 top_k 名 (1 - HYBRID_RERANK_MARGIN) 倍的候选不参与重排序
+        - 按最近的单对推理耗时估算，预算内推理不了 2 对 → 跳过；否则深度不超过预算内可推理的对数
+        
+        Returns:
+            (depth, decision)
+        """
+        depth, decision = len(fused_results), RERANK_FULL
+        if rerank_mode == "adaptive":
+            agreement = min(HYBRID_RERANK_AGREEMENT_DEPTH, top_k)
+            heads = {
+                tuple(doc.get("chunk_id") for doc in results[:agreement])
+                for results in result_lists if results
+            }
+            non_empty = sum(1 for results in result_lists if results)
+            if agreement > 0 and non_empty >= 2 and len(heads) == 1 and len(next(iter(heads))) == agreement:
+                depth, decision = 0, RERANK_SKIPPED_AGREEMENT
+            else:
+                if len(fused_results) > top_k:
+                    # fused_results 按 RRF 分数降序，满足阈值的候选是一个前缀
+                    threshold = fused_results[top_k - 1]["rrf_score"] * (1 - HYBRID_RERANK_MARGIN)
+                    depth = sum(1 for doc in fused_results if doc["rrf_score"] >= threshold)
+                ms_per_pair = self.reranker_service.ms_per_pair() if budget_ms > 0 else None
+                if ms_per_pair:
+                    affordable = int(budget_ms / ms_per_pair)
+                    if affordable < 2:
+                        depth, decision = 0, RERANK_SKIPPED_BUDGET
+                    else:
+                        depth = min(depth, affordable)
+                if decision == RERANK_FULL and depth < len(fused_results):
+                    decision = RERANK_TRUNCATED
+        
+        self.rerank_decisions[decision] += 1
+        self.rerank_pairs["reranked"] += depth
+        self.rerank_pairs["skipped"] += len(fused_results) - depth
+        return depth, decision
+    
+    def get_rerank_stats(self) -> Dict[str, Any]:
+        """重排序决策统计：各决策的次数和比例、重排序/跳过的 (query, document) 对数"""
+        total = sum(self.rerank_decisions.values())
+        return {
+            "mode": HYBRID_RERANK_MODE,
+            "agreement_depth": HYBRID_RERANK_AGREEMENT_DEPTH,
+            "margin": HYBRID_RERANK_MARGIN,
+            "budget_ms": HYBRID_RERANK_BUDGET_MS,
+            "queries": total,
+            "decisions": dict(self.rerank_decisions),
+            "skip_rate": round(
+                (self.rerank_decisions[RERANK_SKIPPED_AGREEMENT] + self.rerank_decisions[RERANK_SKIPPED_BUDGET]) / total, 4
+            ) if total else 0.0,
+            "truncate_rate": round(self.rerank_decisions[RERANK_TRUNCATED] / total, 4) if total else 0.0,
+            "pairs": dict(self.rerank_pairs),
+        }
+    
+    def sync_bm25_index(self, paper_id: str, chunks: List[Dict[str, Any]], user_id: Optional[int] = None):
         """
         同步 BM25 索引（在索引论文时调用）
         
         Args:
             paper_id: 论文ID
             chunks: chunk 列表
+            user_id: 论文所属用户
         """
         self._get_services()
-        self.bm25_service.add_documents(paper_id, chunks)
+        self.bm25_service.add_documents(paper_id, chunks, user_id)
     
-    def remove_from_bm25_index(self, paper_id: str):
+    def remove_from_bm25_index(self, paper_id: str, user_id: Optional[int] = None):
         """
         从 BM25 索引中删除（在删除论文时调用）
         
         Args:
             paper_id: 论文ID
+            user_id: 论文所属用户
         """
         self._get_services()
-        self.bm25_service.remove_documents(paper_id)
+        self.bm25_service.remove_documents(paper_id, user_id)
 
 
 # 全局单例
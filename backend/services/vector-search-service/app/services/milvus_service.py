@@ -1,7 +1,37 @@
 """
 Milvus向量数据库服务
+
+集合以 user_id 作为分区键（partition key），按用户过滤的检索只扫描该用户所在的分区；
+旧集合没有 user_id 字段，无法区分 chunk 所属用户：按用户的检索/删除被拒绝（UserScopeError），
+直到用 migrate_collection.py --owners 迁移为分区集合
+
+集合只加载一次（ensure_loaded），集合重建或索引变更后重新加载；其他副本重建/释放集合后查询报未加载时，
+重新加载并重试一次。pymilvus 的调用都是阻塞的，异步接口（*_async）在有界的工作线程池中执行，
+各线程轮流绑定连接池（MILVUS_POOL_SIZE 个连接）中的一个连接，慢查询不会阻塞事件循环上的其他请求
+
+写入经 MilvusWriteBuffer 合并：多篇论文的行合并为一次 insert，不在每次写入后 flush（flush 会封存段，
+批量重建索引时产生大量小段）；flush 由后台按时间/累计行数执行，批量写入/删除结束后在空闲时触发 compaction
+
+向量索引类型（FLAT / IVF_FLAT / IVF_SQ8 / IVF_PQ / HNSW）和构建、检索参数可配置；检索参数按集合实际的索引选择，
+过滤条件只保留少量向量（如单篇论文）时使用单独的参数，避免 IVF 只扫描少数聚类列表而漏掉大部分命中。
+参数可以用 tune_index.py 在真实向量样本上按召回率和延迟选择
+
+MILVUS_COLLECTION 可以是物理集合，也可以是别名（集合迁移后，见 collection_migration）。服务绑定别名当前指向的
+物理集合，并定期检查别名是否已切换到新集合；集合描述中记录生成向量所用的 embedding 模型，
+查询向量和新写入的向量都使用当前集合的模型
 """
-from typing import List, Dict, Any, Optional
+import asyncio
+import functools
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Iterator, Tuple
 from pymilvus import (
     connections,
     Collection,
@@ -11,10 +41,464 @@ from pymilvus import (
     utility
 )
 import logging
-from app.database import MILVUS_HOST, MILVUS_PORT, MILVUS_COLLECTION
+from app.database import (
+    MILVUS_HOST,
+    MILVUS_PORT,
+    MILVUS_COLLECTION,
+    MILVUS_NUM_PARTITIONS,
+    MILVUS_EMBEDDING_DIM,
+    MILVUS_ALIAS_CHECK_SECONDS,
+    MILVUS_POOL_SIZE,
+    MILVUS_MAX_WORKERS
+)
 
 logger = logging.getLogger(__name__)
 
+# 写缓冲：每次 insert 的最大行数（单篇论文超过时单独写入）、等待其他论文加入同一批次的时间（毫秒）
+MILVUS_INSERT_BATCH_ROWS = int(os.getenv("MILVUS_INSERT_BATCH_ROWS", "5000"))
+MILVUS_INSERT_WAIT_MS = float(os.getenv("MILVUS_INSERT_WAIT_MS", "50"))
+# 后台 flush：有未 flush 的写入且距上次 flush 超过间隔（秒）或累计超过行数时执行
+MILVUS_FLUSH_INTERVAL_SECONDS = float(os.getenv("MILVUS_FLUSH_INTERVAL_SECONDS", "60"))
+MILVUS_FLUSH_ROWS = int(os.getenv("MILVUS_FLUSH_ROWS", "100000"))
+# compaction：累计插入 + 删除的行数达到阈值后，写入空闲超过指定秒数时触发（0 表示不自动触发）
+MILVUS_COMPACT_ROWS = int(os.getenv("MILVUS_COMPACT_ROWS", "20000"))
+MILVUS_COMPACT_IDLE_SECONDS = float(os.getenv("MILVUS_COMPACT_IDLE_SECONDS", "30"))
+
+# 向量索引类型（新建索引时生效；更换已有集合的索引类型用 migrate_collection.py 在线重建）
+MILVUS_INDEX_TYPE = os.getenv("MILVUS_INDEX_TYPE", "IVF_FLAT").upper()
+# 覆盖默认索引构建参数的 JSON（如 {"nlist": 4096}、{"M": 32, "efConstruction": 256}）
+MILVUS_INDEX_PARAMS = os.getenv("MILVUS_INDEX_PARAMS", "")
+# 覆盖默认检索参数的 JSON（如 {"nprobe": 32}、{"ef": 128}）；过滤条件只保留少量向量（单篇论文）时用 FILTERED 版本
+MILVUS_SEARCH_PARAMS = os.getenv("MILVUS_SEARCH_PARAMS", "")
+MILVUS_FILTERED_SEARCH_PARAMS = os.getenv("MILVUS_FILTERED_SEARCH_PARAMS", "")
+
+METRIC_TYPE = "L2"
+INDEX_TYPES = ("FLAT", "IVF_FLAT", "IVF_SQ8", "IVF_PQ", "HNSW")
+
+# search_similar 默认返回的标量字段（检索结果展示所需的全部字段）
+SEARCH_OUTPUT_FIELDS = [
+    "paper_id", "chunk_id", "chunk_index",
+    "title", "file_name", "content", "chunk_chars",
+    "page_range", "upload_time", "source"
+]
+# 只返回 id 和分数的精简投影：融合/重排序后再用 get_chunks 为保留下来的候选补全其余字段
+ID_OUTPUT_FIELDS = ["paper_id", "chunk_id"]
+
+class UserScopeError(RuntimeError):
+    """当前集合没有 user_id 分区键（旧集合），无法按用户隔离检索/删除"""
+
+
+# 写入吞吐统计的时间窗口（秒）
+_THROUGHPUT_WINDOW_SECONDS = 60
+
+# 集合描述中没有记录 embedding 模型时（旧集合）使用的模型
+DEFAULT_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+# 新建集合请求的 embedding 维度（text-embedding-3 系列的 dimensions 参数，如 512 / 768；0 表示模型原生维度）
+EMBEDDING_DIMENSIONS = int(os.getenv("OPENAI_EMBEDDING_DIMENSIONS", "0"))
+_EMBEDDING_MODEL_PATTERN = re.compile(r"embedding_model=([^\s,;)]+)")
+_DIMENSIONS_PATTERN = re.compile(r"dimensions=(\d+)")
+
+
+def build_schema(
+    dim: int,
+    embedding_model: str,
+    partitioned: bool = True,
+    dimensions: Optional[int] = None
+) -> CollectionSchema:
+    """
+    集合 schema（描述中记录 embedding 模型和请求的 dimensions 参数；
+    partitioned 为 False 时不含 user_id 分区键，用于迁移旧集合）
+    """
+    fields = [
+        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
+        FieldSchema(name="paper_id", dtype=DataType.VARCHAR, max_length=255),
+        FieldSchema(name="chunk_id", dtype=DataType.VARCHAR, max_length=300),
+        FieldSchema(name="chunk_index", dtype=DataType.INT64),
+        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=dim),
+        FieldSchema(name="title", dtype=DataType.VARCHAR, max_length=1000),
+        FieldSchema(name="file_name", dtype=DataType.VARCHAR, max_length=500),
+        FieldSchema(name="content", dtype=DataType.VARCHAR, max_length=65535),
+        FieldSchema(name="chunk_chars", dtype=DataType.INT64),
+        FieldSchema(name="page_range", dtype=DataType.VARCHAR, max_length=200),  # hierarchy_path 需要更长
+        FieldSchema(name="upload_time", dtype=DataType.VARCHAR, max_length=50),
+        FieldSchema(name="source", dtype=DataType.VARCHAR, max_length=100),
+    ]
+    if partitioned:
+        # 分区键：同一用户的 chunk 落在同一分区，按用户检索时只扫描该分区
+        fields.append(FieldSchema(name="user_id", dtype=DataType.INT64, is_partition_key=True))
+    return CollectionSchema(
+        fields=fields,
+        description=f"Research papers collection (embedding_model={embedding_model}"
+                    + (f", dimensions={dimensions})" if dimensions else ")")
+    )
+
+
+def _json_params(value: str, name: str) -> Dict[str, Any]:
+    if not value:
+        return {}
+    params = json.loads(value)
+    if not isinstance(params, dict):
+        raise ValueError(f"{name} must be a JSON object, got: {value}")
+    return params
+
+
+def pq_m(dim: int) -> int:
+    """IVF_PQ 的子向量数：不超过 dim / 8 的 dim 的最大约数（每个子向量至少 8 维）"""
+    return next(m for m in range(max(dim // 8, 1), 0, -1) if dim % m == 0)
+
+
+def build_index_params(
+    index_type: str = MILVUS_INDEX_TYPE,
+    dim: int = MILVUS_EMBEDDING_DIM,
+    overrides: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    索引构建参数（overrides 为 None 时，index_type 与 MILVUS_INDEX_TYPE 相同则使用 MILVUS_INDEX_PARAMS）
+    
+    默认：IVF_* nlist=1024，IVF_PQ m=pq_m(dim)、nbits=8；HNSW M=16、efConstruction=200
+    """
+    index_type = index_type.upper()
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {index_type} (expected one of {', '.join(INDEX_TYPES)})")
+    if index_type == "HNSW":
+        params = {"M": 16, "efConstruction": 200}
+    elif index_type.startswith("IVF"):
+        params = {"nlist": 1024}
+        if index_type == "IVF_PQ":
+            params.update(m=pq_m(dim), nbits=8)
+    else:
+        params = {}
+    if overrides is None and index_type == MILVUS_INDEX_TYPE:
+        overrides = _json_params(MILVUS_INDEX_PARAMS, "MILVUS_INDEX_PARAMS")
+    params.update(overrides or {})
+    return {"metric_type": METRIC_TYPE, "index_type": index_type, "params": params}
+
+
+def build_search_params(
+    index: Dict[str, Any],
+    top_k: int,
+    selective: bool = False,
+    overrides: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    检索参数（index 为 build_index_params / parse_index 的结果）
+    
+    默认：IVF_* nprobe=10，HNSW ef=64（不小于 top_k）。selective 表示过滤条件只保留少量向量（如单篇论文）：
+    IVF 只扫描 nprobe 个聚类列表时，命中的向量大多在未扫描的列表中，因此扫描全部 nlist 个列表
+    （被过滤掉的向量不计算距离）；HNSW 的 ef 放大 4 倍。
+    overrides 为 None 时，索引类型与 MILVUS_INDEX_TYPE 相同则使用 MILVUS_SEARCH_PARAMS / MILVUS_FILTERED_SEARCH_PARAMS
+    """
+    index_type = index["index_type"]
+    nlist = int(index["params"].get("nlist", 1024))
+    if index_type == "HNSW":
+        params = {"ef": 256 if selective else 64}
+    elif index_type.startswith("IVF"):
+        params = {"nprobe": nlist if selective else 10}
+    else:
+        params = {}
+    if overrides is None and index_type == MILVUS_INDEX_TYPE:
+        overrides = _json_params(
+            MILVUS_FILTERED_SEARCH_PARAMS if selective else MILVUS_SEARCH_PARAMS,
+            "MILVUS_FILTERED_SEARCH_PARAMS" if selective else "MILVUS_SEARCH_PARAMS"
+        )
+    params.update(overrides or {})
+    if "ef" in params:
+        params["ef"] = max(int(params["ef"]), top_k)
+    if "nprobe" in params:
+        params["nprobe"] = max(min(int(params["nprobe"]), nlist), 1)
+    return {"metric_type": index.get("metric_type", METRIC_TYPE), "params": params}
+
+
+def parse_index(params: Dict[str, Any]) -> Dict[str, Any]:
+    """把 Collection.indexes[i].params（不同版本为嵌套或展开的字符串值）整理为 build_index_params 的格式"""
+    params = dict(params)
+    nested = params.pop("params", None)
+    if isinstance(nested, str):
+        nested = json.loads(nested)
+    if isinstance(nested, dict):
+        params.update(nested)
+    index_type = str(params.pop("index_type", "")).upper()
+    metric_type = params.pop("metric_type", METRIC_TYPE)
+    params.pop("dim", None)
+    build = {key: int(value) if str(value).isdigit() else value for key, value in params.items()}
+    return {"metric_type": metric_type, "index_type": index_type, "params": build}
+
+
+def embedding_spec(schema: CollectionSchema) -> Tuple[str, Optional[int]]:
+    """集合的 embedding 模型和向量维度"""
+    match = _EMBEDDING_MODEL_PATTERN.search(schema.description or "")
+    dim = next((field.params.get("dim") for field in schema.fields if field.name == "embedding"), None)
+    return (match.group(1) if match else DEFAULT_EMBEDDING_MODEL), (int(dim) if dim is not None else None)
+
+
+def requested_dimensions(schema: CollectionSchema) -> Optional[int]:
+    """集合生成 embedding 时请求的 dimensions 参数（None 表示模型原生维度）"""
+    match = _DIMENSIONS_PATTERN.search(schema.description or "")
+    return int(match.group(1)) if match else None
+
+
+@dataclass
+class _InsertRequest:
+    """一篇论文待写入的行（按列组织）"""
+    columns: List[list]
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.perf_counter)
+    
+    @property
+    def rows(self) -> int:
+        return len(self.columns[0]) if self.columns else 0
+
+
+# 写缓冲的停止标记：排在它之前的请求都会被写入
+_STOP = object()
+
+
+class MilvusWriteBuffer:
+    """
+    跨论文的 Milvus 写缓冲
+    
+    后台任务取出第一篇论文的行后，在 max_wait_ms 内继续收集其他论文的行直到行数达到 batch_rows，
+    合并为一次 insert（在 Milvus 工作线程中执行）。insert 返回时数据已写入 Milvus（可以检索），但不 flush；
+    合并写入失败时逐篇重试，一篇论文的数据有问题不影响同批的其他论文
+    """
+    
+    def __init__(
+        self,
+        service: "MilvusService",
+        batch_rows: int = MILVUS_INSERT_BATCH_ROWS,
+        max_wait_ms: float = MILVUS_INSERT_WAIT_MS,
+        flush_interval: float = MILVUS_FLUSH_INTERVAL_SECONDS,
+        flush_rows: int = MILVUS_FLUSH_ROWS,
+        compact_rows: int = MILVUS_COMPACT_ROWS,
+        compact_idle: float = MILVUS_COMPACT_IDLE_SECONDS
+    ):
+        self.service = service
+        self.batch_rows = batch_rows
+        self.max_wait = max_wait_ms / 1000
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.compact_rows = compact_rows
+        self.compact_idle = compact_idle
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._carry: Optional[_InsertRequest] = None  # 放不进上一批、留给下一批的请求
+        self._stopping = False  # 已从队列取到停止标记
+        
+        self.unflushed_rows = 0
+        self.uncompacted_rows = 0  # 上次 compaction 后插入 + 删除的行数
+        self.deleted_rows = 0
+        self._last_flush = time.monotonic()
+        self._last_write = time.monotonic()
+        
+        self.batches = 0
+        self.requests = 0
+        self.rows = 0
+        self.failed_requests = 0
+        self.flushes = 0
+        self.compactions = 0
+        self._insert_seconds = 0.0
+        self._recent = deque()  # (写入完成时间, 行数)，用于最近一段时间的吞吐
+    
+    def start(self):
+        """启动后台任务（合并写入、flush、compaction），重复调用无效"""
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._carry = None
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+    
+    async def insert(self, columns: List[list]):
+        """写入一篇论文的行，数据写入 Milvus 后返回（失败时抛出异常）"""
+        self.start()
+        request = _InsertRequest(columns=columns, future=asyncio.get_running_loop().create_future())
+        await self._queue.put(request)
+        await request.future
+    
+    def record_deletes(self, rows: int):
+        """记录删除的行数（计入 compaction 阈值，可在工作线程中调用）"""
+        self.deleted_rows += rows
+        self.uncompacted_rows += rows
+        self._last_write = time.monotonic()
+    
+    async def _collect(self, first: _InsertRequest) -> List[_InsertRequest]:
+        loop = asyncio.get_running_loop()
+        batch = [first]
+        num_rows = first.rows
+        deadline = loop.time() + self.max_wait
+        while num_rows < self.batch_rows:
+            if not self._queue.empty():
+                request = self._queue.get_nowait()
+            else:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if request is _STOP:
+                self._stopping = True
+                break
+            if num_rows + request.rows > self.batch_rows:
+                self._carry = request
+                break
+            batch.append(request)
+            num_rows += request.rows
+        return batch
+    
+    def _idle_timeout(self) -> Optional[float]:
+        """没有新写入时等待多久执行后台维护（flush / compaction），None 表示一直等待"""
+        now = time.monotonic()
+        deadlines = []
+        if self.unflushed_rows:
+            deadlines.append(self._last_flush + self.flush_interval)
+        if self.compact_rows > 0 and self.uncompacted_rows >= self.compact_rows:
+            deadlines.append(self._last_write + self.compact_idle)
+        return max(min(deadlines) - now, 0) if deadlines else None
+    
+    async def _run(self):
+        """合并写入循环：取到停止标记后写完已取出的请求（包括 carry）再退出"""
+        while True:
+            if self._carry is not None:
+                first, self._carry = self._carry, None
+            elif self._stopping:
+                return
+            else:
+                try:
+                    first = await asyncio.wait_for(self._queue.get(), self._idle_timeout())
+                except asyncio.TimeoutError:
+                    await self._maintain()
+                    continue
+                if first is _STOP:
+                    return
+            batch = await self._collect(first)
+            await self._write(batch)
+            if not self._stopping:
+                await self._maintain()
+    
+    async def _write(self, batch: List[_InsertRequest]):
+        columns = [list(itertools.chain.from_iterable(parts)) for parts in zip(*(r.columns for r in batch))]
+        start = time.perf_counter()
+        try:
+            await self.service._run(self.service._insert_columns, columns)
+            done = batch
+        except Exception as e:
+            if len(batch) == 1:
+                self._fail(batch[0], e)
+                return
+            # 合并写入失败：逐篇重试，只让有问题的论文失败
+            logger.warning(f"Milvus batch insert of {len(batch)} papers failed, retrying one by one: {e}")
+            done = []
+            for request in batch:
+                try:
+                    await self.service._run(self.service._insert_columns, request.columns)
+                    done.append(request)
+                except Exception as error:
+                    self._fail(request, error)
+        
+        elapsed = time.perf_counter() - start
+        num_rows = sum(request.rows for request in done)
+        self._insert_seconds += elapsed
+        self.batches += 1
+        self.requests += len(done)
+        self.rows += num_rows
+        self.unflushed_rows += num_rows
+        self.uncompacted_rows += num_rows
+        self._last_write = time.monotonic()
+        self._recent.append((self._last_write, num_rows))
+        for request in done:
+            if not request.future.done():
+                request.future.set_result(None)
+        logger.info(
+            f"✓ Inserted {num_rows} vectors from {len(done)} papers in {elapsed * 1000:.0f}ms "
+            f"({num_rows / elapsed if elapsed else 0:.0f} vectors/s)"
+        )
+    
+    def _fail(self, request: _InsertRequest, error: Exception):
+        self.failed_requests += 1
+        if not request.future.done():
+            request.future.set_exception(error)
+    
+    async def _maintain(self, force_flush: bool = False):
+        """按时间/行数 flush；累计变更达到阈值且写入空闲时 flush 后触发 compaction"""
+        now = time.monotonic()
+        compact = (
+            self.compact_rows > 0
+            and self.uncompacted_rows >= self.compact_rows
+            and now - self._last_write >= self.compact_idle
+            and (self._queue is None or self._queue.empty())
+        )
+        flush = self.unflushed_rows and (
+            force_flush or compact
+            or self.unflushed_rows >= self.flush_rows
+            or now - self._last_flush >= self.flush_interval
+        )
+        try:
+            if flush:
+                start = time.perf_counter()
+                await self.service._run(self.service._flush)
+                logger.info(f"✓ Flushed {self.unflushed_rows} vectors in {(time.perf_counter() - start) * 1000:.0f}ms")
+                self.unflushed_rows = 0
+                self._last_flush = time.monotonic()
+                self.flushes += 1
+            if compact:
+                await self.service._run(self.service._compact)
+                logger.info(f"✓ Compaction triggered after {self.uncompacted_rows} inserted/deleted vectors")
+                self.uncompacted_rows = 0
+                self.compactions += 1
+        except Exception as e:
+            # 推迟到下一个间隔再试
+            logger.warning(f"Milvus background maintenance failed: {e}")
+            self._last_flush = self._last_write = time.monotonic()
+    
+    async def stop(self):
+        """
+        写入队列中剩余的数据并 flush 后停止
+
+        不取消后台任务（取消会丢失已从队列取出、正在合并或写入的请求）：放入停止标记，后台任务写完标记之前的请求后退出
+        """
+        if self._task is None:
+            return
+        if not self._task.done():
+            await self._queue.put(_STOP)
+        try:
+            await self._task
+        except Exception as e:
+            logger.error(f"Milvus write buffer stopped with error: {e}")
+        self._task = None
+        # 后台任务异常退出，或停止标记之后又有写入时，剩余的请求在这里写入
+        pending = [self._carry] if self._carry is not None else []
+        self._carry = None
+        while self._queue is not None and not self._queue.empty():
+            request = self._queue.get_nowait()
+            if request is not _STOP:
+                pending.append(request)
+        pending = [request for request in pending if not request.future.done()]
+        if pending:
+            await self._write(pending)
+        await self._maintain(force_flush=True)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        while self._recent and self._recent[0][0] < now - _THROUGHPUT_WINDOW_SECONDS:
+            self._recent.popleft()
+        recent_rows = sum(rows for _, rows in self._recent)
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "rows": self.rows,
+            "deleted_rows": self.deleted_rows,
+            "failed_requests": self.failed_requests,
+            "avg_rows_per_batch": round(self.rows / self.batches, 1) if self.batches else 0.0,
+            "vectors_per_second": round(self.rows / self._insert_seconds, 1) if self._insert_seconds else 0.0,
+            "recent_vectors_per_second": round(recent_rows / _THROUGHPUT_WINDOW_SECONDS, 1),
+            "queued_requests": (self._queue.qsize() if self._queue is not None else 0) + (self._carry is not None),
+            "unflushed_rows": self.unflushed_rows,
+            "uncompacted_rows": self.uncompacted_rows,
+            "flushes": self.flushes,
+            "compactions": self.compactions,
+        }
+
 
 class MilvusService:
     """Milvus向量数据库服务类"""
@@ -26,17 +510,48 @@ class MilvusService:
         self.collection_name = MILVUS_COLLECTION
         self.collection: Optional[Collection] = None
         self._connected = False
+        # 集合是否有 user_id 分区键（旧集合没有）
+        self.partitioned = False
+        
+        # 当前绑定的物理集合（collection_name 是别名时为其指向的集合）及其 embedding 模型、向量维度
+        self.physical_name: Optional[str] = None
+        self.embedding_model = DEFAULT_EMBEDDING_MODEL
+        self.dim: Optional[int] = None
+        # 生成 embedding 时传给 API 的 dimensions 参数（None 表示模型原生维度）
+        self.embedding_dimensions: Optional[int] = None
+        # 当前集合实际的向量索引（parse_index 格式，加载/建索引后读取）
+        self.index: Optional[Dict[str, Any]] = None
+        self._alias_checked_at = 0.0
+        self._alias_lock = threading.Lock()
+        
+        # 集合加载状态：只加载一次，集合重建/索引变更后重新加载
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self.load_count = 0
+        
+        # 连接池：每个连接一个 alias，同一集合在每个连接上各有一个 Collection 对象
+        self._aliases = ["default"] + [f"default-{i}" for i in range(1, max(MILVUS_POOL_SIZE, 1))]
+        self._pool: List[Collection] = []
+        self._slots = itertools.count()
+        self._local = threading.local()
+        
+        # 异步接口的工作线程池
+        self._executor = ThreadPoolExecutor(max_workers=MILVUS_MAX_WORKERS, thread_name_prefix="milvus")
+        self.pending = 0  # 已提交到线程池、尚未完成的调用（含排队）
+        self.max_pending = 0
+        self.write_buffer = MilvusWriteBuffer(self)
         
     def connect(self) -> bool:
-        """连接到Milvus数据库"""
+        """连接到Milvus数据库（连接池中的每个连接）"""
         try:
-            connections.connect(
-                alias="default",
-                host=self.host,
-                port=self.port
-            )
+            for alias in self._aliases:
+                connections.connect(
+                    alias=alias,
+                    host=self.host,
+                    port=self.port
+                )
             self._connected = True
-            logger.info(f"✓ Connected to Milvus: {self.host}:{self.port}")
+            logger.info(f"✓ Connected to Milvus: {self.host}:{self.port} ({len(self._aliases)} connections)")
             return True
         except Exception as e:
             logger.error(f"Failed to connect to Milvus: {str(e)}")
@@ -46,27 +561,52 @@ class MilvusService:
     def disconnect(self):
         """断开Milvus连接"""
         try:
-            connections.disconnect("default")
+            for alias in self._aliases:
+                connections.disconnect(alias)
             self._connected = False
+            self._pool = []
+            self._loaded = False
             logger.info("Disconnected from Milvus")
         except Exception as e:
             logger.error(f"Error disconnecting from Milvus: {str(e)}")
     
+    def resolve(self, name: Optional[str] = None) -> Optional[str]:
+        """集合或别名对应的物理集合名（默认 collection_name；不存在时返回 None）"""
+        name = name or self.collection_name
+        if not utility.has_collection(name):
+            return None
+        return Collection(name).describe()["collection_name"]
+    
     def drop_collection(self) -> bool:
-        """删除向量集合（用于重建 schema）"""
+        """删除向量集合（用于重建 schema）；collection_name 是别名时删除别名及其指向的集合"""
         try:
-            if utility.has_collection(self.collection_name):
-                utility.drop_collection(self.collection_name)
-                logger.info(f"✓ Dropped collection '{self.collection_name}'")
+            physical = self.resolve()
+            if physical is not None:
+                if physical != self.collection_name:
+                    utility.drop_alias(self.collection_name)
+                utility.drop_collection(physical)
+                logger.info(f"✓ Dropped collection '{physical}'")
                 self.collection = None
+                self._pool = []
+                self._loaded = False
                 return True
             return False
         except Exception as e:
             logger.error(f"Failed to drop collection: {str(e)}")
             return False
     
-    def create_collection(self, dim: int = 1536, force_recreate: bool = False) -> bool:
-        """创建向量集合（如果不存在）"""
+    def create_collection(
+        self,
+        dim: Optional[int] = None,
+        force_recreate: bool = False,
+        embedding_model: Optional[str] = None,
+        dimensions: Optional[int] = None
+    ) -> bool:
+        """
+        创建向量集合（如果不存在）；已存在时绑定集合（别名指向的集合），dim / embedding_model 以集合为准
+        
+        新建时 dimensions 默认取 OPENAI_EMBEDDING_DIMENSIONS（设置时向量维度即为该值），否则维度为 MILVUS_EMBEDDING_DIM
+        """
         try:
             if utility.has_collection(self.collection_name):
                 if force_recreate:
@@ -74,56 +614,223 @@ class MilvusService:
                     self.drop_collection()
                 else:
                     logger.info(f"Collection '{self.collection_name}' already exists")
-                    self.collection = Collection(self.collection_name)
+                    self._bind_collection(Collection(self.resolve()))
+                    self._detect_partitioning()
                     return True
             
-            # 定义字段
-            fields = [
-                FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-                FieldSchema(name="paper_id", dtype=DataType.VARCHAR, max_length=255),
-                FieldSchema(name="chunk_id", dtype=DataType.VARCHAR, max_length=300),
-                FieldSchema(name="chunk_index", dtype=DataType.INT64),
-                FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=dim),
-                FieldSchema(name="title", dtype=DataType.VARCHAR, max_length=1000),
-                FieldSchema(name="file_name", dtype=DataType.VARCHAR, max_length=500),
-                FieldSchema(name="content", dtype=DataType.VARCHAR, max_length=65535),
-                FieldSchema(name="chunk_chars", dtype=DataType.INT64),
-                FieldSchema(name="page_range", dtype=DataType.VARCHAR, max_length=200),  # hierarchy_path 需要更长
-                FieldSchema(name="upload_time", dtype=DataType.VARCHAR, max_length=50),
-                FieldSchema(name="source", dtype=DataType.VARCHAR, max_length=100),
-            ]
-            
-            schema = CollectionSchema(fields=fields, description="Research papers collection")
-            self.collection = Collection(name=self.collection_name, schema=schema)
-            
-            logger.info(f"✓ Created collection '{self.collection_name}'")
+            dimensions = dimensions or EMBEDDING_DIMENSIONS or None
+            self._bind_collection(self.create_physical(
+                self.collection_name,
+                dimensions or dim or MILVUS_EMBEDDING_DIM,
+                embedding_model or DEFAULT_EMBEDDING_MODEL,
+                dimensions=dimensions
+            ))
+            self.partitioned = True
             return True
             
         except Exception as e:
             logger.error(f"Failed to create collection: {str(e)}")
             return False
     
+    def create_physical(
+        self,
+        name: str,
+        dim: int,
+        embedding_model: str,
+        partitioned: bool = True,
+        with_index: bool = False,
+        dimensions: Optional[int] = None
+    ) -> Collection:
+        """新建物理集合（不绑定为当前集合；with_index 时同时创建向量索引；dimensions 为请求 API 的维度）"""
+        collection = Collection(
+            name=name,
+            schema=build_schema(dim, embedding_model, partitioned, dimensions),
+            **({"num_partitions": MILVUS_NUM_PARTITIONS} if partitioned else {})
+        )
+        logger.info(
+            f"✓ Created collection '{name}' (dim={dim}, embedding_model={embedding_model}"
+            + (f", {MILVUS_NUM_PARTITIONS} user partitions)" if partitioned else ")")
+        )
+        if with_index:
+            self._create_index(collection)
+        return collection
+    
+    def _bind_collection(self, collection: Collection):
+        """设置当前集合（新建或重新打开），连接池中的其他连接各打开一个同名集合，并标记为需要重新加载"""
+        self.collection = collection
+        self.physical_name = collection.name
+        self.embedding_model, self.dim = embedding_spec(collection.schema)
+        self.embedding_dimensions = requested_dimensions(collection.schema)
+        self.index = None
+        self._pool = [collection] + [
+            Collection(collection.name, using=alias) for alias in self._aliases[1:]
+        ]
+        self._loaded = False
+        self._alias_checked_at = time.monotonic()
+    
+    def check_alias(self, force: bool = False) -> bool:
+        """
+        collection_name 是别名且已指向其他物理集合时（集合迁移切换后）改为绑定新集合
+        
+        每 MILVUS_ALIAS_CHECK_SECONDS 最多检查一次（force 时立即检查）
+        
+        Returns:
+            是否切换了集合
+        """
+        if self.collection is None:
+            return False
+        if not force and time.monotonic() - self._alias_checked_at < MILVUS_ALIAS_CHECK_SECONDS:
+            return False
+        with self._alias_lock:
+            self._alias_checked_at = time.monotonic()
+            try:
+                physical = self.resolve()
+            except Exception as e:
+                logger.warning(f"Failed to resolve collection alias '{self.collection_name}': {e}")
+                return False
+            if physical is None or physical == self.physical_name:
+                return False
+            previous = self.physical_name
+            self._bind_collection(Collection(physical))
+            self._detect_partitioning()
+        logger.info(
+            f"✓ Collection '{self.collection_name}' switched: {previous} -> {physical} "
+            f"(embedding_model={self.embedding_model}, dim={self.dim})"
+        )
+        return True
+    
+    def switch_alias(self, target: str) -> Optional[str]:
+        """
+        把别名 collection_name 原子地切换到物理集合 target，并绑定新集合
+        
+        collection_name 还是物理集合（旧部署）时，先改名为 <collection_name>_v0 再创建同名别名，
+        改名到别名创建之间（毫秒级）其他副本的查询会失败一次
+        
+        Returns:
+            切换前别名指向的物理集合（改名后的名称）
+        """
+        current = self.resolve()
+        if current == self.collection_name:
+            current = f"{self.collection_name}_v0"
+            utility.rename_collection(self.collection_name, current)
+            utility.create_alias(target, self.collection_name)
+            logger.info(f"✓ Renamed collection '{self.collection_name}' to '{current}'")
+        elif current is None:
+            utility.create_alias(target, self.collection_name)
+        else:
+            utility.alter_alias(target, self.collection_name)
+        logger.info(f"✓ Alias '{self.collection_name}' now points to '{target}' (previous: {current})")
+        self.check_alias(force=True)
+        return current
+    
+    def _pooled(self) -> Collection:
+        """当前线程使用的集合对象：线程首次调用时按顺序分配连接池中的一个连接"""
+        slot = getattr(self._local, "slot", None)
+        if slot is None:
+            slot = self._local.slot = next(self._slots) % len(self._aliases)
+        pool = self._pool
+        return pool[slot] if slot < len(pool) else self.collection
+    
+    def ensure_loaded(self):
+        """把集合加载到内存（只加载一次，并发调用只有一个线程执行加载）"""
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            start = time.perf_counter()
+            self.collection.load()
+            self._detect_index()
+            self._loaded = True
+            self.load_count += 1
+            logger.info(f"✓ Collection '{self.collection_name}' loaded in {(time.perf_counter() - start) * 1000:.0f}ms")
+    
+    def _call_loaded(self, call):
+        """
+        在已加载的集合上执行查询；集合被其他副本重建/释放而报未加载时，重新加载并重试一次，
+        集合已不存在（迁移后旧集合被删除/改名）时立即检查别名，切换到新集合后重试一次
+        """
+        self.check_alias()
+        self.ensure_loaded()
+        try:
+            return call(self._pooled())
+        except Exception as e:
+            message = str(e).lower()
+            if "not loaded" in message:
+                logger.warning(f"Collection '{self.physical_name}' is not loaded, reloading: {e}")
+                self._loaded = False
+            elif not (("not exist" in message or "not found" in message) and self.check_alias(force=True)):
+                raise
+            self.ensure_loaded()
+            return call(self._pooled())
+    
+    def _detect_partitioning(self):
+        """检查已有集合是否有 user_id 分区键"""
+        self.partitioned = any(field.name == "user_id" for field in self.collection.schema.fields)
+        if not self.partitioned:
+            logger.warning(
+                f"Collection '{self.collection_name}' has no user_id partition key, per-user searches and deletes "
+                "are refused until it is migrated (python migrate_collection.py --owners <paper owners JSON>)"
+            )
+    
+    def _user_filter(self, user_id: Optional[int], filter_expr: Optional[str] = None) -> Optional[str]:
+        """在过滤表达式中加入 user_id 条件；旧集合无法按用户过滤，指定 user_id 时抛出 UserScopeError"""
+        if user_id is None:
+            return filter_expr
+        if not self.partitioned:
+            raise UserScopeError(
+                f"Collection '{self.collection_name}' has no user_id partition key, per-user access is disabled "
+                "until it is migrated with migrate_collection.py --owners"
+            )
+        user_expr = f"user_id == {int(user_id)}"
+        return f"{user_expr} and ({filter_expr})" if filter_expr else user_expr
+    
     def create_index(self) -> bool:
-        """创建向量索引"""
+        """创建向量索引（MILVUS_INDEX_TYPE）；集合已有索引时沿用已有索引"""
         try:
             if not self.collection:
                 logger.error("Collection not initialized")
                 return False
             
-            index_params = {
-                "metric_type": "L2",
-                "index_type": "IVF_FLAT",
-                "params": {"nlist": 1024}
-            }
+            if any(index.field_name == "embedding" for index in self.collection.indexes):
+                self._detect_index()
+                return True
             
-            self.collection.create_index(field_name="embedding", index_params=index_params)
-            logger.info("✓ Created index on embedding field")
+            self._create_index(self.collection)
+            self._detect_index()
+            # 索引变更后需要重新加载
+            self._loaded = False
             return True
             
         except Exception as e:
             logger.error(f"Failed to create index: {str(e)}")
             return False
     
+    @staticmethod
+    def _create_index(collection: Collection):
+        _, dim = embedding_spec(collection.schema)
+        index_params = build_index_params(MILVUS_INDEX_TYPE, dim or MILVUS_EMBEDDING_DIM)
+        collection.create_index(field_name="embedding", index_params=index_params)
+        logger.info(
+            f"✓ Created {index_params['index_type']} index {index_params['params']} "
+            f"on embedding field of '{collection.name}'"
+        )
+    
+    def _detect_index(self):
+        """读取集合实际的向量索引，与 MILVUS_INDEX_TYPE 不一致时提示在线重建"""
+        indexes = [index for index in self.collection.indexes if index.field_name == "embedding"]
+        self.index = parse_index(indexes[0].params) if indexes else None
+        if self.index and self.index["index_type"] != MILVUS_INDEX_TYPE:
+            logger.warning(
+                f"Collection '{self.physical_name}' has a {self.index['index_type']} index, "
+                f"MILVUS_INDEX_TYPE={MILVUS_INDEX_TYPE} only applies to new indexes "
+                "(run migrate_collection.py to rebuild online)"
+            )
+    
+    def search_params(self, top_k: int, selective: bool = False) -> Dict[str, Any]:
+        """当前集合的检索参数（尚未读取到索引时按 MILVUS_INDEX_TYPE）"""
+        return build_search_params(self.index or build_index_params(dim=self.dim or MILVUS_EMBEDDING_DIM), top_k, selective)
+    
     def insert_vectors(
         self,
         paper_ids: List[str],
@@ -136,22 +843,19 @@ class MilvusService:
         chunk_chars: List[int],
         page_ranges: List[str],
         upload_times: List[str],
-        sources: List[str]
+        sources: List[str],
+        user_ids: Optional[List[int]] = None
     ) -> bool:
-        """插入向量数据"""
+        """插入向量数据（user_ids 为 chunk 所属用户，旧集合忽略）；不 flush，由 Milvus 自动封存段"""
         try:
-            if not self.collection:
-                logger.error("Collection not initialized")
+            entities = self._entities(
+                paper_ids, chunk_ids, chunk_indices, embeddings, titles, file_names,
+                contents, chunk_chars, page_ranges, upload_times, sources, user_ids
+            )
+            if entities is None:
                 return False
             
-            entities = [
-                paper_ids, chunk_ids, chunk_indices, embeddings,
-                titles, file_names, contents, chunk_chars,
-                page_ranges, upload_times, sources
-            ]
-            
-            self.collection.insert(entities)
-            self.collection.flush()
+            self._insert_columns(entities)
             
             logger.info(f"✓ Inserted {len(paper_ids)} vectors")
             return True
@@ -160,100 +864,198 @@ class MilvusService:
             logger.error(f"Failed to insert vectors: {str(e)}")
             return False
     
+    def _entities(
+        self,
+        paper_ids, chunk_ids, chunk_indices, embeddings, titles, file_names,
+        contents, chunk_chars, page_ranges, upload_times, sources, user_ids
+    ) -> Optional[List[list]]:
+        """按集合字段顺序组织插入的列（集合未初始化或缺少 user_ids 时返回 None）"""
+        if not self.collection:
+            logger.error("Collection not initialized")
+            return None
+        
+        entities = [
+            paper_ids, chunk_ids, chunk_indices, embeddings,
+            titles, file_names, contents, chunk_chars,
+            page_ranges, upload_times, sources
+        ]
+        if self.partitioned:
+            if user_ids is None:
+                logger.error("user_ids is required for a partitioned collection")
+                return None
+            entities.append([int(u) for u in user_ids])
+        return entities
+    
+    def _insert_columns(self, entities: List[list]):
+        self._pooled().insert(entities)
+    
+    def _flush(self):
+        self._pooled().flush()
+    
+    def _compact(self):
+        self._pooled().compact()
+    
     def search_similar(
         self,
         query_vectors: List[List[float]],
         top_k: int = 10,
-        filter_expr: Optional[str] = None
+        filter_expr: Optional[str] = None,
+        user_id: Optional[int] = None,
+        selective: Optional[bool] = None,
+        output_fields: Optional[List[str]] = None
     ) -> List[List[Dict[str, Any]]]:
-        """搜索相似向量"""
+        """
+        搜索相似向量（指定 user_id 时只搜索该用户的分区；旧集合指定 user_id 时抛出 UserScopeError）
+        
+        selective 表示 filter_expr 只保留少量向量（如单篇论文），使用过滤检索参数；默认有 filter_expr 时为 True。
+        output_fields 为返回的标量字段（默认 SEARCH_OUTPUT_FIELDS）；ID_OUTPUT_FIELDS 只返回 id 和分数，
+        不读取 content 等大字段，结果中没有的字段之后用 get_chunks 补全
+        """
         try:
             if not self.collection:
                 logger.error("Collection not initialized")
                 return []
             
-            self.collection.load()
-            
-            search_params = {"metric_type": "L2", "params": {"nprobe": 10}}
-            
+            if selective is None:
+                selective = filter_expr is not None
+            output_fields = output_fields or SEARCH_OUTPUT_FIELDS
             search_kwargs = {
                 "data": query_vectors,
                 "anns_field": "embedding",
-                "param": search_params,
                 "limit": top_k,
-                "output_fields": [
-                    "paper_id", "chunk_id", "chunk_index",
-                    "title", "file_name", "content", "chunk_chars",
-                    "page_range", "upload_time", "source"
-                ]
+                "output_fields": output_fields
             }
             
+            filter_expr = self._user_filter(user_id, filter_expr)
             if filter_expr:
                 search_kwargs["expr"] = filter_expr
             
-            results = self.collection.search(**search_kwargs)
+            # 检索参数在集合加载（读取到实际索引）后确定
+            results = self._call_loaded(lambda collection: collection.search(
+                param=self.search_params(top_k, selective), **search_kwargs
+            ))
             
             formatted_results = []
             for hits in results:
                 hits_list = []
                 for hit in hits:
-                    hits_list.append({
+                    hit_dict = {
                         "id": hit.id,
                         "distance": hit.distance,
-                        "relevance_score": 1 / (1 + hit.distance),
-                        "paper_id": hit.entity.get("paper_id"),
-                        "title": hit.entity.get("title"),
-                        "file_name": hit.entity.get("file_name"),
-                        "upload_time": hit.entity.get("upload_time"),
-                        "chunk_id": hit.entity.get("chunk_id"),
-                        "chunk_index": hit.entity.get("chunk_index"),
-                        "content": hit.entity.get("content"),
-                        "chunk_chars": hit.entity.get("chunk_chars"),
-                        "page_range": hit.entity.get("page_range"),
-                        "source": hit.entity.get("source")
-                    })
+                        "relevance_score": 1 / (1 + hit.distance)
+                    }
+                    for field in output_fields:
+                        hit_dict[field] = hit.entity.get(field)
+                    hits_list.append(hit_dict)
                 formatted_results.append(hits_list)
             
             logger.info(f"Search completed, returned {len(formatted_results)} result groups")
             return formatted_results
             
+        except UserScopeError:
+            raise
         except Exception as e:
             logger.error(f"Search failed: {str(e)}")
             return []
     
-    def delete_by_paper_id(self, paper_ids: List[str]) -> bool:
-        """根据论文ID删除向量"""
-        import json
+    def iterate_chunks(
+        self,
+        output_fields: List[str],
+        batch_size: int = 1000,
+        filter_expr: Optional[str] = None
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        分批流式读取集合中的 chunk（用于重建 BM25 等派生索引）
+        
+        Yields:
+            每批 chunk 的字段字典列表
+        """
+        if not self.collection:
+            logger.error("Collection not initialized")
+            return
+        
+        iterator = self._call_loaded(lambda collection: collection.query_iterator(
+            batch_size=batch_size,
+            expr=filter_expr or "id >= 0",
+            output_fields=output_fields
+        ))
+        try:
+            while True:
+                batch = iterator.next()
+                if not batch:
+                    break
+                yield batch
+        finally:
+            iterator.close()
+    
+    def get_chunks(
+        self,
+        chunk_ids: List[Any],
+        output_fields: List[str],
+        batch_size: int = 500,
+        key_field: str = "chunk_id"
+    ) -> Dict[Any, Dict[str, Any]]:
+        """
+        按 chunk_id 批量读取字段（用于为检索结果补全正文等大字段）
+
+        chunk_id 不保证唯一（如同一 paper_id 多次写入），有向量检索结果的主键时用 key_field="id" 按主键读取
+
+        Returns:
+            key_field 的值 -> 字段字典（找不到的 chunk 不在结果中）
+        """
+        if not self.collection or not chunk_ids:
+            return {}
+
+        fields = list(dict.fromkeys([key_field, *output_fields]))
+        unique_ids = list(dict.fromkeys(chunk_ids))
+        chunks = {}
+
+        for i in range(0, len(unique_ids), batch_size):
+            batch = unique_ids[i:i + batch_size]
+            # 使用 json.dumps 确保字符串用双引号（Milvus 要求）
+            rows = self._call_loaded(lambda collection: collection.query(
+                expr=f"{key_field} in {json.dumps(batch)}",
+                output_fields=fields
+            ))
+            for row in rows:
+                chunks[row[key_field]] = row
+        return chunks
+
+    def delete_by_paper_id(self, paper_ids: List[str], user_id: Optional[int] = None) -> Optional[int]:
+        """
+        根据论文ID删除向量（指定 user_id 时只删除该用户的 chunk），返回删除的行数，失败时返回 None
+
+        旧集合指定 user_id 时抛出 UserScopeError（无法确认 chunk 属于该用户）
+        """
         try:
             if not self.collection:
                 logger.error("Collection not initialized")
-                return False
+                return None
             
             # 使用 json.dumps 确保字符串用双引号（Milvus 要求）
             paper_ids_str = json.dumps(paper_ids)
-            expr = f"paper_id in {paper_ids_str}"
+            expr = self._user_filter(user_id, f"paper_id in {paper_ids_str}")
             
             logger.info(f"Deleting vectors with expr: {expr}")
             
-            # 先查询有多少条记录
-            before_count = self.collection.query(expr=expr, output_fields=["paper_id"])
-            logger.info(f"Found {len(before_count)} vectors to delete")
-            
-            if len(before_count) > 0:
-                self.collection.delete(expr)
-                # 刷新以确保删除生效
-                self.collection.flush()
-                logger.info(f"✓ Deleted {len(before_count)} vectors for papers: {paper_ids}")
+            # 删除写入后即对检索生效，不需要 flush；删除的行数计入 compaction 阈值
+            result = self._pooled().delete(expr)
+            deleted = result.delete_count
+            self.write_buffer.record_deletes(deleted)
+            if deleted:
+                logger.info(f"✓ Deleted {deleted} vectors for papers: {paper_ids}")
             else:
                 logger.warning(f"No vectors found for papers: {paper_ids}")
             
-            return True
+            return deleted
             
+        except UserScopeError:
+            raise
         except Exception as e:
             logger.error(f"Failed to delete vectors: {str(e)}")
             import traceback
             logger.error(traceback.format_exc())
-            return False
+            return None
     
     def get_collection_stats(self) -> Dict[str, Any]:
         """获取集合统计信息"""
@@ -261,19 +1063,110 @@ class MilvusService:
             if not self.collection:
                 return {}
             
-            self.collection.flush()
+            # num_entities 只统计已 flush 的数据，缓冲中和未 flush 的行数见 write_buffer
             stats = self.collection.num_entities
             
             return {
                 "collection_name": self.collection_name,
+                "physical_collection": self.physical_name,
+                "embedding_model": self.embedding_model,
+                "dim": self.dim,
+                "embedding_dimensions": self.embedding_dimensions,
+                "index": self.index,
                 "num_entities": stats,
-                "is_loaded": utility.load_state(self.collection_name)
+                "partitioned": self.partitioned,
+                "is_loaded": utility.load_state(self.physical_name),
+                "loaded_once": self._loaded,
+                "load_count": self.load_count,
+                "pool": {
+                    "connections": len(self._aliases),
+                    "workers": MILVUS_MAX_WORKERS,
+                    "pending": self.pending,
+                    "max_pending": self.max_pending,
+                },
+                "write_buffer": self.write_buffer.get_stats()
             }
             
         except Exception as e:
             logger.error(f"Failed to get collection stats: {str(e)}")
             return {}
 
+    
+    # ==================== 异步接口 ====================
+    
+    async def _run(self, func, *args, **kwargs):
+        """在 Milvus 工作线程池中执行阻塞调用"""
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        self.max_pending = max(self.max_pending, self.pending)
+        try:
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        finally:
+            self.pending -= 1
+    
+    async def search_similar_async(self, *args, **kwargs) -> List[List[Dict[str, Any]]]:
+        """search_similar 的异步版本"""
+        return await self._run(self.search_similar, *args, **kwargs)
+    
+    async def insert_vectors_async(
+        self,
+        paper_ids: List[str],
+        chunk_ids: List[str],
+        chunk_indices: List[int],
+        embeddings: List[List[float]],
+        titles: List[str],
+        file_names: List[str],
+        contents: List[str],
+        chunk_chars: List[int],
+        page_ranges: List[str],
+        upload_times: List[str],
+        sources: List[str],
+        user_ids: Optional[List[int]] = None,
+        embedding_model: Optional[str] = None
+    ) -> bool:
+        """
+        insert_vectors 的异步版本：经写缓冲与其他论文合并写入，数据写入 Milvus 后返回
+        
+        embedding_model 为生成 embeddings 所用的模型，与当前集合的模型不一致（生成期间集合已切换）时拒绝写入
+        """
+        if embedding_model is not None and embedding_model != self.embedding_model:
+            logger.error(
+                f"Embeddings were generated with {embedding_model}, but collection "
+                f"'{self.physical_name}' uses {self.embedding_model}"
+            )
+            return False
+        entities = self._entities(
+            paper_ids, chunk_ids, chunk_indices, embeddings, titles, file_names,
+            contents, chunk_chars, page_ranges, upload_times, sources, user_ids
+        )
+        if entities is None:
+            return False
+        try:
+            await self.write_buffer.insert(entities)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to insert vectors: {str(e)}")
+            return False
+    
+    async def delete_by_paper_id_async(self, *args, **kwargs) -> Optional[int]:
+        """delete_by_paper_id 的异步版本"""
+        deleted = await self._run(self.delete_by_paper_id, *args, **kwargs)
+        # 启动后台维护，删除累计达到阈值后触发 compaction
+        self.write_buffer.start()
+        return deleted
+    
+    async def get_chunks_async(self, *args, **kwargs) -> Dict[str, Dict[str, Any]]:
+        """get_chunks 的异步版本"""
+        return await self._run(self.get_chunks, *args, **kwargs)
+    
+    async def get_collection_stats_async(self) -> Dict[str, Any]:
+        """get_collection_stats 的异步版本"""
+        return await self._run(self.get_collection_stats)
+    
+    async def shutdown(self):
+        await self.write_buffer.stop()
+        self._executor.shutdown(wait=False)
+
 
 # 全局实例
 _milvus_service = None
@@ -285,6 +1178,6 @@ def get_milvus_service() -> MilvusService:
     if _milvus_service is None:
         _milvus_service = MilvusService()
         if _milvus_service.connect():
-            _milvus_service.create_collection(dim=1536)  # text-embedding-3-small维度
+            _milvus_service.create_collection()
             _milvus_service.create_index()
     return _milvus_service
@@ -1,14 +1,55 @@
 """
 OpenAI服务 - 用于生成文本嵌入和AI回答
+
+查询翻译结果经两级缓存（进程内 LRU + Redis）复用，key 为规范化后的查询 + 目标语言 + 模型
+查询向量同样经两级缓存复用（embed_queries），以 float16 保存（1536 维约 3KB/条），key 为模型（+ 维度）+ 规范化后的查询
+
+text-embedding-3 系列支持 dimensions 参数直接生成低维向量（等价于截断后重新归一化），
+集合记录了请求的维度时，查询向量和文档向量都按该维度生成
 """
 import os
 import re
-from typing import List, AsyncGenerator, Tuple
+import unicodedata
+from typing import List, AsyncGenerator, Optional, Tuple
 from openai import AsyncOpenAI
 import logging
+import numpy as np
+
+from app.utils.two_tier_cache import TwoTierCache, hash_key
 
 logger = logging.getLogger(__name__)
 
+# 查询翻译模型（轻量模型提高速度）
+TRANSLATION_MODEL = os.getenv("TRANSLATION_MODEL", "gpt-4o-mini")
+# 翻译缓存：进程内 LRU 条数与缓存有效期（秒，Redis 与 LRU 相同）
+TRANSLATION_CACHE_SIZE = int(os.getenv("TRANSLATION_CACHE_SIZE", "4096"))
+TRANSLATION_CACHE_TTL = int(os.getenv("TRANSLATION_CACHE_TTL", str(7 * 24 * 3600)))
+# 查询向量缓存：进程内 LRU 条数与缓存有效期（秒）
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", str(30 * 24 * 3600)))
+
+
+def supports_dimensions(model: str) -> bool:
+    """模型是否支持 dimensions 参数（text-embedding-3 系列）"""
+    return model.startswith("text-embedding-3")
+
+
+def truncate_embeddings(vectors, dim: int) -> np.ndarray:
+    """
+    把 text-embedding-3 系列的向量截断到前 dim 维并重新归一化
+
+    与以 dimensions=dim 调用 API 的结果相同，降维时不需要重新生成 embedding
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)[:, :dim]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def normalize_query(query: str, lower: bool = True) -> str:
+    """规范化查询用于缓存 key：全角/半角统一、合并空白、（可选）小写"""
+    text = " ".join(unicodedata.normalize("NFKC", query).split())
+    return text.lower() if lower else text
+
 
 class OpenAIService:
     """OpenAI服务类"""
@@ -29,6 +70,22 @@ class OpenAIService:
             logger.error(f"Failed to initialize OpenAI client: {str(e)}")
             raise
         
+        self.translation_cache = TwoTierCache(
+            namespace="translation:v1",
+            max_size=TRANSLATION_CACHE_SIZE,
+            ttl=TRANSLATION_CACHE_TTL,
+            encode=lambda text: text.encode("utf-8"),
+            decode=lambda data: data.decode("utf-8")
+        )
+        # 向量大小写敏感，key 不做小写
+        self.embedding_cache = TwoTierCache(
+            namespace="embedding:v1",
+            max_size=EMBEDDING_CACHE_SIZE,
+            ttl=EMBEDDING_CACHE_TTL,
+            encode=lambda vector: vector.tobytes(),
+            decode=lambda data: np.frombuffer(data, dtype=np.float16)
+        )
+        
         self.default_model = os.getenv('OPENAI_MODEL', 'gpt-4o')
         self.embedding_model = os.getenv('OPENAI_EMBEDDING_MODEL', 'text-embedding-3-small')
         logger.info(f"Using chat model: {self.default_model}")
@@ -37,7 +94,8 @@ class OpenAIService:
     async def generate_embeddings(
         self,
         texts: List[str],
-        model: str = None
+        model: str = None,
+        dimensions: Optional[int] = None
     ) -> List[List[float]]:
         """
         生成文本嵌入向量
@@ -45,6 +103,7 @@ class OpenAIService:
         Args:
             texts: 文本列表
             model: 嵌入模型（默认使用配置的模型）
+            dimensions: 输出维度（仅 text-embedding-3 系列，默认为模型原生维度）
             
         Returns:
             List[List[float]]: 嵌入向量列表
@@ -52,7 +111,8 @@ class OpenAIService:
         try:
             response = await self.client.embeddings.create(
                 model=model or self.embedding_model,
-                input=texts
+                input=texts,
+                **({"dimensions": dimensions} if dimensions else {})
             )
             
             embeddings = [item.embedding for item in response.data]
@@ -63,6 +123,39 @@ class OpenAIService:
             logger.error(f"Error generating embeddings: {str(e)}")
             raise Exception(f"Failed to generate embeddings: {str(e)}")
     
+    async def embed_queries(
+        self,
+        queries: List[str],
+        model: str = None,
+        dimensions: Optional[int] = None
+    ) -> List[List[float]]:
+        """
+        生成查询向量（带缓存）
+        
+        命中的查询直接返回缓存的向量（float16 精度），未命中的查询合并为一次 API 调用；
+        与并发请求中相同的查询只调用一次 API（两级缓存的 single-flight）
+        
+        Args:
+            queries: 查询列表
+            model: 嵌入模型（默认使用配置的模型）
+            dimensions: 输出维度（仅 text-embedding-3 系列，默认为模型原生维度）
+            
+        Returns:
+            List[List[float]]: 与 queries 顺序一致的向量列表
+        """
+        model = model or self.embedding_model
+        # 原生维度的 key 与之前相同，已缓存的向量继续有效
+        cache_model = f"{model}@{dimensions}" if dimensions else model
+        keys = [hash_key(cache_model, normalize_query(query, lower=False)) for query in queries]
+        key_queries = dict(zip(keys, queries))
+        
+        async def load(missing: List[str]) -> List[np.ndarray]:
+            embeddings = await self.generate_embeddings([key_queries[key] for key in missing], model, dimensions)
+            return [np.asarray(embedding, dtype=np.float16) for embedding in embeddings]
+        
+        vectors = await self.embedding_cache.get_or_load_many(keys, load)
+        return [vector.astype(np.float32).tolist() for vector in vectors]
+    
     async def chat_completion_stream(
         self,
         messages: List[dict],
@@ -226,6 +319,19 @@ class OpenAIService:
         if source_language == 'en' and target_language == 'en':
             return query, False
         
+        model = model or TRANSLATION_MODEL
+        key = hash_key(model, target_language, normalize_query(query))
+        translated = await self.translation_cache.get_or_load(
+            key,
+            lambda: self._translate(query, target_language, model),
+            should_store=lambda result: result is not None
+        )
+        if translated is None:
+            return query, False
+        return translated, True
+    
+    async def _translate(self, query: str, target_language: str, model: str):
+        """调用 LLM 翻译，失败时返回 None（不写入缓存）"""
         try:
             if target_language == 'en':
                 system_prompt = """You are a professional translator for academic queries.
@@ -244,7 +350,7 @@ Only output the translation, nothing else."""
             ]
             
             response = await self.client.chat.completions.create(
-                model=model or "gpt-4o-mini",  # 使用轻量模型提高速度
+                model=model,
                 messages=messages,
                 temperature=0.3,
                 max_tokens=500
@@ -252,11 +358,11 @@ Only output the translation, nothing else."""
             
             translated = response.choices[0].message.content.strip()
             logger.info(f"Translated query: '{query}' -> '{translated}'")
-            return translated, True
+            return translated or None
             
         except Exception as e:
             logger.error(f"Translation failed: {str(e)}, using original query")
-            return query, False
+            return None
 
 
 # 全局实例
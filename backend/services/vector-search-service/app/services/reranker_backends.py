@@ -0,0 +1,172 @@
+"""
+Reranker 推理后端
+
+RERANKER_BACKEND 选择 Cross-Encoder 的推理实现，所有后端都提供与 sentence-transformers CrossEncoder
+相同的 predict(pairs) 接口（单标签模型输出 sigmoid 后的分数）：
+- sentence-transformers：PyTorch fp32（默认）
+- onnx：导出为 ONNX，使用 ONNX Runtime CPU 推理
+- onnx-int8：导出为 ONNX 后做动态 int8 量化（权重 int8，激活在运行时量化），CPU 上延迟最低
+
+ONNX 模型首次使用时从 RERANKER_MODEL 导出到 RERANKER_ONNX_DIR（需要 torch + transformers），
+之后直接加载导出结果；多个进程同时导出时各自写临时目录，先完成的一方改名生效，其余的结果丢弃
+"""
+import logging
+import os
+import shutil
+from typing import Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+RERANKER_BACKEND = os.getenv("RERANKER_BACKEND", "sentence-transformers")
+# ONNX 导出目录（每个模型一个子目录）
+RERANKER_ONNX_DIR = os.getenv("RERANKER_ONNX_DIR", "./data/reranker_onnx")
+# ONNX Runtime 算子内线程数（0 表示由 ONNX Runtime 决定）
+RERANKER_ONNX_THREADS = int(os.getenv("RERANKER_ONNX_THREADS", "0"))
+# query + document 的最大 token 数（与 CrossEncoder 一致按 longest_first 截断）
+RERANKER_MAX_LENGTH = int(os.getenv("RERANKER_MAX_LENGTH", "512"))
+
+BACKENDS = ("sentence-transformers", "onnx", "onnx-int8")
+
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model.int8.onnx"
+ONNX_OPSET = 17
+
+
+def _model_dir(model_name: str, cache_dir: str) -> str:
+    return os.path.join(cache_dir, model_name.strip("/").replace("/", "__"))
+
+
+def export_onnx(model_name: str, output_dir: str, quantize: bool = True) -> str:
+    """
+    把 Hugging Face 序列分类模型导出为 ONNX（可选动态 int8 量化），同时保存 tokenizer 和 config
+
+    Returns:
+        导出目录
+    """
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    tmp_dir = f"{output_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    try:
+        logger.info(f"Exporting reranker to ONNX: {model_name} -> {output_dir}")
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+
+        sample = tokenizer(["query"], ["document"], return_tensors="pt")
+        input_names = list(sample.keys())
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["logits"] = {0: "batch"}
+
+        fp32_path = os.path.join(tmp_dir, ONNX_FILE)
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                (dict(sample),),
+                fp32_path,
+                input_names=input_names,
+                output_names=["logits"],
+                dynamic_axes=dynamic_axes,
+                opset_version=ONNX_OPSET
+            )
+
+        if quantize:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            quantize_dynamic(fp32_path, os.path.join(tmp_dir, ONNX_INT8_FILE), weight_type=QuantType.QInt8)
+
+        tokenizer.save_pretrained(tmp_dir)
+        model.config.save_pretrained(tmp_dir)
+
+        target_file = ONNX_INT8_FILE if quantize else ONNX_FILE
+        try:
+            if not os.path.exists(os.path.join(output_dir, target_file)):
+                # 已有的导出结果缺少所需文件（如之前只导出了 fp32）时替换为本次结果
+                shutil.rmtree(output_dir, ignore_errors=True)
+                os.rename(tmp_dir, output_dir)
+        except OSError:
+            # 其他进程已先完成导出
+            pass
+        logger.info(f"✓ Reranker exported to ONNX{' (int8)' if quantize else ''}: {output_dir}")
+        return output_dir
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+class OnnxCrossEncoder:
+    """ONNX Runtime 上的 Cross-Encoder（predict 接口与 sentence-transformers CrossEncoder 一致）"""
+
+    def __init__(
+        self,
+        model_name: str,
+        quantize: bool = True,
+        cache_dir: str = RERANKER_ONNX_DIR,
+        max_length: int = RERANKER_MAX_LENGTH,
+        threads: int = RERANKER_ONNX_THREADS
+    ):
+        import onnxruntime as ort
+        from transformers import AutoConfig, AutoTokenizer
+
+        model_dir = _model_dir(model_name, cache_dir)
+        model_file = ONNX_INT8_FILE if quantize else ONNX_FILE
+        if not os.path.exists(os.path.join(model_dir, model_file)):
+            export_onnx(model_name, model_dir, quantize=quantize)
+
+        config = AutoConfig.from_pretrained(model_dir)
+        if config.num_labels != 1:
+            raise ValueError(f"Only single-label cross-encoders are supported, got num_labels={config.num_labels}")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+
+        self.model_name = model_name
+        self.model_path = os.path.join(model_dir, model_file)
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+    def predict(self, pairs: Sequence[Sequence[str]], batch_size: int = 32) -> np.ndarray:
+        """
+        计算 (query, document) 对的相关性分数（sigmoid）
+
+        按文本长度排序后分批推理，同一批次的长度接近，减少 padding 计算
+        """
+        scores = np.zeros(len(pairs), dtype=np.float32)
+        if not len(pairs):
+            return scores
+
+        order = np.argsort([len(query) + len(document) for query, document in pairs], kind="stable")
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            encoded = self.tokenizer(
+                [pairs[i][0] for i in batch],
+                [pairs[i][1] for i in batch],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np"
+            )
+            feeds = {name: encoded[name].astype(np.int64) for name in self.input_names}
+            logits = self.session.run(None, feeds)[0].reshape(-1)
+            scores[batch] = 1.0 / (1.0 + np.exp(-logits))
+        return scores
+
+
+def load_cross_encoder(model_name: str, backend: str = RERANKER_BACKEND, device: Optional[str] = None):
+    """按后端加载 Cross-Encoder，返回带 predict(pairs) 的模型对象"""
+    if backend == "sentence-transformers":
+        from sentence_transformers import CrossEncoder
+
+        return CrossEncoder(model_name, device=device, max_length=RERANKER_MAX_LENGTH)
+    if backend in ("onnx", "onnx-int8"):
+        if device not in (None, "cpu"):
+            logger.warning(f"Reranker backend {backend} runs on CPU only, ignoring device={device}")
+        return OnnxCrossEncoder(model_name, quantize=backend == "onnx-int8")
+    raise ValueError(f"Unknown reranker backend: {backend} (expected one of {', '.join(BACKENDS)})")
+
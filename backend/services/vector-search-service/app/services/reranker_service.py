@@ -1,11 +1,33 @@
 """
 Cross-Encoder Reranker 服务
 使用 BGE-Reranker 或 Sentence-Transformers Cross-Encoder 进行重排序
+推理后端由 RERANKER_BACKEND 选择（PyTorch / ONNX Runtime / ONNX Runtime int8，见 reranker_backends.py）
+
+异步接口（rerank_async / rerank_batch_async）不在事件循环中推理：请求进入队列，
+由 RerankBatcher 把并发请求的 (query, document) 对合并为微批次（按 RERANKER_MAX_BATCH_PAIRS 和
+RERANKER_BATCH_WAIT_MS 界定），在专用的单线程推理执行器中依次执行。同步接口 rerank / rerank_batch
+保留给脚本等非异步调用方
+
+模型生命周期：服务启动时在推理线程中后台加载并预热模型（start），首次加载完成前 ready 为 False，
+/health 据此返回 503；加载失败时按指数退避重试，期间请求使用 Fallback 排序（降级），不在请求路径上加载模型
+
+分数缓存：(规范化查询, chunk_id) 的 Cross-Encoder 分数保存在进程内 LRU（RerankScoreCache）中，重新生成回答、
+Agent 重试等重复查询只推理未缓存的文档对；缓存值记录论文的索引版本（BM25Service.paper_version），
+论文重新索引/删除后旧分数失效
 """
+import asyncio
 import logging
 import os
-from typing import List, Dict, Any, Optional
-from functools import lru_cache
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Callable, Sequence, Tuple
+
+from app.services.bm25_service import get_bm25_service
+from app.services.openai_service import normalize_query
+from app.services.reranker_backends import RERANKER_BACKEND, load_cross_encoder
+from app.utils.two_tier_cache import hash_key
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +35,308 @@ logger = logging.getLogger(__name__)
 RERANKER_MODEL = os.getenv("RERANKER_MODEL", "BAAI/bge-reranker-base")
 USE_GPU = os.getenv("USE_GPU", "false").lower() == "true"
 
+# 微批次：每批最多的 (query, document) 对数（单个请求超过时单独成批）
+RERANKER_MAX_BATCH_PAIRS = int(os.getenv("RERANKER_MAX_BATCH_PAIRS", "128"))
+# 第一个请求入队后等待其他请求加入同一批次的最长时间（毫秒，0 表示只合并已在队列中的请求）
+RERANKER_BATCH_WAIT_MS = float(os.getenv("RERANKER_BATCH_WAIT_MS", "5"))
+# 等待推理的请求数上限，超过时新请求等待入队（背压）
+RERANKER_QUEUE_SIZE = int(os.getenv("RERANKER_QUEUE_SIZE", "256"))
+# 单个请求等待入队和推理的最长时间（秒），超时后调用方使用 Fallback 排序
+RERANKER_REQUEST_TIMEOUT_SECONDS = float(os.getenv("RERANKER_REQUEST_TIMEOUT_SECONDS", "30"))
+
+# 分数缓存：最多缓存的 (query, document) 对数（0 表示不缓存）与有效期（秒）
+RERANKER_SCORE_CACHE_SIZE = int(os.getenv("RERANKER_SCORE_CACHE_SIZE", "50000"))
+RERANKER_SCORE_CACHE_TTL = int(os.getenv("RERANKER_SCORE_CACHE_TTL", "3600"))
+
+# 启动时后台加载并预热模型（false 时在首个重排序请求到达后才开始后台加载，且不影响 /health）
+RERANKER_EAGER_LOAD = os.getenv("RERANKER_EAGER_LOAD", "true").lower() == "true"
+# 加载失败后的重试间隔（秒）：从 BASE 开始每次翻倍，不超过 MAX
+RERANKER_RETRY_BASE_SECONDS = float(os.getenv("RERANKER_RETRY_BASE_SECONDS", "5"))
+RERANKER_RETRY_MAX_SECONDS = float(os.getenv("RERANKER_RETRY_MAX_SECONDS", "300"))
+
+# 模型状态
+MODEL_NOT_LOADED = "not_loaded"
+MODEL_LOADING = "loading"
+MODEL_READY = "ready"
+MODEL_FAILED = "failed"  # 加载失败，等待重试
+MODEL_UNAVAILABLE = "unavailable"  # 后端依赖未安装，不再重试
+
+# 预热样本：短文本和接近最大长度的长文本各一条，触发算子初始化和内存分配
+WARMUP_PAIRS = [
+    ["warm up", "warm up"],
+    ["reranker warm-up query", "用于预热 Reranker 的长文本 long warm-up passage " * 40],
+]
+
+# 统计最近多少个批次的延迟
+_LATENCY_WINDOW = 256
+
+
+def _rss_bytes() -> int:
+    """当前进程的常驻内存（Linux 读取 /proc，其他平台用峰值近似）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _model_size_bytes(model) -> Optional[int]:
+    """模型权重大小：ONNX 为模型文件大小，PyTorch 为参数占用的内存"""
+    path = getattr(model, "model_path", None)
+    if path and os.path.exists(path):
+        return os.path.getsize(path)
+    inner = getattr(model, "model", None)
+    if inner is not None and hasattr(inner, "parameters"):
+        return sum(p.numel() * p.element_size() for p in inner.parameters())
+    return None
+
+
+def _mb(value: Optional[int]) -> Optional[float]:
+    return round(value / 1024 / 1024, 1) if value is not None else None
+
+
+@dataclass
+class _RerankRequest:
+    """队列中的一个重排序请求"""
+    pairs: List[List[str]]
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+def _percentile(values: Sequence[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+
+
+class RerankBatcher:
+    """
+    跨请求的推理微批次调度
+    
+    后台任务从队列取出第一个请求后，在 max_wait_ms 内继续收集请求直到对数达到 max_batch_pairs，
+    然后在推理执行器中对整批调用一次 predict，按请求拆分分数。推理期间到达的请求自然累积为下一批。
+    调度任务停止或异常退出时，队列中和正在处理的请求都以异常结束，调用方不会一直等待
+    """
+    
+    def __init__(
+        self,
+        predict: Callable[[List[List[str]]], Sequence[float]],
+        executor: ThreadPoolExecutor,
+        max_batch_pairs: int = RERANKER_MAX_BATCH_PAIRS,
+        max_wait_ms: float = RERANKER_BATCH_WAIT_MS,
+        max_queue: int = RERANKER_QUEUE_SIZE,
+        timeout: float = RERANKER_REQUEST_TIMEOUT_SECONDS
+    ):
+        self.predict = predict
+        self.executor = executor
+        self.max_batch_pairs = max_batch_pairs
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._carry: Optional[_RerankRequest] = None  # 放不进上一批、留给下一批的请求
+        self._batch: List[_RerankRequest] = []  # 正在收集或推理的批次
+        
+        self.batches = 0
+        self.requests = 0
+        self.pairs = 0
+        self.max_queue_depth = 0
+        self.timeouts = 0
+        self._windows_ms = deque(maxlen=_LATENCY_WINDOW)  # 批次中最早的请求等待调度的时间
+        self._latencies_ms = deque(maxlen=_LATENCY_WINDOW)  # 每批推理耗时
+        self._sizes = deque(maxlen=_LATENCY_WINDOW)  # 每批请求数
+        self._pair_ms = deque(maxlen=_LATENCY_WINDOW)  # 每批推理的单对均摊耗时
+    
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            # 上一个调度任务异常退出时留下的请求不会再被处理
+            self._fail_pending(RuntimeError("Reranker batcher restarted"))
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.create_task(self._run())
+    
+    def _fail_pending(self, error: Exception):
+        """以异常结束正在处理、留给下一批和队列中的所有请求"""
+        pending = list(self._batch)
+        if self._carry is not None:
+            pending.append(self._carry)
+        if self._queue is not None:
+            while not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+        self._batch, self._carry = [], None
+        for request in pending:
+            if not request.future.done():
+                request.future.set_exception(error)
+    
+    async def score(self, pairs: List[List[str]]) -> List[float]:
+        """提交 (query, document) 对，返回 Cross-Encoder 分数（入队和推理合计超过 timeout 秒时抛出 TimeoutError）"""
+        if not pairs:
+            return []
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        request = _RerankRequest(pairs=pairs, future=loop.create_future())
+        deadline = loop.time() + self.timeout
+        try:
+            await asyncio.wait_for(self._queue.put(request), self.timeout)
+            self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+            # 超时会取消 future，调度任务跳过已取消的请求
+            return await asyncio.wait_for(request.future, max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+    
+    async def _collect(self) -> List[_RerankRequest]:
+        """取出一个批次的请求"""
+        loop = asyncio.get_running_loop()
+        # 收集中的请求保存在 self._batch 中，任务被取消时由 _fail_pending 结束
+        batch = self._batch = []
+        if self._carry is not None:
+            batch.append(self._carry)
+            self._carry = None
+        else:
+            batch.append(await self._queue.get())
+        num_pairs = len(batch[0].pairs)
+        deadline = loop.time() + self.max_wait
+        while num_pairs < self.max_batch_pairs:
+            if not self._queue.empty():
+                request = self._queue.get_nowait()
+            else:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if num_pairs + len(request.pairs) > self.max_batch_pairs:
+                self._carry = request
+                break
+            batch.append(request)
+            num_pairs += len(request.pairs)
+        return batch
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # 调用方已取消（如客户端断开或超时）的请求不再推理
+            batch = self._batch = [request for request in batch if not request.future.done()]
+            if not batch:
+                continue
+            
+            start = time.perf_counter()
+            pairs = [pair for request in batch for pair in request.pairs]
+            try:
+                scores = await loop.run_in_executor(self.executor, self.predict, pairs)
+                self._pair_ms.append((time.perf_counter() - start) * 1000 / len(pairs))
+            except Exception as e:
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                continue
+            finally:
+                self._windows_ms.append((start - batch[0].enqueued_at) * 1000)
+                self._latencies_ms.append((time.perf_counter() - start) * 1000)
+                self._sizes.append(len(batch))
+                self.batches += 1
+                self.requests += len(batch)
+                self.pairs += len(pairs)
+            
+            offset = 0
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_result([float(s) for s in scores[offset:offset + len(request.pairs)]])
+                offset += len(request.pairs)
+            self._batch = []
+    
+    def ms_per_pair(self) -> Optional[float]:
+        """最近批次中单个 (query, document) 对的推理耗时中位数（还没有推理过时为 None）"""
+        if not self._pair_ms:
+            return None
+        ordered = sorted(self._pair_ms)
+        return ordered[len(ordered) // 2]
+    
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._fail_pending(RuntimeError("Reranker batcher stopped"))
+    
+    def get_stats(self) -> Dict[str, Any]:
+        latencies, windows = list(self._latencies_ms), list(self._windows_ms)
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "pairs": self.pairs,
+            "avg_requests_per_batch": round(sum(self._sizes) / len(self._sizes), 2) if self._sizes else 0.0,
+            "avg_pairs_per_batch": round(self.pairs / self.batches, 2) if self.batches else 0.0,
+            "queue_depth": (self._queue.qsize() if self._queue is not None else 0) + (self._carry is not None),
+            "max_queue_depth": self.max_queue_depth,
+            "timeouts": self.timeouts,
+            "max_batch_pairs": self.max_batch_pairs,
+            "batch_wait_ms": self.max_wait * 1000,
+            "batch_window_ms_p50": _percentile(windows, 0.5),
+            "batch_window_ms_p95": _percentile(windows, 0.95),
+            "batch_latency_ms_p50": _percentile(latencies, 0.5),
+            "batch_latency_ms_p95": _percentile(latencies, 0.95),
+            "pair_ms_p50": _percentile(list(self._pair_ms), 0.5),
+        }
+
+
+class RerankScoreCache:
+    """
+    Cross-Encoder 分数缓存（进程内 LRU，按 (query, document) 对计数）
+    
+    key 为 (查询 hash, chunk_id)，值记录写入时论文的索引版本；版本不一致（论文已重新索引或删除）的分数在读取时作废
+    """
+    
+    def __init__(self, max_size: int = RERANKER_SCORE_CACHE_SIZE, ttl: int = RERANKER_SCORE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, str, float]]" = OrderedDict()  # key -> (过期时间, 版本, 分数)
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+    
+    def get(self, key: Tuple[str, str], version: str) -> Optional[float]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, entry_version, score = entry
+            if entry_version == version and expires_at >= time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return score
+            del self._entries[key]
+            if entry_version != version:
+                self.invalidated += 1
+        self.misses += 1
+        return None
+    
+    def set(self, key: Tuple[str, str], version: str, score: float):
+        if self.max_size <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, version, score)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidated": self.invalidated,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
 
 class RerankerService:
     """Cross-Encoder Reranker 服务"""
@@ -20,32 +344,245 @@ class RerankerService:
     def __init__(self):
         self.model = None
         self.tokenizer = None
-        self._initialized = False
+        # 专用推理线程：模型加载和推理依次执行，不占用默认线程池，也不阻塞事件循环
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reranker")
+        self.batcher = RerankBatcher(self._predict, self._executor)
+        self.score_cache = RerankScoreCache()
+        self.bm25_service = None
         
+        self.state = MODEL_NOT_LOADED
+        self.load_attempts = 0
+        self.last_error: Optional[str] = None
+        self.next_retry_at: Optional[float] = None
+        self.load_ms: Optional[float] = None
+        self.warmup_ms: Optional[float] = None
+        self.model_rss_bytes: Optional[int] = None  # 加载 + 预热前后进程 RSS 的增量
+        self._lifecycle_task: Optional[asyncio.Task] = None
+    
+    @property
+    def ready(self) -> bool:
+        """是否可以接收流量：首次加载完成前为 False，之后即使加载失败也以 Fallback 排序提供服务"""
+        if not RERANKER_EAGER_LOAD:
+            return True
+        return self.state not in (MODEL_NOT_LOADED, MODEL_LOADING) or self.load_attempts > 1
+    
+    def _load_model(self):
+        """加载并预热模型（阻塞，失败时抛出异常）；预热完成后才对请求可见"""
+        device = "cuda" if USE_GPU else "cpu"
+        logger.info(f"Loading reranker model: {RERANKER_MODEL} on {device} ({RERANKER_BACKEND})")
+        
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        model = load_cross_encoder(RERANKER_MODEL, RERANKER_BACKEND, device)
+        self.load_ms = round((time.perf_counter() - start) * 1000, 1)
+        
+        start = time.perf_counter()
+        model.predict(WARMUP_PAIRS)
+        self.warmup_ms = round((time.perf_counter() - start) * 1000, 1)
+        self.model_rss_bytes = max(_rss_bytes() - rss_before, 0)
+        
+        self.model = model
+        self.state = MODEL_READY
+        self.last_error = None
+        self.next_retry_at = None
+        logger.info(
+            f"✓ Reranker model loaded: {RERANKER_MODEL} ({RERANKER_BACKEND}), "
+            f"load {self.load_ms}ms, warm-up {self.warmup_ms}ms, +{_mb(self.model_rss_bytes)}MB RSS"
+        )
+    
+    def start(self):
+        """在后台加载并预热模型，失败时按指数退避重试（重复调用无效）"""
+        if self._lifecycle_task is None:
+            self._lifecycle_task = asyncio.create_task(self._run_lifecycle())
+    
+    async def _run_lifecycle(self):
+        loop = asyncio.get_running_loop()
+        while self.model is None:
+            self.state = MODEL_LOADING
+            self.load_attempts += 1
+            try:
+                await loop.run_in_executor(self._executor, self._load_model)
+            except ImportError as e:
+                self.state = MODEL_UNAVAILABLE
+                self.last_error = str(e)
+                logger.warning(
+                    f"Reranker backend {RERANKER_BACKEND} dependencies not installed ({e}), using fallback reranker"
+                )
+                return
+            except Exception as e:
+                delay = min(RERANKER_RETRY_MAX_SECONDS, RERANKER_RETRY_BASE_SECONDS * 2 ** (self.load_attempts - 1))
+                self.state = MODEL_FAILED
+                self.last_error = str(e)
+                self.next_retry_at = time.time() + delay
+                logger.error(
+                    f"Failed to load reranker model (attempt {self.load_attempts}), retrying in {delay:.0f}s: {e}"
+                )
+                await asyncio.sleep(delay)
+    
     def _lazy_init(self):
-        """延迟初始化模型（首次使用时加载）"""
-        if self._initialized:
+        """同步调用方（脚本等）首次使用时在当前线程加载模型，只尝试一次"""
+        if self.model is not None or self.state != MODEL_NOT_LOADED:
             return
-            
+        self.load_attempts += 1
         try:
-            from sentence_transformers import CrossEncoder
-            
-            device = "cuda" if USE_GPU else "cpu"
-            logger.info(f"Loading reranker model: {RERANKER_MODEL} on {device}")
-            
-            self.model = CrossEncoder(RERANKER_MODEL, device=device)
-            self._initialized = True
-            
-            logger.info(f"✓ Reranker model loaded: {RERANKER_MODEL}")
-            
-        except ImportError:
-            logger.warning("sentence-transformers not installed, using fallback reranker")
-            self._initialized = True
-            self.model = None
+            self._load_model()
+        except ImportError as e:
+            logger.warning(f"Reranker backend {RERANKER_BACKEND} dependencies not installed ({e}), using fallback reranker")
+            self.state = MODEL_UNAVAILABLE
+            self.last_error = str(e)
         except Exception as e:
             logger.error(f"Failed to load reranker model: {e}")
-            self._initialized = True
-            self.model = None
+            self.state = MODEL_FAILED
+            self.last_error = str(e)
+    
+    def _predict(self, pairs: List[List[str]]) -> Sequence[float]:
+        """在推理线程中执行"""
+        if self.model is None:
+            raise RuntimeError("Reranker model not available")
+        return self.model.predict(pairs)
+    
+    def _paper_version(self, paper_id: str) -> str:
+        if self.bm25_service is None:
+            self.bm25_service = get_bm25_service()
+        return self.bm25_service.paper_version(paper_id)
+    
+    def _lookup_scores(
+        self,
+        queries: List[str],
+        document_lists: List[List[Dict[str, Any]]],
+        content_field: str
+    ) -> Tuple[List[List[Optional[float]]], list, List[List[str]], List[Tuple[int, int]]]:
+        """
+        查询分数缓存
+        
+        Returns:
+            (各文档的分数（未命中为 None）, 各文档的缓存 key 和版本（没有 chunk_id/paper_id 时为 None）,
+             需要推理的 pairs, 这些 pairs 对应的 (查询下标, 文档下标))
+        """
+        scores, entries, pairs, positions = [], [], [], []
+        for i, (query, documents) in enumerate(zip(queries, document_lists)):
+            query_hash = hash_key(RERANKER_MODEL, RERANKER_BACKEND, content_field, normalize_query(query, lower=False))
+            query_scores, query_entries = [], []
+            for j, doc in enumerate(documents):
+                score, entry = None, None
+                chunk_id, paper_id = doc.get("chunk_id"), doc.get("paper_id")
+                if RERANKER_SCORE_CACHE_SIZE > 0 and chunk_id and paper_id:
+                    entry = ((query_hash, chunk_id), self._paper_version(paper_id))
+                    score = self.score_cache.get(*entry)
+                if score is None:
+                    pairs.append([query, doc.get(content_field, "") or ""])
+                    positions.append((i, j))
+                query_scores.append(score)
+                query_entries.append(entry)
+            scores.append(query_scores)
+            entries.append(query_entries)
+        return scores, entries, pairs, positions
+    
+    def _store_scores(
+        self,
+        scores: List[List[Optional[float]]],
+        entries: list,
+        positions: List[Tuple[int, int]],
+        new_scores: Sequence[float]
+    ):
+        """把推理得到的分数填入 scores 并写入缓存"""
+        for (i, j), score in zip(positions, new_scores):
+            scores[i][j] = float(score)
+            if entries[i][j] is not None:
+                self.score_cache.set(*entries[i][j], float(score))
+    
+    @staticmethod
+    def _apply_scores(
+        documents: List[Dict[str, Any]],
+        scores: Sequence[float],
+        top_k: Optional[int]
+    ) -> List[Dict[str, Any]]:
+        """写入 rerank_score 并按分数降序返回 Top-K"""
+        for doc, score in zip(documents, scores):
+            doc['rerank_score'] = float(score)
+        sorted_docs = sorted(documents, key=lambda x: x.get('rerank_score', 0), reverse=True)
+        return sorted_docs[:top_k] if top_k else sorted_docs
+    
+    async def rerank_async(
+        self,
+        query: str,
+        documents: List[Dict[str, Any]],
+        top_k: Optional[int] = None,
+        content_field: str = "content"
+    ) -> List[Dict[str, Any]]:
+        """rerank 的异步版本：经微批次队列在推理线程中评分，并发请求共享推理批次"""
+        results = await self.rerank_batch_async([query], [documents], top_k, content_field)
+        return results[0]
+    
+    async def rerank_batch_async(
+        self,
+        queries: List[str],
+        document_lists: List[List[Dict[str, Any]]],
+        top_k: Optional[int] = None,
+        content_field: str = "content"
+    ) -> List[List[Dict[str, Any]]]:
+        """rerank_batch 的异步版本（只推理分数缓存中没有的文档对；模型不可用或推理失败时使用 Fallback 排序）"""
+        num_pairs = sum(len(documents) for documents in document_lists)
+        if not num_pairs:
+            return [[] for _ in document_lists]
+        
+        scores, entries, pairs, positions = self._lookup_scores(queries, document_lists, content_field)
+        if pairs:
+            if self.model is None:
+                # 模型尚未就绪：开始后台加载（如未开始），本次请求使用 Fallback 排序
+                self.start()
+                logger.warning(f"Reranker model not available ({self.state}), using fallback")
+                return [self._fallback_rerank(documents, top_k) if documents else [] for documents in document_lists]
+            try:
+                new_scores = await self.batcher.score(pairs)
+            except Exception as e:
+                logger.error(f"Reranking failed: {e}")
+                return [self._fallback_rerank(documents, top_k) if documents else [] for documents in document_lists]
+            self._store_scores(scores, entries, positions, new_scores)
+        
+        results = [
+            self._apply_scores(documents, query_scores, top_k)
+            for documents, query_scores in zip(document_lists, scores)
+        ]
+        logger.info(f"Reranked {num_pairs} pairs for {len(queries)} queries ({len(pairs)} computed, {num_pairs - len(pairs)} cached)")
+        return results
+    
+    def ms_per_pair(self) -> Optional[float]:
+        """最近的单个 (query, document) 对推理耗时（毫秒），用于估算重排序延迟"""
+        return self.batcher.ms_per_pair()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """模型状态、内存占用与微批次统计"""
+        return {
+            "model": RERANKER_MODEL,
+            "backend": RERANKER_BACKEND,
+            "state": self.state,
+            "ready": self.ready,
+            "loaded": self.model is not None,
+            "load_attempts": self.load_attempts,
+            "last_error": self.last_error,
+            "next_retry_at": self.next_retry_at,
+            "load_ms": self.load_ms,
+            "warmup_ms": self.warmup_ms,
+            "memory": {
+                "process_rss_mb": _mb(_rss_bytes()),
+                "model_rss_mb": _mb(self.model_rss_bytes),
+                "model_weights_mb": _mb(_model_size_bytes(self.model)) if self.model is not None else None,
+            },
+            "batching": self.batcher.get_stats(),
+            "score_cache": self.score_cache.get_stats(),
+        }
+    
+    async def shutdown(self):
+        if self._lifecycle_task is not None:
+            self._lifecycle_task.cancel()
+            try:
+                await self._lifecycle_task
+            except asyncio.CancelledError:
+                pass
+            self._lifecycle_task = None
+        await self.batcher.stop()
+        self._executor.shutdown(wait=False)
     
     def rerank(
         self, 
@@ -68,44 +605,45 @@ class RerankerService:
         """
         if not documents:
             return []
+        return self.rerank_batch([query], [documents], top_k, content_field)[0]
+    
+    def rerank_batch(
+        self,
+        queries: List[str],
+        document_lists: List[List[Dict[str, Any]]],
+        top_k: Optional[int] = None,
+        content_field: str = "content"
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        批量重排序：所有查询的 (query, document) 对合并为一次 Cross-Encoder 推理，共享推理批次
         
-        self._lazy_init()
-        
-        if self.model is None:
-            # Fallback: 使用原有分数排序
-            logger.warning("Reranker model not available, using fallback")
-            return self._fallback_rerank(documents, top_k)
-        
-        try:
-            # 构建 query-document pairs
-            pairs = []
-            for doc in documents:
-                content = doc.get(content_field, "")
-                if content:
-                    pairs.append([query, content])
-                else:
-                    pairs.append([query, ""])
-            
-            # 计算 Cross-Encoder 分数
-            scores = self.model.predict(pairs)
-            
-            # 添加分数到文档
-            for i, doc in enumerate(documents):
-                doc['rerank_score'] = float(scores[i])
-            
-            # 按 rerank_score 排序
-            sorted_docs = sorted(documents, key=lambda x: x.get('rerank_score', 0), reverse=True)
-            
-            # 返回 Top-K
-            if top_k:
-                sorted_docs = sorted_docs[:top_k]
-            
-            logger.info(f"Reranked {len(documents)} documents, returning {len(sorted_docs)}")
-            return sorted_docs
+        Args:
+            queries: 查询列表
+            document_lists: 与 queries 对应的文档列表
+            top_k: 每个查询返回的文档数量（None 表示返回全部）
+            content_field: 文档中内容字段的名称
             
-        except Exception as e:
-            logger.error(f"Reranking failed: {e}")
-            return self._fallback_rerank(documents, top_k)
+        Returns:
+            与 queries 顺序一致的重排序结果
+        """
+        scores, entries, pairs, positions = self._lookup_scores(queries, document_lists, content_field)
+        if pairs:
+            self._lazy_init()
+            if self.model is None:
+                logger.warning("Reranker model not available, using fallback")
+                return [self._fallback_rerank(documents, top_k) if documents else [] for documents in document_lists]
+            try:
+                new_scores = self.model.predict(pairs)
+            except Exception as e:
+                logger.error(f"Batch reranking failed: {e}")
+                return [self._fallback_rerank(documents, top_k) if documents else [] for documents in document_lists]
+            self._store_scores(scores, entries, positions, new_scores)
+        
+        logger.info(f"Reranked {len(scores)} queries ({len(pairs)} pairs computed)")
+        return [
+            self._apply_scores(documents, query_scores, top_k)
+            for documents, query_scores in zip(document_lists, scores)
+        ]
     
     def _fallback_rerank(
         self, 
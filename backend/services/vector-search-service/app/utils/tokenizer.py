@@ -0,0 +1,113 @@
+"""
+分词工具 - BM25 索引与查询共用的 jieba 分词
+
+- tokenize: 单条文本分词
+- tokenize_batch: 批量分词，文本较多时分发到进程池（jieba 是纯 Python 实现，受 GIL 限制，线程无法并行）
+- tokenize_query: 带 LRU 缓存的查询分词
+- warm_up: 预加载 jieba 词典，避免首次查询时的加载延迟
+"""
+import logging
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+import jieba
+
+logger = logging.getLogger(__name__)
+
+# 进程池大小（<=1 时不使用进程池）
+TOKENIZER_WORKERS = int(os.getenv("TOKENIZER_WORKERS", str(min(4, os.cpu_count() or 1))))
+# 文本数少于该值时直接在当前进程分词（进程间传输的开销大于收益）
+TOKENIZER_POOL_MIN_TEXTS = int(os.getenv("TOKENIZER_POOL_MIN_TEXTS", "64"))
+# 每个任务包含的文本数
+TOKENIZER_POOL_CHUNKSIZE = int(os.getenv("TOKENIZER_POOL_CHUNKSIZE", "32"))
+# 查询分词缓存条数
+TOKENIZER_QUERY_CACHE_SIZE = int(os.getenv("TOKENIZER_QUERY_CACHE_SIZE", "4096"))
+
+_CLEAN_PATTERN = re.compile(r'[^\w\s\u4e00-\u9fff]')
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    分词（支持中英文）
+    """
+    # 清理文本
+    text = _CLEAN_PATTERN.sub(' ', text.lower())
+
+    # 使用 jieba 分词（支持中文），过滤停用词和短词
+    return [t for t in (t.strip() for t in jieba.cut(text)) if len(t) > 1]
+
+
+@lru_cache(maxsize=TOKENIZER_QUERY_CACHE_SIZE)
+def tokenize_query(query: str) -> Tuple[str, ...]:
+    """查询分词（LRU 缓存，返回不可变元组）"""
+    return tuple(tokenize(query))
+
+
+def warm_up():
+    """预加载 jieba 词典"""
+    jieba.initialize()
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if TOKENIZER_WORKERS <= 1:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn：服务进程中有事件循环和后台线程，fork 不安全
+                _pool = ProcessPoolExecutor(
+                    max_workers=TOKENIZER_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=warm_up
+                )
+                logger.info(f"✓ Tokenizer process pool started: {TOKENIZER_WORKERS} workers")
+    return _pool
+
+
+def tokenize_batch(texts: Sequence[str]) -> List[List[str]]:
+    """
+    批量分词，结果与输入顺序一致
+
+    文本数达到 TOKENIZER_POOL_MIN_TEXTS 时分发到进程池；进程池不可用时退回当前进程
+    """
+    pool = _get_pool() if len(texts) >= TOKENIZER_POOL_MIN_TEXTS else None
+    if pool is not None:
+        try:
+            return list(pool.map(tokenize, texts, chunksize=TOKENIZER_POOL_CHUNKSIZE))
+        except Exception as e:
+            logger.warning(f"Tokenizer pool failed, falling back to in-process: {e}")
+            shutdown()
+    return [tokenize(text) for text in texts]
+
+
+def get_stats() -> dict:
+    """分词统计信息"""
+    info = tokenize_query.cache_info()
+    return {
+        "workers": TOKENIZER_WORKERS,
+        "pool_started": _pool is not None,
+        "query_cache": {
+            "size": info.currsize,
+            "max_size": info.maxsize,
+            "hits": info.hits,
+            "misses": info.misses,
+        },
+    }
+
+
+def shutdown():
+    """关闭进程池"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,327 @@
+"""
+两级缓存 - 进程内 LRU + Redis 共享层
+
+- 读取顺序：进程内 LRU → Redis → loader（调用方提供的计算/远程调用）
+- Redis 命中的值回填 LRU；loader 的结果同时写入两级
+- 相同 key 的并发未命中合并为一次 loader 调用（single-flight）；get_or_load_many 把一批 key 的未命中合并为一次批量 loader 调用，
+  同样与进行中的相同 key 合并
+- 未配置 REDIS_URL 或 Redis 出错时只使用进程内 LRU，不影响调用方
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import redis.asyncio as redis
+
+from app.database import REDIS_URL
+
+logger = logging.getLogger(__name__)
+
+# Redis 单次读写超时（秒），缓存层不应拖慢请求
+REDIS_CACHE_TIMEOUT = 0.2
+# Redis 出错后暂停使用的时间（秒），避免每次请求都等待超时
+REDIS_CACHE_RETRY_SECONDS = 30
+
+
+@dataclass
+class CacheStats:
+    """缓存统计"""
+    local_hits: int = 0
+    redis_hits: int = 0
+    misses: int = 0
+    coalesced: int = 0  # 合并到进行中请求的未命中
+    writes: int = 0
+    redis_errors: int = 0
+
+
+def hash_key(*parts: str) -> str:
+    """把任意长度的文本压缩为固定长度的 key"""
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class TwoTierCache:
+    """
+    两级缓存
+
+    值在 Redis 中以 bytes 保存，由 encode/decode 负责序列化；redis_url 为空时只使用进程内 LRU，无需 encode/decode
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        max_size: int,
+        ttl: int,
+        encode: Optional[Callable[[Any], bytes]] = None,
+        decode: Optional[Callable[[bytes], Any]] = None,
+        redis_url: str = REDIS_URL
+    ):
+        self.namespace = namespace
+        self.max_size = max_size
+        self.ttl = ttl
+        self.encode = encode
+        self.decode = decode
+        self.redis_url = redis_url
+        self._client: Optional[redis.Redis] = None
+        self._local: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()  # key -> (过期时间, 值)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._redis_retry_at = 0.0
+        self.stats = CacheStats()
+
+    async def _get_client(self) -> Optional[redis.Redis]:
+        """获取 Redis 客户端（未配置或暂停使用时为 None）"""
+        if not self.redis_url or time.monotonic() < self._redis_retry_at:
+            return None
+        if self._client is None:
+            self._client = redis.from_url(
+                self.redis_url,
+                socket_timeout=REDIS_CACHE_TIMEOUT,
+                socket_connect_timeout=REDIS_CACHE_TIMEOUT
+            )
+        return self._client
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _redis_failed(self, action: str, error: Exception):
+        self.stats.redis_errors += 1
+        self._redis_retry_at = time.monotonic() + REDIS_CACHE_RETRY_SECONDS
+        logger.warning(
+            f"Redis cache {action} failed ({self.namespace}), "
+            f"using local cache only for {REDIS_CACHE_RETRY_SECONDS}s: {error}"
+        )
+
+    # ==================== 进程内 LRU ====================
+
+    def _get_local(self, key: str) -> Tuple[bool, Any]:
+        entry = self._local.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._local[key]
+            return False, None
+        self._local.move_to_end(key)
+        return True, value
+
+    def _set_local(self, key: str, value: Any):
+        if self.max_size <= 0:
+            return
+        self._local[key] = (time.monotonic() + self.ttl, value)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_size:
+            self._local.popitem(last=False)
+
+    # ==================== Redis ====================
+
+    async def _get_redis(self, key: str) -> Tuple[bool, Any]:
+        try:
+            client = await self._get_client()
+            if client is None:
+                return False, None
+            data = await client.get(self._redis_key(key))
+        except Exception as e:
+            self._redis_failed("read", e)
+            return False, None
+        if data is None:
+            return False, None
+        try:
+            return True, self.decode(data)
+        except Exception as e:
+            logger.warning(f"Dropping undecodable cache entry ({self.namespace}): {e}")
+            return False, None
+
+    async def _get_redis_many(self, keys: List[str]) -> Dict[str, Any]:
+        """批量读取 Redis，返回命中的 key -> 值"""
+        try:
+            client = await self._get_client()
+            if client is None:
+                return {}
+            values = await client.mget([self._redis_key(key) for key in keys])
+        except Exception as e:
+            self._redis_failed("read", e)
+            return {}
+        found = {}
+        for key, data in zip(keys, values):
+            if data is None:
+                continue
+            try:
+                found[key] = self.decode(data)
+            except Exception as e:
+                logger.warning(f"Dropping undecodable cache entry ({self.namespace}): {e}")
+        return found
+
+    async def _set_redis(self, key: str, value: Any):
+        try:
+            client = await self._get_client()
+            if client is not None:
+                await client.set(self._redis_key(key), self.encode(value), ex=self.ttl)
+        except Exception as e:
+            self._redis_failed("write", e)
+
+    # ==================== 读写 ====================
+
+    async def get(self, key: str) -> Tuple[bool, Any]:
+        """返回 (是否命中, 值)"""
+        found, value = self._get_local(key)
+        if found:
+            self.stats.local_hits += 1
+            return True, value
+        found, value = await self._get_redis(key)
+        if found:
+            self.stats.redis_hits += 1
+            self._set_local(key, value)
+            return True, value
+        return False, None
+
+    async def set(self, key: str, value: Any):
+        self._set_local(key, value)
+        await self._set_redis(key, value)
+        self.stats.writes += 1
+
+    async def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        should_store: Callable[[Any], bool] = lambda value: True
+    ) -> Any:
+        """
+        读取缓存，未命中时调用 loader 并写入缓存
+
+        并发的相同 key 只调用一次 loader；should_store 返回 False 的结果（如失败时的降级值）不写入缓存
+        """
+        found, value = self._get_local(key)
+        if found:
+            self.stats.local_hits += 1
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats.coalesced += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # 发起请求的调用方被取消（如客户端断开）时由当前调用方重新加载
+                if not inflight.cancelled():
+                    raise
+                return await self.get_or_load(key, loader, should_store)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            found, value = await self._get_redis(key)
+            if found:
+                self.stats.redis_hits += 1
+                self._set_local(key, value)
+            else:
+                self.stats.misses += 1
+                value = await loader()
+                if should_store(value):
+                    await self.set(key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def get_or_load_many(
+        self,
+        keys: List[str],
+        loader: Callable[[List[str]], Awaitable[List[Any]]],
+        should_store: Callable[[Any], bool] = lambda value: True
+    ) -> List[Any]:
+        """
+        批量读取缓存，未命中的 key 合并为一次 loader 调用（loader 按传入 key 的顺序返回值）并写入缓存
+
+        与 get_or_load 共享 single-flight：其他调用方正在加载的 key 等待其结果，本次加载的 key 对并发的相同 key 可见；
+        批内重复的 key 只加载一次。返回与 keys 顺序一致的值
+        """
+        values: Dict[str, Any] = {}
+        waiting: Dict[str, asyncio.Future] = {}
+        claimed: Dict[str, asyncio.Future] = {}
+        loop = asyncio.get_running_loop()
+        for key in dict.fromkeys(keys):
+            found, value = self._get_local(key)
+            if found:
+                self.stats.local_hits += 1
+                values[key] = value
+            elif key in self._inflight:
+                self.stats.coalesced += 1
+                waiting[key] = self._inflight[key]
+            else:
+                claimed[key] = self._inflight[key] = loop.create_future()
+
+        if claimed:
+            try:
+                found = await self._get_redis_many(list(claimed))
+                for key, value in found.items():
+                    self.stats.redis_hits += 1
+                    self._set_local(key, value)
+                    values[key] = value
+                    claimed[key].set_result(value)
+
+                missing = [key for key in claimed if key not in found]
+                if missing:
+                    self.stats.misses += len(missing)
+                    loaded = await loader(missing)
+                    for key, value in zip(missing, loaded):
+                        if should_store(value):
+                            await self.set(key, value)
+                        values[key] = value
+                        claimed[key].set_result(value)
+            except asyncio.CancelledError:
+                for future in claimed.values():
+                    future.cancel()
+                raise
+            except Exception as e:
+                for future in claimed.values():
+                    if not future.done():
+                        future.set_exception(e)
+                        future.exception()
+                raise
+            finally:
+                for key in claimed:
+                    del self._inflight[key]
+
+        for key, future in waiting.items():
+            try:
+                values[key] = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # 发起请求的调用方被取消时由当前调用方重新加载
+                if not future.cancelled():
+                    raise
+                values[key] = await self.get_or_load(
+                    key, lambda key=key: self._load_one(loader, key), should_store
+                )
+        return [values[key] for key in keys]
+
+    @staticmethod
+    async def _load_one(loader: Callable[[List[str]], Awaitable[List[Any]]], key: str) -> Any:
+        return (await loader([key]))[0]
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats.local_hits + self.stats.redis_hits + self.stats.misses + self.stats.coalesced
+        hits = self.stats.local_hits + self.stats.redis_hits + self.stats.coalesced
+        return {
+            **asdict(self.stats),
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "local_size": len(self._local),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "redis_enabled": bool(self.redis_url),
+        }
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
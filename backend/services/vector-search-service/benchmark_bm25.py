@@ -0,0 +1,160 @@
+"""
+BM25 检索性能基准测试
+
+用合成语料（Zipf 分布词频）直接构建索引段，测量 p50/p99 延迟：
+- 全局查询：穷举评分 vs Block-Max 剪枝（同时校验两者 Top-K 分数一致）
+- 论文内查询
+
+用法:
+    python benchmark_bm25.py
+    python benchmark_bm25.py --sizes 10000 100000 1000000 --queries 500 --top-k 20
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# 添加app目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.bm25_index import BM25Index, _Segment, _StringColumn, STRING_FIELDS, PAPER_FIELDS
+
+CHUNKS_PER_PAPER = 50
+SEGMENT_DOCS = 100_000  # 与合并策略下的段规模接近
+
+
+def build_segment(name: str, num_docs: int, first_paper: int, vocab: list, args, rng) -> _Segment:
+    """
+    生成一个合成段：每个文档 doc_len 个 Zipf 分布的词
+
+    --topic-share > 0 时，每篇论文随机属于一个主题，该比例的词从主题词表（词表的一个错位排列）中抽取，
+    模拟同一论文的 chunk 共享术语的局部性
+    """
+    doc_len = rng.poisson(args.doc_len, num_docs).clip(1).astype(np.int64)
+    tokens = (rng.zipf(args.zipf, int(doc_len.sum())) - 1) % len(vocab)
+    docs = np.repeat(np.arange(num_docs, dtype=np.int64), doc_len)
+
+    if args.topic_share > 0:
+        paper_topic = rng.integers(args.topics, size=(num_docs + CHUNKS_PER_PAPER - 1) // CHUNKS_PER_PAPER)
+        token_topic = paper_topic[docs // CHUNKS_PER_PAPER]
+        topical = rng.random(len(tokens)) < args.topic_share
+        tokens[topical] = (tokens[topical] + 1 + token_topic[topical] * 7919) % len(vocab)
+
+    keys, tfs = np.unique(docs * len(vocab) + tokens, return_counts=True)
+    entry_docs, entry_terms = np.divmod(keys, len(vocab))
+
+    num_papers = (num_docs + CHUNKS_PER_PAPER - 1) // CHUNKS_PER_PAPER
+    paper_start = np.minimum(np.arange(num_papers + 1) * CHUNKS_PER_PAPER, num_docs)
+    empty = _StringColumn.from_strings([""] * num_docs)
+
+    return _Segment._from_entries(
+        name,
+        vocab,
+        entry_terms,
+        entry_docs.astype(np.int32),
+        tfs.astype(np.int32),
+        doc_len.astype(np.int32),
+        _StringColumn.from_strings(f"paper-{first_paper + i}" for i in range(num_papers)),
+        paper_start.astype(np.int64),
+        np.arange(num_docs, dtype=np.int32) % CHUNKS_PER_PAPER,
+        {field: empty for field in STRING_FIELDS},
+        {field: _StringColumn.from_strings([""] * num_papers) for field in PAPER_FIELDS},
+    )
+
+
+def build_index(num_docs: int, vocab: list, args, rng) -> BM25Index:
+    index = BM25Index(path=None)
+    segments = []
+    built, first_paper = 0, 0
+    while built < num_docs:
+        size = min(SEGMENT_DOCS, num_docs - built)
+        segments.append(build_segment(f"seg-{len(segments):08d}", size, first_paper, vocab, args, rng))
+        built += size
+        first_paper += (size + CHUNKS_PER_PAPER - 1) // CHUNKS_PER_PAPER
+
+    index._install_segments_locked(segments)
+    return index
+
+
+def percentile(samples: list, q: float) -> float:
+    return float(np.percentile(np.asarray(samples) * 1000, q))
+
+
+def run(num_docs: int, vocab: list, args, rng):
+    start = time.perf_counter()
+    index = build_index(num_docs, vocab, args, rng)
+    build_time = time.perf_counter() - start
+
+    queries = []
+    for _ in range(args.queries):
+        tokens = (rng.zipf(args.zipf, rng.integers(2, 7)) - 1) % len(vocab)
+        if args.topic_share > 0:
+            # 查询词按同样比例来自某个主题
+            topical = rng.random(len(tokens)) < args.topic_share
+            tokens[topical] = (tokens[topical] + 1 + rng.integers(args.topics) * 7919) % len(vocab)
+        queries.append([vocab[t] for t in tokens])
+    papers = index.papers()
+
+    # 预热：首次查询会计算各段权重矩阵和块上界
+    index.search(queries[0], top_k=args.top_k, pruning=True)
+
+    exhaustive_times, pruned_times, paper_times = [], [], []
+    for query in queries:
+        t = time.perf_counter()
+        exhaustive = index.search(query, top_k=args.top_k, pruning=False)
+        exhaustive_times.append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        pruned = index.search(query, top_k=args.top_k, pruning=True)
+        pruned_times.append(time.perf_counter() - t)
+
+        assert np.allclose([s for s, _ in exhaustive], [s for s, _ in pruned], rtol=1e-5), query
+
+        paper_id = papers[int(rng.integers(len(papers)))]
+        t = time.perf_counter()
+        index.search(query, top_k=args.top_k, paper_id=paper_id)
+        paper_times.append(time.perf_counter() - t)
+
+    pruning = index.get_stats()["block_max_pruning"]
+    scored = pruning["blocks_scored"] / max(pruning["blocks_total"], 1)
+    print(
+        f"{num_docs:>10,} | {build_time:>6.1f}s | "
+        f"{percentile(exhaustive_times, 50):>7.2f} / {percentile(exhaustive_times, 99):>7.2f} | "
+        f"{percentile(pruned_times, 50):>7.2f} / {percentile(pruned_times, 99):>7.2f} | {scored:>7.1%} | "
+        f"{percentile(paper_times, 50):>6.2f} / {percentile(paper_times, 99):>6.2f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BM25 检索性能基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="语料 chunk 数")
+    parser.add_argument("--queries", type=int, default=200, help="每个规模的查询数")
+    parser.add_argument("--top-k", type=int, default=20, help="返回数量")
+    parser.add_argument("--doc-len", type=int, default=120, help="平均 chunk 长度（词数）")
+    parser.add_argument("--vocab", type=int, default=50_000, help="词表大小")
+    parser.add_argument("--zipf", type=float, default=1.3, help="词频 Zipf 分布参数")
+    parser.add_argument("--topics", type=int, default=500, help="主题数")
+    parser.add_argument("--topic-share", type=float, default=0.0, help="从论文主题词表抽取的词比例（0 为无局部性）")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vocab = sorted(f"t{i:06d}" for i in range(args.vocab))
+
+    print("=" * 96)
+    print(
+        f"BM25 benchmark: top_k={args.top_k}, queries={args.queries}, avg_doc_len={args.doc_len}, "
+        f"topic_share={args.topic_share}"
+    )
+    print("latency: p50 / p99 (ms); blocks = fraction of blocks scored with Block-Max pruning")
+    print("=" * 96)
+    print(f"{'chunks':>10} | {'build':>7} | {'exhaustive':>17} | {'block-max':>17} | {'blocks':>7} | {'paper-scoped':>15}")
+    print("-" * 96)
+    for size in args.sizes:
+        run(size, vocab, args, rng)
+
+
+if __name__ == "__main__":
+    main()
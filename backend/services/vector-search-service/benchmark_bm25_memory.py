@@ -0,0 +1,179 @@
+"""
+BM25 索引内存占用测试
+
+用合成的中英文 chunk（约 1000 字符）分别构建：
+- legacy：原 rank_bm25 方案的数据结构（chunk_map + global_chunk_map 两份元数据、两份分词语料、
+  每篇论文和全局各一个 BM25Okapi 的 doc_freqs/idf/doc_len）
+- index：当前的 BM25Index（内存模式）
+
+用 tracemalloc 统计构建后常驻的 Python 堆 + numpy 数组内存，换算为每 1 万个 chunk 的占用
+
+用法:
+    python benchmark_bm25_memory.py
+    python benchmark_bm25_memory.py --chunks 20000 --chunks-per-paper 30
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+
+# 添加app目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.bm25_index import BM25Index
+from app.utils import tokenizer
+from benchmark_tokenizer import make_chunks
+
+
+def make_papers(args) -> list:
+    """生成 (paper_id, chunks)，chunk 字段与 /index 写入 BM25 的一致"""
+    contents = make_chunks(args.chunks, args.chunk_chars, args.seed)
+    papers = []
+    for start in range(0, len(contents), args.chunks_per_paper):
+        paper_id = f"paper-{start // args.chunks_per_paper:06d}"
+        papers.append((paper_id, [
+            {
+                "content": content,
+                "chunk_id": f"{paper_id}_chunk_{i}",
+                "chunk_index": i,
+                "title": f"A Study of Sparse Retrieval Methods, Part {start}",
+                "file_name": f"{paper_id}.pdf",
+            }
+            for i, content in enumerate(contents[start:start + args.chunks_per_paper])
+        ]))
+    return papers
+
+
+def _own(text: str) -> str:
+    """复制出新的字符串对象（原实现中分词结果和请求正文都是各自独立的对象）"""
+    return (text + " ")[:-1]
+
+
+def build_legacy(papers: list, token_lists: list) -> dict:
+    """重现原 BM25Service 常驻的数据结构（rank_bm25 内部结构按其实现展开）"""
+    def okapi(corpus):
+        doc_freqs = [dict(Counter(doc)) for doc in corpus]
+        df = Counter(term for freqs in doc_freqs for term in freqs)
+        return {"doc_freqs": doc_freqs, "idf": {t: 0.0 for t in df}, "doc_len": [len(d) for d in corpus]}
+
+    state = {"corpus": {}, "chunk_map": {}, "bm25_index": {}, "global_corpus": [], "global_chunk_map": []}
+    offset = 0
+    for paper_id, chunks in papers:
+        tokenized = [[_own(t) for t in tokens] for tokens in token_lists[offset:offset + len(chunks)]]
+        offset += len(chunks)
+        metadata = [
+            {
+                "paper_id": paper_id,
+                "chunk_id": c["chunk_id"],
+                "chunk_index": c["chunk_index"],
+                "content": _own(c["content"]),
+                "title": c["title"],
+                "file_name": c["file_name"],
+            }
+            for c in chunks
+        ]
+        state["corpus"][paper_id] = tokenized
+        state["chunk_map"][paper_id] = metadata
+        state["bm25_index"][paper_id] = okapi(tokenized)
+        state["global_corpus"].extend(tokenized)
+        state["global_chunk_map"].extend(metadata)
+    state["global_bm25"] = okapi(state["global_corpus"])
+    return state
+
+
+def build_index(papers: list, token_lists: list, path=None) -> BM25Index:
+    index = BM25Index(path=path)
+    batch = []
+    offset = 0
+    for paper_id, chunks in papers:
+        tokenized = token_lists[offset:offset + len(chunks)]
+        offset += len(chunks)
+        docs = [
+            {
+                "paper_id": paper_id,
+                "chunk_id": c["chunk_id"],
+                "chunk_index": c["chunk_index"],
+                "content": c["content"],
+                "title": c["title"],
+                "file_name": c["file_name"],
+            }
+            for c in chunks
+        ]
+        batch.append((paper_id, docs, [dict(Counter(t)) for t in tokenized], [len(t) for t in tokenized]))
+    index.add_many(batch)
+    # 触发权重矩阵计算，与线上查询后的常驻状态一致
+    index.search(token_lists[0][:3], top_k=10)
+    return index
+
+
+def measure(build) -> tuple:
+    """返回 (构建结果, 常驻字节数, 耗时)"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, elapsed
+
+
+def dir_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, files in os.walk(path)
+        for name in files
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BM25 索引内存占用测试")
+    parser.add_argument("--chunks", type=int, default=10_000, help="chunk 数")
+    parser.add_argument("--chunk-chars", type=int, default=1000, help="每个 chunk 的字符数")
+    parser.add_argument("--chunks-per-paper", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    tokenizer.warm_up()
+    papers = make_papers(args)
+    contents = [c["content"] for _, chunks in papers for c in chunks]
+    token_lists = tokenizer.tokenize_batch(contents)
+    tokenizer.shutdown()
+
+    content_bytes = sum(len(c.encode("utf-8")) for c in contents)
+    per_10k = 10_000 / args.chunks
+
+    print("=" * 72)
+    print(
+        f"BM25 memory: chunks={args.chunks:,}, papers={len(papers):,}, "
+        f"tokens={sum(map(len, token_lists)):,}, content={content_bytes / 2**20:.1f} MiB"
+    )
+    print("=" * 72)
+    print(f"{'layout':<22} | {'resident':>12} | {'per 10k chunks':>15} | {'build':>8}")
+    print("-" * 72)
+
+    legacy, legacy_bytes, elapsed = measure(lambda: build_legacy(papers, token_lists))
+    print(f"{'legacy (rank_bm25)':<22} | {legacy_bytes / 2**20:>8.1f} MiB | "
+          f"{legacy_bytes * per_10k / 2**20:>11.1f} MiB | {elapsed:>7.2f}s")
+    del legacy
+
+    index, index_bytes, elapsed = measure(lambda: build_index(papers, token_lists))
+    print(f"{'BM25Index (memory)':<22} | {index_bytes / 2**20:>8.1f} MiB | "
+          f"{index_bytes * per_10k / 2**20:>11.1f} MiB | {elapsed:>7.2f}s")
+    del index
+
+    with tempfile.TemporaryDirectory() as path:
+        index, mmap_bytes, elapsed = measure(lambda: build_index(papers, token_lists, path))
+        disk = dir_size(path)
+        print(f"{'BM25Index (mmap)':<22} | {mmap_bytes / 2**20:>8.1f} MiB | "
+              f"{mmap_bytes * per_10k / 2**20:>11.1f} MiB | {elapsed:>7.2f}s   (on disk {disk / 2**20:.1f} MiB)")
+        del index
+
+
+if __name__ == "__main__":
+    main()
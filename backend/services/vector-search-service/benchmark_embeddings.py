@@ -0,0 +1,185 @@
+"""
+向量维度 / 量化索引评估
+
+比较不同 embedding 维度（text-embedding-3 系列的 dimensions 参数）与索引类型（FLAT / IVF_FLAT / IVF_SQ8 / IVF_PQ / HNSW）
+组合的内存、延迟和召回率：
+- 内存：每百万 chunk 的向量索引内存（MB）。Milvus 提供段内存信息时为实测值（临时集合只含 id、paper_id 和向量），
+  否则按索引格式估算
+- 延迟：单条查询 p50 / p99
+- 召回率：recall@k，基准为原始维度向量上的精确近邻，同时反映降维和量化带来的损失
+
+低维向量由当前集合的向量截断到前 d 维后重新归一化得到，与以 dimensions=d 调用 API 的结果相同，评估不需要重新生成 embedding。
+查询默认使用留出的 chunk 向量，也可以用 --queries-file 指定真实查询（JSONL，每行 {"query": ...}，会调用一次 embedding API）。
+
+用法:
+    python benchmark_embeddings.py
+    python benchmark_embeddings.py --dims 1536 768 512 256 --index-types FLAT IVF_SQ8 IVF_PQ HNSW
+    python benchmark_embeddings.py --queries-file eval/queries.jsonl --k 10 --target-recall 0.9
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+# 添加app目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from pymilvus import utility
+
+from app.services.milvus_service import INDEX_TYPES, build_search_params, get_milvus_service
+from app.services.openai_service import get_openai_service, supports_dimensions, truncate_embeddings
+from tune_index import (
+    bytes_per_vector,
+    candidate_indexes,
+    create_scratch,
+    exact_neighbors,
+    percentile,
+    rebuild_index,
+    recall,
+    run_queries,
+    sample_vectors
+)
+
+
+def load_queries(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["query"] for line in f if line.strip()]
+
+
+async def embed_queries(texts: list, model: str, dimensions) -> np.ndarray:
+    openai_service = get_openai_service()
+    vectors = []
+    for start in range(0, len(texts), 256):
+        vectors += await openai_service.generate_embeddings(texts[start:start + 256], model, dimensions)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def measured_bytes_per_vector(name: str, rows: int):
+    """Milvus 报告的已加载段内存 / 行数（不支持时返回 None）"""
+    try:
+        segments = utility.get_query_segment_info(name)
+    except Exception:
+        return None
+    size = sum(segment.mem_size for segment in segments)
+    return size / rows if size and rows else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量维度 / 量化索引评估")
+    parser.add_argument("--dims", nargs="+", type=int, default=[1536, 1024, 768, 512, 256],
+                        help="评估的维度（大于集合维度的忽略）")
+    parser.add_argument("--index-types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    parser.add_argument("--sample", type=int, default=20000, help="抽样的向量数")
+    parser.add_argument("--scan", type=int, default=200000, help="抽样扫描的行数上限（0 表示全部）")
+    parser.add_argument("--queries", type=int, default=200, help="留出作为查询的向量数（未指定 --queries-file 时）")
+    parser.add_argument("--queries-file", default=None, help="真实查询 JSONL")
+    parser.add_argument("--k", type=int, default=10, help="recall@k")
+    parser.add_argument("--nprobe", type=int, default=16, help="IVF 索引的 nprobe")
+    parser.add_argument("--ef", type=int, default=64, help="HNSW 索引的 ef")
+    parser.add_argument("--target-recall", type=float, default=0.9, help="推荐配置需要达到的 recall@k")
+    args = parser.parse_args()
+
+    milvus_service = get_milvus_service()
+    if milvus_service.collection is None:
+        raise SystemExit("Milvus is not available")
+    milvus_service.ensure_loaded()
+    source_dim, model = milvus_service.dim, milvus_service.embedding_model
+    dims = sorted({dim for dim in args.dims if dim <= source_dim}, reverse=True)
+    if dims != [source_dim] and not supports_dimensions(model):
+        raise SystemExit(f"{model} does not support reduced dimensions, only dim={source_dim} can be evaluated")
+
+    print(f"Sampling up to {args.sample} vectors from '{milvus_service.physical_name}' ({model}, dim={source_dim})...")
+    papers, vectors, scanned = sample_vectors(milvus_service.collection, args.sample, args.scan)
+    papers = np.asarray(papers)
+    if args.queries_file:
+        queries = asyncio.run(embed_queries(
+            load_queries(args.queries_file), model, milvus_service.embedding_dimensions
+        ))
+        base, base_papers = vectors, papers
+    else:
+        if len(vectors) <= args.queries:
+            raise SystemExit(f"Not enough vectors to evaluate ({len(vectors)} sampled)")
+        order = np.random.default_rng(0).permutation(len(vectors))
+        queries = vectors[order[:args.queries]]
+        base, base_papers = vectors[order[args.queries:]], papers[order[args.queries:]]
+    truth = exact_neighbors(queries, base, args.k)
+
+    print("=" * 118)
+    print(
+        f"{'dim':>5} | {'index':>9} | {'build params':>34} | {'MB / 1M chunks':>14} | {'vs fp32':>7} | "
+        f"{f'recall@{args.k}':>9} | {'p50 ms':>7} | {'p99 ms':>7}"
+    )
+    print("-" * 118)
+    full_bytes = source_dim * 4
+    results, measurable = [], True
+    for dim in dims:
+        scratch = f"{milvus_service.collection_name}_eval_{dim}_{os.getpid()}"
+        dim_queries = truncate_embeddings(queries, dim)
+        try:
+            collection = create_scratch(scratch, truncate_embeddings(base, dim), base_papers)
+            for index in candidate_indexes(args.index_types, len(base), dim):
+                try:
+                    rebuild_index(collection, index)
+                except Exception as e:
+                    print(f"{dim:>5} | {index['index_type']:>9} | skipped: {str(e)[:80]}")
+                    continue
+                if index["index_type"] == "HNSW":
+                    overrides = {"ef": args.ef}
+                elif index["index_type"].startswith("IVF"):
+                    overrides = {"nprobe": args.nprobe}
+                else:
+                    overrides = {}
+                param = build_search_params(index, args.k, overrides=overrides)
+                run_queries(collection, dim_queries[:10], args.k, param)  # 预热
+                ids, latencies = run_queries(collection, dim_queries, args.k, param)
+                measured = measured_bytes_per_vector(scratch, len(base)) if measurable else None
+                measurable = measured is not None
+                per_vector = measured or bytes_per_vector(index, dim)
+                result = {
+                    "dim": dim,
+                    "index": index,
+                    "search": param["params"],
+                    "mb_per_million": per_vector * 1e6 / 2 ** 20,
+                    "recall": recall(ids, truth),
+                    "p50": percentile(latencies, 50),
+                    "p99": percentile(latencies, 99),
+                }
+                results.append(result)
+                memory = f"{result['mb_per_million']:.0f}{'' if measured else ' (est)'}"
+                print(
+                    f"{dim:>5} | {index['index_type']:>9} | {json.dumps(index['params']):>34} | {memory:>14} | "
+                    f"{full_bytes / per_vector:>6.1f}x | {result['recall']:>9.4f} | "
+                    f"{result['p50']:>7.2f} | {result['p99']:>7.2f}"
+                )
+        finally:
+            if utility.has_collection(scratch):
+                utility.drop_collection(scratch)
+
+    print("=" * 118)
+    print(
+        f"sample: {len(base)} vectors + {len(queries)} {'real' if args.queries_file else 'held-out'} queries "
+        f"(scanned {scanned} rows); recall is measured against exact search on {source_dim}-dim vectors"
+    )
+    candidates = [result for result in results if result["recall"] >= args.target_recall]
+    if not candidates:
+        print(f"No configuration reached recall@{args.k} >= {args.target_recall}")
+        return
+    best = min(candidates, key=lambda result: (result["mb_per_million"], result["p99"]))
+    print(
+        f"Smallest configuration with recall@{args.k} >= {args.target_recall}: dim={best['dim']}, "
+        f"{best['index']['index_type']} ({best['mb_per_million']:.0f}MB per million chunks, "
+        f"{full_bytes * 1e6 / 2 ** 20 / best['mb_per_million']:.1f}x smaller than {source_dim}-dim float32)"
+    )
+    print(f"MILVUS_INDEX_TYPE={best['index']['index_type']}")
+    print(f"MILVUS_SEARCH_PARAMS={json.dumps(best['search'])}")
+    print(
+        f"Apply online: MILVUS_INDEX_TYPE={best['index']['index_type']} python migrate_collection.py"
+        + (f" --dim {best['dim']}" if best["dim"] != source_dim else "")
+        + " (then run tune_index.py to tune nlist/nprobe for the full collection)"
+    )
+
+
+if __name__ == "__main__":
+    main()
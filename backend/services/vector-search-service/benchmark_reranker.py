@@ -0,0 +1,255 @@
+"""
+Reranker 后端基准测试
+
+在固定的候选集上比较各推理后端（sentence-transformers fp32 / ONNX fp32 / ONNX int8）：
+- 延迟：每个查询对其全部候选评分的耗时 p50 / p95，以及吞吐（pairs/s）
+- 质量：按标注相关度计算的 NDCG@k；以及以第一个后端（默认 CrossEncoder fp32）的分数为增益的 NDCG@k
+  和 Top-1 一致率，衡量量化后的排序与原模型的偏差
+
+候选集默认使用内置的中英文主题集合（每个查询：2 个高相关、2 个部分相关，其余主题的文档为不相关），
+也可以用 --candidates 指定 JSONL 文件，每行 {"query": ..., "documents": [{"content": ..., "relevance": 0-2}, ...]}
+
+用法:
+    python benchmark_reranker.py
+    python benchmark_reranker.py --backends sentence-transformers onnx-int8 --repeat 10
+    python benchmark_reranker.py --candidates eval/rerank_candidates.jsonl --k 5
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+# 添加app目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from app.services.reranker_backends import BACKENDS, load_cross_encoder
+from app.services.reranker_service import RERANKER_MODEL
+
+# 主题 -> (查询, 高相关文档, 部分相关文档)
+TOPICS = [
+    (
+        "how does retrieval-augmented generation reduce hallucination",
+        [
+            "Retrieval-augmented generation grounds the language model on retrieved passages, so answers are "
+            "conditioned on evidence rather than parametric memory, which reduces hallucinated facts.",
+            "We show that conditioning generation on top-k retrieved documents lowers the rate of unsupported "
+            "claims compared with a closed-book baseline of the same size.",
+        ],
+        [
+            "Large language models often produce fluent but factually incorrect statements, a problem known as "
+            "hallucination.",
+            "Dense passage retrieval encodes questions and passages with dual encoders and retrieves by inner product.",
+        ],
+    ),
+    (
+        "稀疏检索与稠密检索的融合方法",
+        [
+            "本文采用倒数排名融合（RRF）合并 BM25 稀疏检索与向量稠密检索的结果，两路检索互补，召回率显著提升。",
+            "Hybrid retrieval combines BM25 lexical matching with dense embeddings; reciprocal rank fusion merges "
+            "the two ranked lists without score calibration.",
+        ],
+        [
+            "BM25 根据词频和逆文档频率为文档打分，是经典的稀疏检索模型。",
+            "向量检索使用近似最近邻索引（如 IVF、HNSW）在高维空间中查找相似向量。",
+        ],
+    ),
+    (
+        "effect of learning rate warmup on transformer training stability",
+        [
+            "Without warmup, post-LayerNorm transformers diverge early in training; a linear warmup of the learning "
+            "rate keeps the adaptive optimizer's variance estimates stable.",
+            "We find that warmup length matters more than peak learning rate for avoiding loss spikes when training "
+            "large transformer models.",
+        ],
+        [
+            "Adam maintains per-parameter estimates of the first and second moments of the gradients.",
+            "The transformer architecture relies entirely on self-attention, dispensing with recurrence.",
+        ],
+    ),
+    (
+        "图神经网络在分子性质预测中的应用",
+        [
+            "我们将分子表示为图，原子为节点、化学键为边，使用消息传递神经网络预测分子的溶解度和毒性。",
+            "Graph neural networks operating on molecular graphs achieve state-of-the-art accuracy on quantum "
+            "chemistry property prediction benchmarks such as QM9.",
+        ],
+        [
+            "图卷积网络通过聚合邻居节点的特征来更新节点表示。",
+            "分子指纹是一种将分子结构编码为定长二进制向量的传统方法。",
+        ],
+    ),
+    (
+        "contrastive learning for sentence embeddings",
+        [
+            "SimCSE trains sentence encoders with a contrastive objective in which two dropout-noised views of the "
+            "same sentence are positives and other sentences in the batch are negatives.",
+            "Contrastive fine-tuning on natural language inference pairs produces sentence embeddings that "
+            "outperform averaged word vectors on semantic similarity tasks.",
+        ],
+        [
+            "Word2vec learns word embeddings by predicting context words within a fixed window.",
+            "InfoNCE is a contrastive loss that maximizes a lower bound on mutual information.",
+        ],
+    ),
+    (
+        "低资源语言的机器翻译数据增强",
+        [
+            "针对低资源语言对，我们使用回译生成大规模伪平行语料，翻译质量 BLEU 提升 4 个点以上。",
+            "Back-translation and multilingual transfer from high-resource languages are effective data "
+            "augmentation strategies for low-resource neural machine translation.",
+        ],
+        [
+            "神经机器翻译通常采用编码器-解码器结构，并使用注意力机制对齐源语言和目标语言。",
+            "BLEU 通过比较候选译文与参考译文的 n-gram 重合度评价翻译质量。",
+        ],
+    ),
+    (
+        "quantization of neural networks for CPU inference",
+        [
+            "Post-training dynamic quantization stores weights as int8 and quantizes activations on the fly, "
+            "giving a 2-3x CPU speedup for transformer inference with minimal accuracy loss.",
+            "We quantize BERT to 8-bit integers and show that matrix multiplications dominate CPU latency, so "
+            "int8 kernels yield most of the speedup.",
+        ],
+        [
+            "Knowledge distillation trains a small student model to mimic the outputs of a larger teacher.",
+            "Pruning removes weights with small magnitude to produce sparse networks.",
+        ],
+    ),
+    (
+        "多模态大模型的视觉指令微调",
+        [
+            "我们构建了视觉指令数据集，将图像编码器与大语言模型连接，并通过指令微调使模型能够根据图像回答开放式问题。",
+            "Visual instruction tuning aligns a vision encoder with a language model using GPT-generated "
+            "image-grounded conversations, enabling general-purpose visual assistants.",
+        ],
+        [
+            "CLIP 通过对比学习在大规模图文对上训练图像和文本编码器。",
+            "指令微调让语言模型学会遵循自然语言描述的任务指令。",
+        ],
+    ),
+]
+
+
+def builtin_candidates() -> list:
+    """内置候选集：每个查询的候选为全部文档（本主题 2/1 级相关，其余主题 0 级）"""
+    documents = []
+    for topic, (_, relevant, partial) in enumerate(TOPICS):
+        documents += [(topic, 2, text) for text in relevant]
+        documents += [(topic, 1, text) for text in partial]
+    return [
+        {
+            "query": query,
+            "documents": [
+                {"content": text, "relevance": grade if doc_topic == topic else 0}
+                for doc_topic, grade, text in documents
+            ],
+        }
+        for topic, (query, _, _) in enumerate(TOPICS)
+    ]
+
+
+def load_candidates(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def ndcg(order: np.ndarray, gains: np.ndarray, k: int) -> float:
+    """order 为按模型分数降序的文档下标，gains 为各文档的增益"""
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    dcg = float(np.sum(gains[order[:k]] * discounts[:len(order[:k])]))
+    ideal = np.sort(gains)[::-1][:k]
+    idcg = float(np.sum(ideal * discounts[:len(ideal)]))
+    return dcg / idcg if idcg > 0 else 0.0
+
+
+def percentile(values: list, q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def run_backend(backend: str, model_name: str, candidates: list, repeat: int, batch_size: int) -> dict:
+    start = time.perf_counter()
+    model = load_cross_encoder(model_name, backend, "cpu")
+    load_s = time.perf_counter() - start
+
+    pair_lists = [[[c["query"], d["content"]] for d in c["documents"]] for c in candidates]
+    model.predict(pair_lists[0], batch_size=batch_size)  # 预热
+
+    latencies, scores = [], []
+    total_pairs, total_time = 0, 0.0
+    for round_no in range(repeat):
+        for pairs in pair_lists:
+            start = time.perf_counter()
+            result = np.asarray(model.predict(pairs, batch_size=batch_size), dtype=np.float64).reshape(-1)
+            elapsed = time.perf_counter() - start
+            latencies.append(elapsed * 1000)
+            total_pairs += len(pairs)
+            total_time += elapsed
+            if round_no == 0:
+                scores.append(result)
+
+    return {
+        "backend": backend,
+        "load_s": load_s,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "pairs_per_s": total_pairs / total_time if total_time else 0.0,
+        "scores": scores,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reranker 后端基准测试")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS,
+                        help="参与比较的后端（第一个作为排序一致性的参照）")
+    parser.add_argument("--model", default=RERANKER_MODEL, help="Cross-Encoder 模型")
+    parser.add_argument("--candidates", default=None, help="候选集 JSONL（默认使用内置候选集）")
+    parser.add_argument("--repeat", type=int, default=5, help="每个查询重复评分的次数")
+    parser.add_argument("--k", type=int, default=10, help="NDCG@k")
+    parser.add_argument("--batch-size", type=int, default=32, help="推理批大小")
+    args = parser.parse_args()
+
+    candidates = load_candidates(args.candidates) if args.candidates else builtin_candidates()
+    num_pairs = sum(len(c["documents"]) for c in candidates)
+    labeled = all("relevance" in d for c in candidates for d in c["documents"])
+
+    results = []
+    for backend in args.backends:
+        print(f"Running {backend} ...", flush=True)
+        results.append(run_backend(backend, args.model, candidates, args.repeat, args.batch_size))
+
+    reference = results[0]["scores"]
+    print("=" * 100)
+    print(
+        f"Reranker benchmark: model={args.model}, queries={len(candidates)}, pairs={num_pairs}, "
+        f"repeat={args.repeat}, batch_size={args.batch_size}"
+    )
+    print(f"latency per query (all candidates), ms; NDCG@{args.k} vs labels and vs {results[0]['backend']} scores")
+    print("=" * 100)
+    print(
+        f"{'backend':>22} | {'load s':>7} | {'p50':>8} | {'p95':>8} | {'pairs/s':>8} | "
+        f"{'NDCG labels':>11} | {'NDCG ref':>8} | {'top-1 agree':>11}"
+    )
+    print("-" * 100)
+    for result in results:
+        label_ndcg, ref_ndcg, top1 = [], [], []
+        for c, scores, ref_scores in zip(candidates, result["scores"], reference):
+            order = np.argsort(-scores, kind="stable")
+            if labeled:
+                gains = np.array([d["relevance"] for d in c["documents"]], dtype=np.float64)
+                label_ndcg.append(ndcg(order, gains, args.k))
+            ref_ndcg.append(ndcg(order, ref_scores, args.k))
+            top1.append(order[0] == int(np.argmax(ref_scores)))
+        label_text = f"{np.mean(label_ndcg):>11.4f}" if labeled else f"{'-':>11}"
+        print(
+            f"{result['backend']:>22} | {result['load_s']:>7.1f} | {result['p50_ms']:>8.1f} | "
+            f"{result['p95_ms']:>8.1f} | {result['pairs_per_s']:>8.1f} | {label_text} | "
+            f"{np.mean(ref_ndcg):>8.4f} | {np.mean(top1):>11.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+分词性能基准测试
+
+生成中英文混合的合成 chunk（约 1000 字符，与 text_chunker 的默认切分一致），
+比较单进程分词与进程池批量分词的吞吐（tokens/s），以及查询分词缓存命中时的耗时
+
+用法:
+    python benchmark_tokenizer.py
+    python benchmark_tokenizer.py --chunks 5000 --workers 2 4 8
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+# 添加app目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import jieba
+
+from app.utils import tokenizer
+
+ENGLISH_WORDS = (
+    "transformer attention retrieval embedding sparse dense ranking model training dataset "
+    "benchmark evaluation neural network graph learning optimization gradient language vision"
+).split()
+
+
+def make_chunks(num_chunks: int, chunk_chars: int, seed: int) -> list:
+    """从 jieba 词典中按词频抽词，混入英文术语，拼成 chunk"""
+    rng = random.Random(seed)
+    jieba.initialize()
+    words = [w for w, f in jieba.dt.FREQ.items() if f > 100]
+    chunks = []
+    for _ in range(num_chunks):
+        parts, length = [], 0
+        while length < chunk_chars:
+            word = rng.choice(ENGLISH_WORDS) + " " if rng.random() < 0.2 else rng.choice(words)
+            if rng.random() < 0.05:
+                word += "，"
+            parts.append(word)
+            length += len(word)
+        chunks.append("".join(parts))
+    return chunks
+
+
+def measure(fn, chunks: list) -> tuple:
+    start = time.perf_counter()
+    results = fn(chunks)
+    elapsed = time.perf_counter() - start
+    return sum(len(tokens) for tokens in results), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分词性能基准测试")
+    parser.add_argument("--chunks", type=int, default=2000, help="chunk 数")
+    parser.add_argument("--chunk-chars", type=int, default=1000, help="每个 chunk 的字符数")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4], help="进程池大小")
+    parser.add_argument("--queries", type=int, default=1000, help="查询缓存测试的查询数")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    tokenizer.warm_up()
+    print(f"jieba warm-up: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    chunks = make_chunks(args.chunks, args.chunk_chars, args.seed)
+
+    print("=" * 60)
+    print(f"Tokenizer benchmark: chunks={args.chunks}, chunk_chars={args.chunk_chars}, cpus={os.cpu_count()}")
+    print("=" * 60)
+    print(f"{'mode':<16} | {'tokens':>10} | {'time':>8} | {'tokens/s':>12}")
+    print("-" * 60)
+
+    tokens, elapsed = measure(lambda texts: [tokenizer.tokenize(t) for t in texts], chunks)
+    print(f"{'single-process':<16} | {tokens:>10,} | {elapsed:>7.2f}s | {tokens / elapsed:>12,.0f}")
+
+    for workers in args.workers:
+        tokenizer.shutdown()
+        tokenizer.TOKENIZER_WORKERS = workers
+        # 启动进程池并在各进程加载词典，不计入吞吐
+        tokenizer.tokenize_batch(chunks[:tokenizer.TOKENIZER_POOL_MIN_TEXTS * workers])
+        tokens, elapsed = measure(tokenizer.tokenize_batch, chunks)
+        print(f"{f'pool x{workers}':<16} | {tokens:>10,} | {elapsed:>7.2f}s | {tokens / elapsed:>12,.0f}")
+    tokenizer.shutdown()
+
+    # 查询缓存：同一批查询重复两次
+    queries = [chunk[:30] for chunk in chunks[:args.queries]]
+    for label in ("query (miss)", "query (hit)"):
+        start = time.perf_counter()
+        for query in queries:
+            tokenizer.tokenize_query(query)
+        elapsed = time.perf_counter() - start
+        print(f"{label:<16} | {len(queries):>10,} | {elapsed:>7.3f}s | {elapsed / len(queries) * 1e6:>9.1f} µs/q")
+
+
+if __name__ == "__main__":
+    main()
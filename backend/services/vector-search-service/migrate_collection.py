@@ -0,0 +1,121 @@
+"""
+集合在线迁移（更换 embedding 模型 / 向量维度 / schema，不停服）
+
+在后台新建集合并从当前集合复制 chunk（模型或维度变化时用正文重新生成 embedding），
+完成后把别名 MILVUS_COLLECTION 切换到新集合，服务的各副本在 MILVUS_ALIAS_CHECK_SECONDS 内改用新集合。
+进度写入检查点文件，中断后以相同的命令重新运行即从检查点继续。
+迁移完成后旧集合保留，确认无误后用 --drop 删除（回滚时用 --rollback 把别名切回旧集合）。
+
+用法:
+    python migrate_collection.py --embedding-model text-embedding-3-large
+    python migrate_collection.py --embedding-model text-embedding-3-large --rpm 3000 --concurrency 8
+    python migrate_collection.py --dim 512              # 同一模型降到 512 维（截断已有向量，不调用 API）
+    MILVUS_INDEX_TYPE=HNSW python migrate_collection.py # 只更换索引类型/参数（直接复制向量）
+    python migrate_collection.py --owners paper_owners.json  # 旧集合（没有 user_id）迁移为按用户分区的集合
+    python migrate_collection.py --no-switch            # 只复制，之后不带参数重新运行完成切换
+    python migrate_collection.py --status
+    python migrate_collection.py --rollback
+    python migrate_collection.py --drop
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+
+# 添加app目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pymilvus import utility
+
+from app.services.collection_migration import (
+    PHASE_DONE,
+    CollectionMigration,
+    MigrationCheckpoint,
+    describe_collection
+)
+from app.services.milvus_service import get_milvus_service
+from app.services.openai_service import get_openai_service
+
+
+def show_status(checkpoint_path: str):
+    checkpoint = MigrationCheckpoint.load(checkpoint_path)
+    if checkpoint is None:
+        print(f"No migration checkpoint at {checkpoint_path}")
+        return
+    status = {**vars(checkpoint), "switch_papers": len(checkpoint.switch_papers)}
+    print(json.dumps(status, ensure_ascii=False, indent=2))
+    for name in (checkpoint.source, checkpoint.target):
+        if utility.has_collection(name):
+            print(json.dumps(describe_collection(name), ensure_ascii=False))
+
+
+def finished_checkpoint(checkpoint_path: str) -> MigrationCheckpoint:
+    checkpoint = MigrationCheckpoint.load(checkpoint_path)
+    if checkpoint is None or checkpoint.phase != PHASE_DONE:
+        raise SystemExit(f"No finished migration in {checkpoint_path}")
+    return checkpoint
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Milvus 集合在线迁移")
+    parser.add_argument("--checkpoint", default="./data/collection_migration.json", help="检查点文件")
+    parser.add_argument("--target", default=None, help="新集合名（默认 <MILVUS_COLLECTION>_<时间>）")
+    parser.add_argument("--embedding-model", default=None, help="新集合的 embedding 模型（默认与当前集合相同）")
+    parser.add_argument("--dim", type=int, default=None,
+                        help="新集合的向量维度（text-embedding-3 系列以 dimensions 参数生成，同一模型降维时直接截断已有向量；"
+                             "默认取模型输出的维度）")
+    parser.add_argument("--batch-size", type=int, default=256, help="每批读取/生成 embedding 的 chunk 数")
+    parser.add_argument("--concurrency", type=int, default=4, help="并发处理的批次数")
+    parser.add_argument("--rpm", type=int, default=0, help="embedding API 每分钟请求数上限（0 不限制）")
+    parser.add_argument("--grace", type=float, default=None,
+                        help="切换别名后等待各副本切换的秒数（默认 MILVUS_ALIAS_CHECK_SECONDS + 10）")
+    parser.add_argument("--owners", default=None,
+                        help="论文所属用户的 JSON 文件（{paper_id: user_id}，由 paper-storage-service 的 "
+                             "export_paper_owners.py 导出）；源集合没有 user_id 字段时必需，迁移为按用户分区的集合")
+    parser.add_argument("--no-switch", action="store_true", help="只复制，不切换别名")
+    parser.add_argument("--status", action="store_true", help="查看迁移进度")
+    parser.add_argument("--rollback", action="store_true", help="把别名切回迁移前的集合")
+    parser.add_argument("--drop", action="store_true", help="删除迁移前的集合")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    milvus_service = get_milvus_service()
+    if milvus_service.collection is None:
+        raise SystemExit("Milvus is not available")
+
+    try:
+        if args.status:
+            show_status(args.checkpoint)
+        elif args.rollback:
+            checkpoint = finished_checkpoint(args.checkpoint)
+            milvus_service.switch_alias(checkpoint.source)
+        elif args.drop:
+            checkpoint = finished_checkpoint(args.checkpoint)
+            if milvus_service.physical_name == checkpoint.source:
+                raise SystemExit(f"'{checkpoint.source}' is the current collection (rolled back?)")
+            utility.drop_collection(checkpoint.source)
+            print(f"Dropped collection '{checkpoint.source}'")
+        else:
+            migration = CollectionMigration(
+                milvus_service,
+                get_openai_service(),
+                args.checkpoint,
+                target=args.target,
+                embedding_model=args.embedding_model,
+                dim=args.dim,
+                batch_size=args.batch_size,
+                concurrency=args.concurrency,
+                rpm=args.rpm,
+                switch_grace_seconds=args.grace,
+                owners_file=args.owners
+            )
+            checkpoint = await migration.run(switch=not args.no_switch)
+            print(json.dumps(vars(checkpoint), ensure_ascii=False, indent=2))
+    finally:
+        await milvus_service.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,292 @@
+"""
+Vector Search Service 测试脚本
+
+BM25 索引引擎的单元测试（不依赖 Milvus / Redis / OpenAI）：
+- 添加 / 删除 / 检索与墓碑
+- 快照落盘后重新加载
+- search_batch 与逐个 search 结果一致
+- Block-Max 剪枝与穷举评分结果一致（包括以不同的 BM25_BLOCK_SIZE 重新加载快照）
+- BM25Service 按用户检索只检索该用户的分片，集合分区后重建把根分片的旧数据移到所属用户的分片
+
+用法:
+    python test_vector_service.py
+    python -m pytest test_vector_service.py
+"""
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+# 添加app目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services import bm25_index
+from app.services.bm25_index import BM25Index
+from app.services.bm25_service import BM25Service
+
+VOCAB = [f"t{i:04d}" for i in range(400)]
+CHUNKS_PER_PAPER = 20
+
+
+def make_paper(paper_id: str, rng: np.random.Generator, num_chunks: int = CHUNKS_PER_PAPER):
+    """生成一篇合成论文：(paper_id, docs, term_freqs, doc_len)，词频服从 Zipf 分布"""
+    docs, term_freqs, doc_len = [], [], []
+    for i in range(num_chunks):
+        tokens = [VOCAB[(t - 1) % len(VOCAB)] for t in rng.zipf(1.3, int(rng.integers(20, 80)))]
+        tfs = {}
+        for token in tokens:
+            tfs[token] = tfs.get(token, 0) + 1
+        docs.append({
+            "paper_id": paper_id,
+            "chunk_id": f"{paper_id}#{i}",
+            "chunk_index": i,
+            "title": f"title {paper_id}",
+            "file_name": f"{paper_id}.pdf",
+        })
+        term_freqs.append(tfs)
+        doc_len.append(len(tokens))
+    return paper_id, docs, term_freqs, doc_len
+
+
+def make_queries(rng: np.random.Generator, count: int = 30):
+    return [[VOCAB[(t - 1) % len(VOCAB)] for t in rng.zipf(1.3, int(rng.integers(1, 5)))] for _ in range(count)]
+
+
+def build_index(num_papers: int = 30, path=None, seed: int = 0) -> BM25Index:
+    rng = np.random.default_rng(seed)
+    index = BM25Index(path=path)
+    # 分多批写入，得到多个段
+    papers = [make_paper(f"p{i}", rng) for i in range(num_papers)]
+    for start in range(0, num_papers, 7):
+        index.add_many(papers[start:start + 7])
+    return index
+
+
+def assert_same_results(expected, actual, message=""):
+    """分数一致；高于第 K 名分数的命中必须相同（第 K 名同分时取舍可以不同）"""
+    assert len(expected) == len(actual), message
+    assert np.allclose([s for s, _ in expected], [s for s, _ in actual], rtol=1e-5), message
+    if expected:
+        cutoff = expected[-1][0] + 1e-6
+        assert (
+            {meta["chunk_id"] for s, meta in expected if s > cutoff}
+            == {meta["chunk_id"] for s, meta in actual if s > cutoff}
+        ), message
+
+
+def test_add_delete_search():
+    """添加 / 删除 / 检索往返，删除的论文只打墓碑且不再命中"""
+    print("\n📋 测试添加 / 删除 / 检索...")
+    index = build_index()
+    assert len(index.papers()) == 30
+    assert index.num_docs == 30 * CHUNKS_PER_PAPER
+
+    query = ["t0000", "t0001"]
+    hits = index.search(query, top_k=10)
+    assert hits and all(s > 0 for s, _ in hits)
+    assert [s for s, _ in hits] == sorted((s for s, _ in hits), reverse=True)
+
+    # 命中的元数据来自段内的列
+    meta = hits[0][1]
+    assert meta["chunk_id"].startswith(meta["paper_id"] + "#")
+    assert meta["title"] == f"title {meta['paper_id']}"
+
+    # paper_id 限定检索只返回该论文的 chunk
+    scoped = index.search(query, top_k=5, paper_id="p3")
+    assert scoped and all(m["paper_id"] == "p3" for _, m in scoped)
+
+    # 删除：文档数减少，段内留下墓碑，检索不再返回
+    victim = hits[0][1]["paper_id"]
+    segments_before = len(index._segments)
+    assert index.delete(victim) == CHUNKS_PER_PAPER
+    assert victim not in index
+    assert index.num_docs == 29 * CHUNKS_PER_PAPER
+    assert index.get_stats()["deleted_chunks"] == CHUNKS_PER_PAPER
+    assert len(index._segments) == segments_before
+    assert all(m["paper_id"] != victim for _, m in index.search(query, top_k=50))
+    assert index.search(query, top_k=5, paper_id=victim) == []
+    assert index.delete(victim) == 0
+
+    # 重复添加同一论文是幂等的
+    rng = np.random.default_rng(1)
+    index.add(*make_paper("p3", rng))
+    index.add(*make_paper("p3", rng))
+    assert index.num_docs == 29 * CHUNKS_PER_PAPER
+    assert index.get_stats()["papers"] == 29
+
+    # 压缩后墓碑清除，结果不变（avgdl 容差为 0 时各段权重都按当前 avgdl 计算，分数才完全相同）
+    tolerance = bm25_index.BM25_AVGDL_TOLERANCE
+    bm25_index.BM25_AVGDL_TOLERANCE = 0.0
+    try:
+        before = index.search(query, top_k=10)
+        index.compact()
+        assert index.get_stats()["deleted_chunks"] == 0
+        assert len(index._segments) == 1
+        assert_same_results(before, index.search(query, top_k=10))
+    finally:
+        bm25_index.BM25_AVGDL_TOLERANCE = tolerance
+    print("✅ 添加 / 删除 / 检索通过")
+
+
+def test_snapshot_reload():
+    """快照落盘后重新加载，检索结果与删除状态保持一致"""
+    print("\n📋 测试快照重新加载...")
+    with tempfile.TemporaryDirectory() as path:
+        index = build_index(path=path)
+        index.delete("p5")
+        index.checkpoint("42-0")
+        queries = make_queries(np.random.default_rng(2))
+        expected = [index.search(q, top_k=10) for q in queries]
+
+        reloaded = BM25Index(path=path)
+        assert reloaded.load()
+        assert reloaded.offset == "42-0"
+        assert reloaded.num_docs == index.num_docs
+        assert "p5" not in reloaded and "p6" in reloaded
+        for query, hits in zip(queries, expected):
+            assert_same_results(hits, reloaded.search(query, top_k=10), query)
+
+        # 只读副本加载同一快照
+        follower = BM25Index(path=path, read_only=True)
+        assert follower.load()
+        assert follower.get_stats()["papers"] == 29
+    print("✅ 快照重新加载通过")
+
+
+def test_search_batch_matches_search():
+    """批量检索与逐个检索的结果一致（全局与论文内）"""
+    print("\n📋 测试批量检索...")
+    index = build_index()
+    index.delete("p2")
+    queries = make_queries(np.random.default_rng(3)) + [[], ["missing-term"]]
+    for paper_id in (None, "p7"):
+        batch = index.search_batch(queries, top_k=10, paper_id=paper_id, pruning=False)
+        for query, hits in zip(queries, batch):
+            assert_same_results(index.search(query, top_k=10, paper_id=paper_id, pruning=False), hits, query)
+    print("✅ 批量检索通过")
+
+
+def test_pruned_matches_exhaustive():
+    """Block-Max 剪枝与穷举评分的 Top-K 一致（含墓碑）"""
+    print("\n📋 测试 Block-Max 剪枝...")
+    first_batch, block_size = bm25_index.BM25_PRUNING_FIRST_BATCH, bm25_index.BM25_BLOCK_SIZE
+    # 小块、小的第一轮，让小语料也有多轮剪枝
+    bm25_index.BM25_PRUNING_FIRST_BATCH, bm25_index.BM25_BLOCK_SIZE = 2, 16
+    try:
+        index = build_index(num_papers=60)
+        index.delete("p10")
+        index.delete("p33")
+        for query in make_queries(np.random.default_rng(4), count=50):
+            for top_k in (1, 10):
+                exhaustive = index.search(query, top_k=top_k, pruning=False)
+                pruned = index.search(query, top_k=top_k, pruning=True)
+                assert_same_results(exhaustive, pruned, query)
+        stats = index.get_stats()["block_max_pruning"]
+        assert stats["blocks_scored"] < stats["blocks_total"]
+    finally:
+        bm25_index.BM25_PRUNING_FIRST_BATCH, bm25_index.BM25_BLOCK_SIZE = first_batch, block_size
+    print("✅ Block-Max 剪枝通过")
+
+
+def test_pruning_after_block_size_change():
+    """快照按构建时的块大小解释块上界，BM25_BLOCK_SIZE 变化后重建，剪枝结果仍与穷举一致"""
+    print("\n📋 测试块大小变化后的剪枝...")
+    saved = (bm25_index.BM25_PRUNING_FIRST_BATCH, bm25_index.BM25_BLOCK_SIZE, bm25_index.BM25_PRUNING_MIN_DOCS)
+    bm25_index.BM25_PRUNING_FIRST_BATCH, bm25_index.BM25_PRUNING_MIN_DOCS = 2, 0
+    try:
+        with tempfile.TemporaryDirectory() as path:
+            # 写入时即构建并落盘块上界
+            bm25_index.BM25_BLOCK_SIZE = 32
+            build_index(num_papers=60, path=path)
+
+            bm25_index.BM25_BLOCK_SIZE = 16
+            index = BM25Index(path=path)
+            assert index.load()
+            assert all(seg.scoring.block_size == 32 for seg in index._segments)
+            for query in make_queries(np.random.default_rng(5), count=50):
+                for top_k in (1, 10):
+                    exhaustive = index.search(query, top_k=top_k, pruning=False)
+                    pruned = index.search(query, top_k=top_k, pruning=True)
+                    assert_same_results(exhaustive, pruned, query)
+            assert any(seg.scoring.block_size == 16 for seg in index._segments)
+    finally:
+        bm25_index.BM25_PRUNING_FIRST_BATCH, bm25_index.BM25_BLOCK_SIZE, bm25_index.BM25_PRUNING_MIN_DOCS = saved
+    print("✅ 块大小变化后的剪枝通过")
+
+
+class FakeMilvus:
+    """按 filter_expr 中的 paper_id 列表返回 chunk 的 Milvus 替身（只实现重建用到的 iterate_chunks）"""
+
+    def __init__(self, rows, partitioned=True):
+        self.rows = rows
+        self.partitioned = partitioned
+
+    def iterate_chunks(self, output_fields, batch_size=1000, filter_expr=None):
+        rows = self.rows
+        if filter_expr:
+            papers = set(json.loads(filter_expr.split(" in ", 1)[1]))
+            rows = [row for row in rows if row["paper_id"] in papers]
+        yield [{name: row[name] for name in output_fields if name in row} for row in rows]
+
+
+def chunk_rows(paper_id, content, user_id=None):
+    row = {"paper_id": paper_id, "chunk_id": f"{paper_id}#0", "chunk_index": 0,
+           "title": paper_id, "file_name": f"{paper_id}.pdf", "content": content}
+    if user_id is not None:
+        row["user_id"] = user_id
+    return [row]
+
+
+def test_user_scoped_search():
+    """按用户检索不包含其他用户和根分片（旧集合）的论文；分区后重建把旧数据移到所属用户的分片"""
+    print("\n📋 测试按用户隔离的 BM25 检索...")
+    service = BM25Service(index_dir=None)
+    service.add_documents("legacy", chunk_rows("legacy", "transformer attention legacy"))
+    service.add_documents("alice-paper", chunk_rows("alice-paper", "transformer attention alice"), user_id="1")
+    service.add_documents("bob-paper", chunk_rows("bob-paper", "transformer attention bob"), user_id="2")
+
+    def papers(**kwargs):
+        return {hit["paper_id"] for hit in service.search("transformer attention", hydrate=False, **kwargs)}
+
+    assert papers() == {"legacy", "alice-paper", "bob-paper"}
+    assert papers(user_id="1") == {"alice-paper"}
+    assert papers(user_id="2") == {"bob-paper"}
+    # 论文内检索也不越过用户范围
+    assert "legacy" not in papers(user_id="1", paper_id="legacy")
+    assert papers(user_id="1", paper_id="bob-paper") == {"alice-paper"}
+
+    # 集合迁移为分区集合后重建：旧论文移到所属用户的分片，集合中已没有的旧论文删除
+    service.add_documents("gone", chunk_rows("gone", "transformer attention gone"))
+    milvus = FakeMilvus(
+        chunk_rows("legacy", "transformer attention legacy", user_id=2)
+        + chunk_rows("alice-paper", "transformer attention alice", user_id=1)
+        + chunk_rows("bob-paper", "transformer attention bob", user_id=2)
+    )
+    service.rebuild_from_milvus(milvus)
+    assert service.index.num_docs == 0
+    assert papers(user_id="2") == {"legacy", "bob-paper"}
+    assert papers(user_id="1") == {"alice-paper"}
+    print("✅ 按用户隔离的 BM25 检索通过")
+
+
+def main():
+    print("=" * 60)
+    print("🧪 Vector Search Service 测试")
+    print("=" * 60)
+
+    test_add_delete_search()
+    test_snapshot_reload()
+    test_search_batch_matches_search()
+    test_pruned_matches_exhaustive()
+    test_pruning_after_block_size_change()
+    test_user_scoped_search()
+
+    print("\n" + "=" * 60)
+    print("✅ 所有测试完成!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+向量索引调参
+
+从当前集合抽样真实的 chunk 向量（蓄水池抽样），留出一部分作为查询，其余写入临时集合；
+用 numpy 精确计算 L2 近邻作为基准，对每种索引类型和一组检索参数测量：
+- recall@k：索引检索结果与精确近邻的重合比例
+- 单条查询延迟 p50 / p99
+- 单篇论文过滤检索（paper_id == 查询所在论文）的 recall@k，对应服务中 selective 检索参数
+- 每个向量的索引内存估算
+
+最后在满足 --target-recall 的组合中选 p99 最低的一个，按当前集合的规模换算参数
+（IVF 的 nlist 取 4 * sqrt(N) 附近的 2 的幂，nprobe 按扫描列表的比例同步放大），输出可直接使用的环境变量。
+样本规模小于集合时 FLAT 的延迟按规模线性外推，其余索引的延迟以实测为参考。
+
+用法:
+    python tune_index.py
+    python tune_index.py --sample 50000 --queries 500 --k 10 --target-recall 0.95
+    python tune_index.py --index-types IVF_FLAT HNSW
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+# 添加app目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from pymilvus import Collection, CollectionSchema, DataType, FieldSchema, utility
+
+from app.services.milvus_service import (
+    INDEX_TYPES,
+    build_index_params,
+    build_search_params,
+    get_milvus_service,
+    pq_m
+)
+
+# 各索引类型的检索参数扫描范围
+NPROBES = [1, 4, 8, 16, 32, 64, 128]
+EFS = [16, 32, 64, 128, 256]
+
+
+def nlist_for(rows: int) -> int:
+    """IVF 聚类数：4 * sqrt(N) 附近的 2 的幂（16 ~ 65536）"""
+    return int(min(max(2 ** round(math.log2(max(4 * math.sqrt(rows), 1))), 16), 65536))
+
+
+def bytes_per_vector(index: dict, dim: int) -> float:
+    """索引中每个向量占用的内存估算（不含 Milvus 的标量字段和元数据）"""
+    index_type, params = index["index_type"], index["params"]
+    if index_type == "IVF_SQ8":
+        return dim + 8
+    if index_type == "IVF_PQ":
+        return params["m"] * params.get("nbits", 8) / 8 + 8
+    if index_type == "HNSW":
+        return dim * 4 + params["M"] * 2 * 4 + 8
+    return dim * 4 + (8 if index_type.startswith("IVF") else 0)
+
+
+def percentile(values: list, q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def sample_vectors(collection: Collection, sample: int, scan: int, batch_size: int = 1000):
+    """蓄水池抽样：从集合的前 scan 行中均匀抽取 sample 行的 (paper_id, embedding)"""
+    rng = random.Random(0)
+    reservoir, seen = [], 0
+    iterator = collection.query_iterator(
+        batch_size=batch_size, expr="id >= 0", output_fields=["paper_id", "embedding"]
+    )
+    try:
+        while scan <= 0 or seen < scan:
+            batch = iterator.next()
+            if not batch:
+                break
+            for row in batch:
+                seen += 1
+                item = (row["paper_id"], row["embedding"])
+                if len(reservoir) < sample:
+                    reservoir.append(item)
+                else:
+                    slot = rng.randrange(seen)
+                    if slot < sample:
+                        reservoir[slot] = item
+    finally:
+        iterator.close()
+    papers = [paper for paper, _ in reservoir]
+    vectors = np.asarray([vector for _, vector in reservoir], dtype=np.float32)
+    return papers, vectors, seen
+
+
+def exact_neighbors(queries: np.ndarray, base: np.ndarray, k: int, mask: np.ndarray = None) -> np.ndarray:
+    """精确 L2 近邻（mask[i] 为第 i 个查询可见的 base 行，不足 k 个时用 -1 补齐）"""
+    base_norms = np.sum(base * base, axis=1)
+    result = np.full((len(queries), k), -1, dtype=np.int64)
+    for start in range(0, len(queries), 256):
+        block = queries[start:start + 256]
+        distances = base_norms[None, :] - 2 * block @ base.T
+        if mask is not None:
+            distances = np.where(mask[start:start + 256], distances, np.inf)
+        order = np.argsort(distances, axis=1)[:, :k]
+        for row, (ids, dists) in enumerate(zip(order, np.take_along_axis(distances, order, axis=1))):
+            valid = ids[np.isfinite(dists)]
+            result[start + row, :len(valid)] = valid
+    return result
+
+
+def recall(found: list, truth: np.ndarray) -> float:
+    scores = []
+    for ids, expected in zip(found, truth):
+        expected = set(int(i) for i in expected if i >= 0)
+        if expected:
+            scores.append(len(expected & set(ids)) / len(expected))
+    return float(np.mean(scores)) if scores else 0.0
+
+
+def run_queries(collection: Collection, queries: np.ndarray, k: int, param: dict, exprs: list = None):
+    ids, latencies = [], []
+    for i, vector in enumerate(queries):
+        start = time.perf_counter()
+        hits = collection.search(
+            data=[vector.tolist()], anns_field="embedding", param=param, limit=k,
+            expr=exprs[i] if exprs else None
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids.append([hit.id for hit in hits[0]])
+    return ids, latencies
+
+
+def create_scratch(name: str, vectors: np.ndarray, papers: np.ndarray) -> Collection:
+    """临时集合（id、paper_id、embedding），写入 vectors 后 flush"""
+    collection = Collection(name, CollectionSchema([
+        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True),
+        FieldSchema(name="paper_id", dtype=DataType.VARCHAR, max_length=255),
+        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=vectors.shape[1]),
+    ]))
+    for start in range(0, len(vectors), 5000):
+        end = min(start + 5000, len(vectors))
+        collection.insert([list(range(start, end)), papers[start:end].tolist(), vectors[start:end].tolist()])
+    collection.flush()
+    return collection
+
+
+def rebuild_index(collection: Collection, index: dict) -> float:
+    """替换临时集合的向量索引并加载，返回构建 + 加载耗时（秒）"""
+    collection.release()
+    for existing in collection.indexes:
+        collection.drop_index(index_name=existing.index_name)
+    start = time.perf_counter()
+    collection.create_index(field_name="embedding", index_params=index)
+    collection.load()
+    return time.perf_counter() - start
+
+
+def candidate_indexes(index_types: list, rows: int, dim: int) -> list:
+    indexes = []
+    for index_type in index_types:
+        if index_type.startswith("IVF"):
+            overrides = {"nlist": nlist_for(rows)}
+            if index_type == "IVF_PQ":
+                overrides.update(m=pq_m(dim), nbits=8)
+        elif index_type == "HNSW":
+            overrides = {"M": 16, "efConstruction": 200}
+        else:
+            overrides = {}
+        indexes.append(build_index_params(index_type, dim, overrides))
+    return indexes
+
+
+def search_sweep(index: dict, k: int) -> list:
+    if index["index_type"] == "HNSW":
+        return [{"ef": ef} for ef in EFS if ef >= k]
+    if index["index_type"].startswith("IVF"):
+        return [{"nprobe": nprobe} for nprobe in NPROBES if nprobe <= index["params"]["nlist"]]
+    return [{}]
+
+
+def scale_to(result: dict, rows: int, sample_rows: int) -> dict:
+    """把样本上选出的参数换算到 rows 行的集合"""
+    index = json.loads(json.dumps(result["index"]))
+    search = dict(result["search"])
+    if index["index_type"].startswith("IVF"):
+        nlist = nlist_for(rows)
+        ratio = nlist / index["params"]["nlist"]
+        index["params"]["nlist"] = nlist
+        search["nprobe"] = max(min(int(round(search["nprobe"] * ratio)), nlist), 1)
+    p99 = result["p99"] * rows / sample_rows if index["index_type"] == "FLAT" else result["p99"]
+    return {"index": index, "search": search, "p99": p99}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量索引调参（recall@k / 延迟）")
+    parser.add_argument("--sample", type=int, default=20000, help="抽样的向量数（含查询）")
+    parser.add_argument("--scan", type=int, default=200000, help="抽样扫描的行数上限（0 表示全部）")
+    parser.add_argument("--queries", type=int, default=200, help="留出作为查询的向量数")
+    parser.add_argument("--k", type=int, default=10, help="recall@k")
+    parser.add_argument("--target-recall", type=float, default=0.95, help="推荐参数需要达到的 recall@k")
+    parser.add_argument("--index-types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    args = parser.parse_args()
+
+    milvus_service = get_milvus_service()
+    if milvus_service.collection is None:
+        raise SystemExit("Milvus is not available")
+    milvus_service.ensure_loaded()
+    total_rows = milvus_service.collection.num_entities
+    dim = milvus_service.dim
+
+    print(f"Sampling up to {args.sample} vectors from '{milvus_service.physical_name}' ({total_rows} rows)...")
+    papers, vectors, scanned = sample_vectors(milvus_service.collection, args.sample, args.scan)
+    if len(vectors) <= args.queries:
+        raise SystemExit(f"Not enough vectors to tune ({len(vectors)} sampled)")
+
+    rng = np.random.default_rng(0)
+    order = rng.permutation(len(vectors))
+    query_rows, base_rows = order[:args.queries], order[args.queries:]
+    queries, base = vectors[query_rows], vectors[base_rows]
+    base_papers = np.asarray([papers[i] for i in base_rows])
+    query_papers = [papers[i] for i in query_rows]
+
+    start = time.perf_counter()
+    truth = exact_neighbors(queries, base, args.k)
+    # 单篇论文过滤：只统计在样本中还有其他 chunk 的论文
+    paper_mask = np.stack([base_papers == paper for paper in query_papers])
+    filtered = np.flatnonzero(paper_mask.any(axis=1))
+    filtered_truth = exact_neighbors(queries[filtered], base, args.k, paper_mask[filtered])
+    filtered_exprs = [f"paper_id == {json.dumps(query_papers[i])}" for i in filtered]
+    print(f"Exact neighbors for {len(queries)} queries over {len(base)} vectors in {time.perf_counter() - start:.1f}s")
+
+    scratch = f"{milvus_service.collection_name}_tune_{os.getpid()}"
+    results = []
+    try:
+        collection = create_scratch(scratch, base, base_papers)
+
+        print("=" * 112)
+        print(
+            f"{'index':>10} | {'build params':>26} | {'search params':>15} | {'build s':>7} | "
+            f"{f'recall@{args.k}':>9} | {'p50 ms':>7} | {'p99 ms':>7} | {'paper recall':>12} | {'B/vector':>8}"
+        )
+        print("-" * 112)
+        for index in candidate_indexes(args.index_types, len(base), dim):
+            try:
+                build_s = rebuild_index(collection, index)
+            except Exception as e:
+                print(f"{index['index_type']:>10} | skipped: {str(e)[:80]}")
+                continue
+            sweep = search_sweep(index, args.k)
+            # 过滤检索使用服务中 selective 检索的默认参数
+            selective = build_search_params(index, args.k, selective=True, overrides={})
+            if filtered_exprs:
+                filtered_ids, _ = run_queries(collection, queries[filtered], args.k, selective, filtered_exprs)
+                paper_recall = recall(filtered_ids, filtered_truth)
+            else:
+                paper_recall = float("nan")
+            for search in sweep:
+                param = {"metric_type": index["metric_type"], "params": search}
+                run_queries(collection, queries[:10], args.k, param)  # 预热
+                ids, latencies = run_queries(collection, queries, args.k, param)
+                result = {
+                    "index": index,
+                    "search": search,
+                    "build_s": build_s,
+                    "recall": recall(ids, truth),
+                    "p50": percentile(latencies, 50),
+                    "p99": percentile(latencies, 99),
+                }
+                results.append(result)
+                print(
+                    f"{index['index_type']:>10} | {json.dumps(index['params']):>26} | {json.dumps(search):>15} | "
+                    f"{build_s:>7.1f} | {result['recall']:>9.4f} | {result['p50']:>7.2f} | {result['p99']:>7.2f} | "
+                    f"{paper_recall:>12.4f} | {bytes_per_vector(index, dim):>8.0f}"
+                )
+    finally:
+        if utility.has_collection(scratch):
+            utility.drop_collection(scratch)
+
+    print("=" * 112)
+    print(
+        f"sample: {len(base)} vectors + {len(queries)} queries (scanned {scanned} rows), "
+        f"collection: {total_rows} rows, dim={dim}"
+    )
+    candidates = [result for result in results if result["recall"] >= args.target_recall]
+    if not candidates:
+        print(f"No configuration reached recall@{args.k} >= {args.target_recall}")
+        return
+    scaled = [scale_to(result, max(total_rows, len(base)), len(base)) for result in candidates]
+    best = min(scaled, key=lambda item: item["p99"])
+    print(
+        f"Recommended for {total_rows} rows (recall@{args.k} >= {args.target_recall}, "
+        f"estimated p99 {best['p99']:.2f}ms, ~{bytes_per_vector(best['index'], dim) * total_rows / 2 ** 20:.0f}MB vectors):"
+    )
+    print(f"MILVUS_INDEX_TYPE={best['index']['index_type']}")
+    print(f"MILVUS_INDEX_PARAMS={json.dumps(best['index']['params'])}")
+    print(f"MILVUS_SEARCH_PARAMS={json.dumps(best['search'])}")
+    if best["index"]["index_type"] != (milvus_service.index or {}).get("index_type") or \
+            best["index"]["params"] != (milvus_service.index or {}).get("params"):
+        print("The current index differs: run migrate_collection.py with these settings to rebuild it online")
+
+
+if __name__ == "__main__":
+    main()